@@ -1,12 +1,40 @@
-from fastapi import FastAPI
-import pandas as pd
+from contextlib import asynccontextmanager
+from typing import Annotated
+from fastapi import FastAPI, Header, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import numpy as np
 from pydantic import BaseModel
-import ast
 import json
-from compute_content_score import content_score, only_relevant_categories
-from distance_utils import distance_matrix_etas, commute_etas, eta_decay
-
-app = FastAPI()
+import secrets
+import threading
+from batch_scoring import explain_rows, profile_matcher, rank_top_k, score_candidates, sharded_best_k
+from catalog_snapshot import CatalogManager
+from spatial_index import haversine_km
+from compute_content_score import tokenize_categories
+from interaction_log import InteractionLog
+from profile_store import ProfileStore
+from result_cache import PageStore, ResultCache, coarse, normalize_keywords
+from distance_utils import (
+    commute_etas_async,
+    distance_matrix_etas_async,
+    eta_decay,
+    estimate_eta_minutes,
+)
+import distance_utils
+import metrics
+import profiling
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # close pooled upstream connections
+    await distance_utils.aclose()
+    # drain the interaction log and checkpoint the profile store
+    interaction_log.close()
+    catalogs.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Robust path resolution for team members with different folder structures
 import os
@@ -21,7 +49,18 @@ if not os.path.exists(csv_path):
     csv_path = os.path.join(base_dir, "data/ca_business_enriched.csv")
     PROFILE_FILE = os.path.join(base_dir, "data/test_user_profile.json")
 
-df = pd.read_csv(csv_path)
+# The live catalog: the memory-mapped snapshot built by catalog_snapshot.py
+# (or the CSV if none was built). Handlers read catalogs.current once per
+# request, so a reload never changes the catalog under a running request.
+CATALOG_DIR = os.environ.get("CATALOG_DIR", os.path.join(os.path.dirname(csv_path), "catalog"))
+CATALOG_WATCH_S = float(os.environ.get("CATALOG_WATCH_S", "0"))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+catalogs = CatalogManager(CATALOG_DIR, csv_path)
+
+# Opt-in profiling of single requests (X-Profile: 1 with the admin token) and of
+# sampled slow ones
+profiler = profiling.Profiler(admin_token=ADMIN_TOKEN)
+app.add_middleware(profiling.ProfilingMiddleware, profiler=profiler)
 
 def safe_float(val):
     if val is None:
@@ -35,27 +74,36 @@ def safe_float(val):
     except (ValueError, TypeError):
         return None
 
-max_reviews = df["review_count"].max()
 
 # --- User Profile & Memory Setup ---
 def load_profile():
     if os.path.exists(PROFILE_FILE):
         try:
             with open(PROFILE_FILE, "r") as f:
-                return json.load(f)
+                profile = json.load(f)
+            # Migrate old profiles missing locations key
+            if "locations" not in profile:
+                profile["locations"] = default_profile()["locations"]
+                save_profile(profile)
+            return profile
         except Exception:
             pass
+    return default_profile()
+
+DEFAULT_USER_ID = "test_user_001"
+
+def default_profile(user_id=DEFAULT_USER_ID):
     # Initialize default profile structure
     return {
-        "user_id": "test_user_001",
+        "user_id": user_id,
         "long_term": {
             "cuisine": {},      # e.g., "ramen": 5.0
             "price_level": {}   # e.g., "1": 3.0
         },
         "short_term": [],       # List of recent interaction dicts
         "locations": {                  # NEW
-            "home": {"lat": None, "lon": None},
-            "work": {"lat": None, "lon": None}
+            "home": {"lat": None, "lon": None, "name": ""},
+            "work": {"lat": None, "lon": None, "name": ""}
         }
 
     }
@@ -64,7 +112,11 @@ def save_profile(profile):
     with open(PROFILE_FILE, "w") as f:
         json.dump(profile, f, indent=2)
 
-user_profile = load_profile()
+def initial_profile(user_id):
+    # the original single user starts from the legacy profile file
+    if user_id == DEFAULT_USER_ID:
+        return load_profile()
+    return default_profile(user_id)
 
 EVENT_WEIGHTS = {
     "click": 1.0,
@@ -76,62 +128,368 @@ EVENT_WEIGHTS = {
 MAX_SHORT_TERM_EVENTS = 20
 
 class InteractionEvent(BaseModel):
+    user_id: str = DEFAULT_USER_ID
     business_id: str
     event_type: str
     categories: str | None = None
     price_level: int | None = None
 
-@app.post("/interact")
-def log_interaction(event: InteractionEvent):
-    global user_profile
-    weight = EVENT_WEIGHTS.get(event.event_type, 0.0)
-    
-    if weight == 0:
-        return {"status": "ignored", "reason": "unknown event type"}
+def apply_interaction(profile, record):
+    weight = record["weight"]
 
     # Update Long-term memory
     # 1. Cuisine preferences
-    if event.categories:
-        from compute_content_score import tokenize_categories
-        cats = tokenize_categories(event.categories)
+    if record.get("categories"):
+        cats = tokenize_categories(record["categories"])
         for c in cats:
             c = c.lower()
-            user_profile["long_term"]["cuisine"][c] = user_profile["long_term"]["cuisine"].get(c, 0.0) + weight
+            profile["long_term"]["cuisine"][c] = profile["long_term"]["cuisine"].get(c, 0.0) + weight
             
     # 2. Price preferences
-    if event.price_level is not None:
-        p_str = str(event.price_level)
-        user_profile["long_term"]["price_level"][p_str] = user_profile["long_term"]["price_level"].get(p_str, 0.0) + weight
+    if record.get("price_level") is not None:
+        p_str = str(record["price_level"])
+        profile["long_term"]["price_level"][p_str] = profile["long_term"]["price_level"].get(p_str, 0.0) + weight
 
     # Update Short-term memory
     # Add to the front of the list, keep only latest MAX_SHORT_TERM_EVENTS
     interaction_record = {
+        "business_id": record["business_id"],
+        "event_type": record["event_type"],
+        "weight": weight,
+        "categories": record.get("categories"),
+        "price_level": record.get("price_level")
+    }
+    profile["short_term"].insert(0, interaction_record)
+    profile["short_term"] = profile["short_term"][:MAX_SHORT_TERM_EVENTS]
+
+
+def set_location(profile, label, lat, lon, name=""):
+    if "locations" not in profile:
+        profile["locations"] = {
+            "home": {"lat": None, "lon": None, "name": ""},
+            "work": {"lat": None, "lon": None, "name": ""}
+        }
+    profile["locations"][label]["lat"] = lat
+    profile["locations"][label]["lon"] = lon
+    profile["locations"][label]["name"] = name
+
+
+def apply_log_record(profile, record):
+    """Replays one interaction-log record; returns the (possibly new) profile."""
+    kind = record.get("type")
+    if kind == "interaction":
+        apply_interaction(profile, record)
+    elif kind == "location":
+        set_location(profile, record["label"], record["lat"], record["lon"], record.get("name", ""))
+    elif kind == "reset":
+        return default_profile(profile.get("user_id", DEFAULT_USER_ID))
+    return profile
+
+
+# Profiles are per user: an in-memory LRU over SQLite. Changes go to an
+# append-only log; the store is checkpointed from the log's writer thread
+# and the log tail is replayed into it on startup.
+INTERACTION_LOG_DIR = os.environ.get("INTERACTION_LOG_DIR", os.path.join(os.path.dirname(PROFILE_FILE), "interactions"))
+PROFILE_DB = os.environ.get("PROFILE_DB", os.path.join(os.path.dirname(PROFILE_FILE), "profiles.db"))
+
+interaction_log = InteractionLog(INTERACTION_LOG_DIR)
+profiles = ProfileStore(PROFILE_DB, apply_log_record, initial_profile, log=interaction_log)
+interaction_log.checkpoint_fn = profiles.checkpoint
+profiles.replay(
+    dict(r, user_id=r.get("user_id", DEFAULT_USER_ID))
+    for r in interaction_log.replay(interaction_log.checkpoint_seq())
+)
+interaction_log.start()
+
+result_cache = ResultCache()
+
+# Request, per-stage and row metrics (GET /metrics); cache and log counters
+# are read from their own stats at scrape time, see service_metrics()
+REQUEST_SECONDS = metrics.histogram("quickbites_request_seconds", "Handler latency.", ["endpoint"])
+STAGE_SECONDS = metrics.histogram(
+    "quickbites_stage_seconds", "Latency of the stages inside a handler.", ["endpoint", "stage"])
+ROWS_SCANNED = metrics.counter("quickbites_rows_scanned_total", "Catalog rows scored.", ["endpoint"])
+ROWS_FILTERED = metrics.counter(
+    "quickbites_rows_filtered_total", "Catalog rows removed by a hard filter.", ["endpoint", "filter"])
+
+def count_rows(endpoint, counts, filter_names):
+    ROWS_SCANNED.labels(endpoint).inc(counts["scanned"])
+    for name, n in zip(filter_names, counts["filtered"]):
+        if n:
+            ROWS_FILTERED.labels(endpoint, name).inc(n)
+
+
+
+def update_profile(user_id, records):
+    """Apply + log profile changes, and drop the user's cached results."""
+    profile = profiles.update(user_id, records)
+    result_cache.invalidate_user(user_id)
+    return profile
+
+
+def _interaction_record(event):
+    weight = EVENT_WEIGHTS.get(event.event_type, 0.0)
+    if weight == 0:
+        return None
+    return {
+        "type": "interaction",
         "business_id": event.business_id,
         "event_type": event.event_type,
         "weight": weight,
         "categories": event.categories,
         "price_level": event.price_level
     }
-    user_profile["short_term"].insert(0, interaction_record)
-    user_profile["short_term"] = user_profile["short_term"][:MAX_SHORT_TERM_EVENTS]
 
-    save_profile(user_profile)
-    return {"status": "success", "profile": user_profile}
 
+@app.post("/interact")
+@metrics.timed(REQUEST_SECONDS.labels("interact"))
+def log_interaction(event: InteractionEvent):
+    record = _interaction_record(event)
+    if record is None:
+        return {"status": "ignored", "reason": "unknown event type"}
+
+    profile = update_profile(event.user_id, [record])
+    return {"status": "success", "profile": profile}
+
+
+@app.post("/interact/batch")
+@metrics.timed(REQUEST_SECONDS.labels("interact_batch"))
+def log_interactions(events: list[InteractionEvent]):
+    """Several events in one request (the iOS client flushes its queue here)."""
+    by_user = {}
+    ignored = 0
+    for event in events:
+        record = _interaction_record(event)
+        if record is None:
+            ignored += 1
+        else:
+            by_user.setdefault(event.user_id, []).append(record)
+
+    updated = {user_id: update_profile(user_id, records) for user_id, records in by_user.items()}
+    result = {"status": "success", "accepted": len(events) - ignored, "ignored": ignored}
+    if len(updated) == 1:
+        result["profile"] = next(iter(updated.values()))
+    return result
+
+
+# Cursor pagination: the first page ranks once and keeps the ranking in
+# page_store under an opaque token, later pages are cut from it.
+RECOMMEND_DEPTH = 100  # content-ranked candidates kept per /recommend query
+ETA_WINDOW = 25        # candidates ETA-blended for the first page
+SEARCH_DEPTH = 100     # ranked rows kept per /search query
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+STREAM_CHUNK = 10      # results built per NDJSON chunk
+page_store = PageStore()
+
+def page_response(response, items, next_token, stream):
+    """A page as a JSON list, or as NDJSON lines; the next token goes in a header."""
+    headers = {"X-Next-Page-Token": next_token} if next_token else {}
+    if stream:
+        return StreamingResponse(
+            (json.dumps(item) + "\n" for item in items), media_type="application/x-ndjson", headers=headers
+        )
+    response.headers.update(headers)
+    return list(items)
+
+def page_size_of(page_size):
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+@profiling.profiled
+def recommend_candidates(catalog, user_keywords, max_price, meal, profile_to_use, lat, lon, vegan, origin,
+                         distance_weight, radius_km, bbox, commute, depth=RECOMMEND_DEPTH):
+    """
+    CPU part of /recommend: filter, score and rank the `depth` candidates
+    worth an ETA lookup, best first. `commute` is (home_lat, home_lon,
+    work_lat, work_lon) or None.
+    """
+    min_lat, min_lon, max_lat, max_lon = bbox
+    top_candidates = []
+
+    # 2. HARD FILTER: vegan, 3. HARD FILTER: meal
+    masks = [catalog.meal_mask(meal)]
+    mask_names = ["meal"]
+    if vegan:
+        masks.append(catalog.is_vegan)
+        mask_names.append("vegan")
+    counts = {"scanned": 0, "filtered": [0] * len(masks)}
+
+    # 4. SPATIAL PREFILTER: viewport box and/or radius around the user
+    candidates = None
+    with STAGE_SECONDS.labels("recommend", "prefilter").time():
+        if None not in (min_lat, min_lon, max_lat, max_lon):
+            candidates = catalog.spatial_index.within_bbox(min_lat, min_lon, max_lat, max_lon)
+        if radius_km and lat is not None and lon is not None:
+            in_radius, _ = catalog.spatial_index.within_radius(lat, lon, radius_km)
+            candidates = in_radius if candidates is None else np.intersect1d(candidates, in_radius)
+    if candidates is not None:
+        ROWS_FILTERED.labels("recommend", "spatial").inc(catalog.size - len(candidates))
+
+    # Great-circle distance is a free stand-in for the ETA, so use it to pick
+    # which candidates are worth a Distance Matrix lookup
+    distance_km = None
+    if commute is not None:
+        home_lat, home_lon, work_lat, work_lon = commute
+
+        def distance_km(rows):
+            r_lat, r_lon = catalog.latitude[rows], catalog.longitude[rows]
+            return haversine_km(home_lat, home_lon, r_lat, r_lon) + haversine_km(r_lat, r_lon, work_lat, work_lon)
+    elif origin != "commute" and lat is not None and lon is not None:
+        def distance_km(rows):
+            return haversine_km(lat, lon, catalog.latitude[rows], catalog.longitude[rows])
+
+    with STAGE_SECONDS.labels("recommend", "scan").time():
+        if candidates is None and distance_km is None:
+            top_rows, top_scores = rank_top_k(
+                catalog, depth, user_keywords, max_price, meal, catalog.max_reviews, profile_to_use, masks=masks,
+                counts=counts
+            )
+        else:
+            counts_lock = threading.Lock()
+
+            @profiling.profiled
+            def rank_rows(rows):
+                filtered = []
+                for mask in masks:
+                    kept = rows[mask[rows]]
+                    filtered.append(len(rows) - len(kept))
+                    rows = kept
+                with counts_lock:
+                    counts["filtered"] = [a + b for a, b in zip(counts["filtered"], filtered)]
+                    counts["scanned"] += len(rows)
+                scores = score_candidates(catalog, rows, user_keywords, max_price, meal, catalog.max_reviews, profile_to_use)
+                ranking = scores
+                if distance_km is not None:
+                    tau = 30.0 if origin == "commute" else 10.0
+                    decay = np.exp(-estimate_eta_minutes(distance_km(rows)) / tau)
+                    ranking = scores * (1 - distance_weight) + scores * decay * distance_weight
+                return rows, ranking, scores
+
+            # build the shared per-query state once, not once per shard
+            catalog.static_scores(meal, catalog.max_reviews)
+            if profile_to_use:
+                profile_matcher(catalog, profile_to_use)
+            rows = np.arange(catalog.size) if candidates is None else candidates
+            top_rows, top_scores = sharded_best_k(rows, depth, rank_rows)
+    count_rows("recommend", counts, mask_names)
+
+    with STAGE_SECONDS.labels("recommend", "explain").time():
+        explanations = explain_rows(catalog, top_rows, user_keywords, max_price, meal, catalog.max_reviews, profile_to_use)
+        for i, score, explanation in zip(top_rows, top_scores, explanations):
+            good_for_meal = catalog.good_for_meal_raw[i]
+
+            fields = catalog.display_fields(i)
+            top_candidates.append({
+                "business_id": fields["business_id"],
+                "name": fields["name"],
+                "stars": fields["stars"],
+                "review_count": fields["review_count"],
+                "score": safe_float(score),
+                "explanation": explanation,
+                "matched_categories": catalog.category_index.relevant_categories(i, user_keywords),
+                "latitude": fields["latitude"],
+                "longitude": fields["longitude"],
+                "address": fields["address"],
+                "city": fields["city"],
+                "state": fields["state"],
+                "hours": fields["hours"],
+                "price_level": catalog.price_level_at(i),
+                "is_vegan": bool(catalog.is_vegan[i]),
+                "good_for_meal": str(good_for_meal) if good_for_meal else None
+            })
+
+    return top_candidates
+
+
+async def blend_etas(candidates, origin, lat, lon, commute, distance_weight):
+    """Copies of the candidates with their ETAs looked up and blended into the score."""
+    candidates = [dict(r) for r in candidates]
+    if not candidates:
+        return candidates
+    destinations = [
+        {"business_id": r["business_id"], "latitude": r["latitude"], "longitude": r["longitude"]}
+        for r in candidates
+    ]
+    # Both commute legs are awaited concurrently, each with its own timeout
+    with STAGE_SECONDS.labels("recommend", "eta").time():
+        if commute is not None:
+            etas = await commute_etas_async(*commute, destinations)
+        else:
+            etas = await distance_matrix_etas_async(lat, lon, destinations)
+
+    for r, eta in zip(candidates, etas):
+        if eta is None:
+            r["eta_min"] = None
+            continue
+        r["eta_min"] = eta
+        decay = eta_decay(eta, tau=30.0 if origin == "commute" else 10.0)
+
+        # Blend: 0.0 = pure content score, 1.0 = fully distance weighted
+        r["score"] = r["score"] * (1 - distance_weight) + r["score"] * decay * distance_weight
+    return candidates
+
+async def recommend_page(state, page_size, window):
+    """
+    Blend the next `window` ranked candidates into the pool of blended ones
+    left over from earlier pages, and take the best `page_size`. Returns
+    (page, next_state); next_state is None once everything has been served.
+    """
+    start = state["next"]
+    blended = await blend_etas(
+        state["ranked"][start:start + window], state["origin"], state["lat"], state["lon"], state["commute"],
+        state["distance_weight"],
+    )
+    with STAGE_SECONDS.labels("recommend", "sort").time():
+        pool = state["pool"] + blended
+        pool.sort(key=lambda x: x["score"], reverse=True)
+    next_state = dict(state, pool=pool[page_size:], next=start + window)
+    if not next_state["pool"] and next_state["next"] >= len(state["ranked"]):
+        next_state = None
+    return pool[:page_size], next_state
+
+# Out-of-range coordinates get a 422 instead of a scan of the whole grid
+Latitude = Annotated[float | None, Query(ge=-90, le=90)]
+Longitude = Annotated[float | None, Query(ge=-180, le=180)]
 
 @app.get("/recommend")
-def recommend(
+@metrics.timed(REQUEST_SECONDS.labels("recommend"))
+async def recommend(
+    response: Response,
     keywords: str = "",
     max_price: int | None = None,
     meal: str | None = None,
     personalize: bool = False,
-    lat: float | None = None,
-    lon: float | None = None,
+    lat: Latitude = None,
+    lon: Longitude = None,
     vegan: bool = False,
     origin: str = "current",
-    distance_weight: float = 0.5
+    distance_weight: float = 0.5,
+    radius_km: Annotated[float | None, Query(ge=0)] = None,
+    min_lat: Latitude = None,
+    min_lon: Longitude = None,
+    max_lat: Latitude = None,
+    max_lon: Longitude = None,
+    user_id: str = DEFAULT_USER_ID,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    page_token: str | None = None,
+    stream: bool = False
 ):
-    
+    """
+    Later pages: pass the X-Next-Page-Token of the previous page as
+    page_token; the query parameters are then taken from the token. With
+    stream=true the page is sent as NDJSON, one result per line.
+    """
+    page_size = page_size_of(page_size)
+    if page_token is not None:
+        state = page_store.get(page_token)
+        if state is None or state["kind"] != "recommend":
+            return {"status": "error", "reason": "page token expired or unknown"}
+        page, state = await recommend_page(state, page_size, page_size)
+        return page_response(response, page, page_store.put(state) if state else None, stream)
+
+    catalog = catalogs.current
+    user_profile, profile_version = profiles.get_versioned(user_id)
     if origin == "commute":
         home = user_profile.get("locations", {}).get("home", {})
         work = user_profile.get("locations", {}).get("work", {})
@@ -142,94 +500,43 @@ def recommend(
         use_commute = False
 
     user_keywords = [k.strip() for k in keywords.split(",") if k.strip()]
-    results = []
     profile_to_use = user_profile if personalize else None
+    commute = (home_lat, home_lon, work_lat, work_lon) if use_commute else None
+
+    # The content ranking is cached per (coarse) location; ETAs are not
+    bbox = tuple(coarse(v) for v in (min_lat, min_lon, max_lat, max_lon))
+    cell_lat, cell_lon = coarse(lat), coarse(lon)
+    uses_profile = personalize or origin == "commute"
+    cache_key = (
+        "recommend", catalog.version, normalize_keywords(user_keywords), max_price, meal, vegan, origin,
+        distance_weight, radius_km, bbox, cell_lat, cell_lon,
+        (user_id, profile_version) if uses_profile else None,
+    )
+    ranked = result_cache.get(cache_key)
+    if ranked is None:
+        # Scoring is CPU work, keep it off the event loop
+        ranked = await run_in_threadpool(
+            recommend_candidates, catalog, user_keywords, max_price, meal, profile_to_use, cell_lat, cell_lon, vegan,
+            origin, distance_weight, radius_km, bbox, commute
+        )
+        result_cache.put(cache_key, ranked, user_id if uses_profile else None)
 
-    for _, row in df.iterrows():
-        row_dict = row.to_dict()
-
-        # 2. HARD FILTER: vegan
-        if vegan and "Vegan" not in str(row_dict.get("categories", "")):
-            continue
-
-        # parse attributes early so we can hard filter meal
-        attributes_raw = row_dict.get("attributes")
-        price_level_int = None
-        good_for_meal = None
-        if isinstance(attributes_raw, str):
-            try:
-                attributes = ast.literal_eval(attributes_raw)
-                price_raw = attributes.get("RestaurantsPriceRange2")
-                good_for_meal = attributes.get("GoodForMeal")
-                try:
-                    price_level_int = int(price_raw)
-                except (TypeError, ValueError):
-                    price_level_int = None
-            except Exception:
-                pass
-
-        # 3. HARD FILTER: meal
-        if meal and good_for_meal:
-            try:
-                meal_dict = ast.literal_eval(good_for_meal) if isinstance(good_for_meal, str) else good_for_meal
-                if not meal_dict.get(meal, False):
-                    continue
-            except Exception:
-                pass  # if parsing fails, don't filter out
-
-        score, explanation = content_score(row_dict, user_keywords, max_price, meal, max_reviews, profile_to_use)
-
-        results.append({
-            "business_id": row_dict.get("business_id"),
-            "name": row_dict.get("name"),
-            "stars": safe_float(row_dict.get("stars")),
-            "review_count": row_dict.get("review_count") if not pd.isna(row_dict.get("review_count")) else None,
-            "score": safe_float(score),
-            "explanation": explanation,
-            "matched_categories": only_relevant_categories(row_dict.get("categories", ""), user_keywords),
-            "latitude": safe_float(row_dict.get("latitude")),
-            "longitude": safe_float(row_dict.get("longitude")),
-            "address": row_dict.get("address") if not pd.isna(row_dict.get("address")) else None,
-            "city": row_dict.get("city") if not pd.isna(row_dict.get("city")) else None,
-            "state": row_dict.get("state") if not pd.isna(row_dict.get("state")) else None,
-            "hours": row_dict.get("hours") if not pd.isna(row_dict.get("hours")) else None,
-            "price_level": price_level_int,
-            "is_vegan": "Vegan" in (str(row_dict.get("categories")) or ""),
-            "good_for_meal": str(good_for_meal) if good_for_meal else None
-        })
-
-    results.sort(key=lambda x: x["score"], reverse=True)
-    top_candidates = results[:25]
-
-    destinations = [{"latitude": r["latitude"], "longitude": r["longitude"]} for r in top_candidates]
-    if origin == "commute" and use_commute:
-        etas = commute_etas(home_lat, home_lon, work_lat, work_lon, destinations)
-    else:
-        etas = distance_matrix_etas(lat, lon, destinations)
-
-    for r, eta in zip(top_candidates, etas):
-        if eta is None:
-            r["eta_min"] = None
-            continue
-        r["eta_min"] = eta
-        decay = eta_decay(eta, tau=30.0 if origin == "commute" else 10.0)
-
-        # Blend: 0.0 = pure content score, 1.0 = fully distance weighted
-        r["score"] = r["score"] * (1 - distance_weight) + r["score"] * decay * distance_weight
-
-    top_candidates.sort(key=lambda x: x["score"], reverse=True)
-    return top_candidates[:10]
+    state = {
+        "kind": "recommend", "ranked": ranked, "pool": [], "next": 0,
+        "origin": origin, "lat": lat, "lon": lon, "commute": commute, "distance_weight": distance_weight,
+    }
+    page, state = await recommend_page(state, page_size, max(ETA_WINDOW, page_size))
+    return page_response(response, page, page_store.put(state) if state else None, stream)
 
 @app.get("/profile")
-def get_profile():
-    return user_profile
+def get_profile(user_id: str = DEFAULT_USER_ID):
+    return profiles.get(user_id)
 
 @app.delete("/profile")
-def reset_profile():
-    global user_profile
-    if os.path.exists(PROFILE_FILE):
+def reset_profile(user_id: str = DEFAULT_USER_ID):
+    if user_id == DEFAULT_USER_ID and os.path.exists(PROFILE_FILE):
         os.remove(PROFILE_FILE)
-    user_profile = load_profile()
+    update_profile(user_id, [{"type": "reset"}])
     return {"status": "success", "message": "Profile reset to default"}
 
 
@@ -242,98 +549,159 @@ class Preferences(BaseModel):
 class SearchRequest(BaseModel):
     query: str
     preferences: Preferences
-
-@app.post("/search")
-def search(req: SearchRequest):
-    keywords = [k.strip() for k in req.query.split(",") if k.strip()]
-    
-    profile_to_use = user_profile if req.preferences.personalize else None
-
-    results = []
-    for _, row in df.iterrows():
-        row_dict = row.to_dict()
-        score, explanation = content_score(
-            row_dict,
+    user_id: str = DEFAULT_USER_ID
+    page_size: int = DEFAULT_PAGE_SIZE
+    page_token: str | None = None
+    stream: bool = False
+
+def search_ranking(catalog, keywords, max_price, meal, profile_to_use, depth=SEARCH_DEPTH):
+    """(rows, scores) of the best `depth` matches, best first."""
+    counts = {"scanned": 0, "filtered": []}
+    with STAGE_SECONDS.labels("search", "scan").time():
+        ranking = rank_top_k(
+            catalog,
+            depth,
             keywords,
-            req.preferences.max_price,
-            req.preferences.meal,
-            max_reviews,
-            profile_to_use
+            max_price,
+            meal,
+            catalog.max_reviews,
+            profile_to_use,
+            min_score=0.0,
+            counts=counts
         )
+    count_rows("search", counts, [])
+    return ranking
+
+def search_results(catalog, top_rows, top_scores, keywords, max_price, meal, profile_to_use):
+    with STAGE_SECONDS.labels("search", "explain").time():
+        return _search_results(catalog, top_rows, top_scores, keywords, max_price, meal, profile_to_use)
+
+def _search_results(catalog, top_rows, top_scores, keywords, max_price, meal, profile_to_use):
+    explanations = explain_rows(
+        catalog,
+        top_rows,
+        keywords,
+        max_price,
+        meal,
+        catalog.max_reviews,
+        profile_to_use
+    )
 
-        if score > 0:
-            categories = row_dict.get("categories") or ""
-            raw_attributes = row_dict.get("attributes")
-            attributes = {}
+    results = []
+    for i, score, explanation in zip(top_rows, top_scores, explanations):
 
-            if raw_attributes:
-                try:
-                    attributes = ast.literal_eval(raw_attributes)
-                except:
-                    attributes = {}
+        fields = catalog.display_fields(i)
+        results.append({
+            "business_id": fields["business_id"],
+            "name": fields["name"],
+            "stars": fields["stars"],
+            "review_count": fields["review_count"],
+            "score": safe_float(score),
+            "explanation": explanation,
+            "matched_categories": catalog.category_index.relevant_categories(i, keywords),
+            "latitude": fields["latitude"],
+            "longitude": fields["longitude"],
+            "price_level": catalog.price_level_at(i),
+            "address": fields["address"],
+            "city": fields["city"],
+            "state": fields["state"],
+            "hours": fields["hours"],
+            "is_vegan": bool(catalog.is_vegan[i]),
+            "good_for_meal": catalog.good_for_meal_raw[i] or {}
+        })
 
-            price_level_int = None
-            good_for_meal = None
+    return results
+
+def search_ranked(catalog, keywords, max_price, meal, profile_to_use):
+    """The cached value of a /search query: (rows, scores, first page)."""
+    rows, scores = search_ranking(catalog, keywords, max_price, meal, profile_to_use)
+    head = search_results(
+        catalog, rows[:DEFAULT_PAGE_SIZE], scores[:DEFAULT_PAGE_SIZE], keywords, max_price, meal, profile_to_use
+    )
+    return rows, scores, head
+
+def search_page(state, page_size):
+    """Result dicts of the next page, built STREAM_CHUNK at a time."""
+    rows, scores, head = state["ranked"]
+    start, stop = state["offset"], min(state["offset"] + page_size, len(rows))
+    if start == 0 and stop <= len(head):
+        yield from (dict(r) for r in head[:stop])
+        return
+    for lo in range(start, stop, STREAM_CHUNK):
+        hi = min(lo + STREAM_CHUNK, stop)
+        yield from search_results(
+            state["catalog"], rows[lo:hi], scores[lo:hi], state["keywords"], state["max_price"], state["meal"],
+            state["profile"],
+        )
 
-            try:
-                price_level_int = int(attributes.get("RestaurantsPriceRange2"))
-            except (TypeError, ValueError):
-                price_level_int = None
+def search_next_token(state, page_size):
+    offset = state["offset"] + page_size
+    if offset >= len(state["ranked"][0]):
+        return None
+    return page_store.put(dict(state, offset=offset))
 
-            good_for_meal = attributes.get("GoodForMeal")
+@app.post("/search")
+@metrics.timed(REQUEST_SECONDS.labels("search"))
+@profiling.profiled
+def search(req: SearchRequest, response: Response):
+    """
+    Later pages: send the X-Next-Page-Token of the previous page as
+    page_token (the query is then taken from the token). With stream=true
+    the page is sent as NDJSON, one result per line.
+    """
+    page_size = page_size_of(req.page_size)
+    if req.page_token is not None:
+        state = page_store.get(req.page_token)
+        if state is None or state["kind"] != "search":
+            return {"status": "error", "reason": "page token expired or unknown"}
+        items = search_page(state, page_size)
+        return page_response(response, items, search_next_token(state, page_size), req.stream)
 
-            results.append({
-                "business_id": row_dict.get("business_id"),
-                "name": row_dict.get("name"),
-                "stars": safe_float(row_dict.get("stars")),
-                "review_count": row_dict.get("review_count") if not pd.isna(row_dict.get("review_count")) else None,
-                "score": safe_float(score),
-                "explanation": explanation,
-                "matched_categories": only_relevant_categories(categories, keywords),
-                "latitude": safe_float(row_dict.get("latitude")),
-                "longitude": safe_float(row_dict.get("longitude")),
-                "price_level": price_level_int,
-                "address": row_dict.get("address") if not pd.isna(row_dict.get("address")) else None,
-                "city": row_dict.get("city") if not pd.isna(row_dict.get("city")) else None,
-                "state": row_dict.get("state") if not pd.isna(row_dict.get("state")) else None,
-                "hours": row_dict.get("hours") if not pd.isna(row_dict.get("hours")) else None,
-                "is_vegan": "Vegan" in str(categories),
-                "good_for_meal": good_for_meal or {}
-            })
+    keywords = [k.strip() for k in req.query.split(",") if k.strip()]
+    catalog = catalogs.current
+    
+    prefs = req.preferences
+    profile_to_use = None
+    profile_key = None
+    if prefs.personalize:
+        profile_to_use, profile_version = profiles.get_versioned(req.user_id)
+        profile_key = (req.user_id, profile_version)
+
+    cache_key = ("search", catalog.version, normalize_keywords(keywords), prefs.max_price, prefs.meal, profile_key)
+    ranked = result_cache.get(cache_key)
+    if ranked is None:
+        ranked = search_ranked(catalog, keywords, prefs.max_price, prefs.meal, profile_to_use)
+        result_cache.put(cache_key, ranked, req.user_id if profile_key else None)
+
+    # the page state pins its catalog, so later pages still match this one
+    state = {
+        "kind": "search", "catalog": catalog, "ranked": ranked, "offset": 0, "keywords": keywords,
+        "max_price": prefs.max_price, "meal": prefs.meal, "profile": profile_to_use,
+    }
+    return page_response(response, search_page(state, page_size), search_next_token(state, page_size), req.stream)
 
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return results[:10]
-def load_profile():
-    if os.path.exists(PROFILE_FILE):
-        try:
-            with open(PROFILE_FILE, "r") as f:
-                profile = json.load(f)
-                # Migrate old profiles missing locations key
-                if "locations" not in profile:
-                    profile["locations"] = {
-                        "home": {"lat": None, "lon": None},
-                        "work": {"lat": None, "lon": None}
-                    }
-                    save_profile(profile)
-                return profile
-        except Exception:
-            pass
-    return {
-        "user_id": "test_user_001",
-        "long_term": {
-            "cuisine": {},
-            "price_level": {}
-        },
-        "short_term": [],
 
-        "locations": {
-            "home": {"lat": None, "lon": None, "name": ""},
-            "work": {"lat": None, "lon": None, "name": ""}
-        }
+WARM_QUERIES = 100
+
+def warm_catalog(catalog):
+    """
+    Before a new catalog goes live, re-run the most recently used shared
+    /search queries against it, so the swap does not start from a cold
+    result cache.
+    """
+    for key in result_cache.recent_keys(WARM_QUERIES):
+        if key[0] != "search":
+            continue
+        _, _, keywords, max_price, meal, _ = key
+        new_key = ("search", catalog.version, keywords, max_price, meal, None)
+        result_cache.put(new_key, search_ranked(catalog, list(keywords), max_price, meal, None))
+
+catalogs.warm_fn = warm_catalog
+catalogs.watch(CATALOG_WATCH_S)
 
-    }
 
 class SavedLocation(BaseModel):
+    user_id: str = DEFAULT_USER_ID
     label: str
     lat: float
     lon: float
@@ -341,20 +709,124 @@ class SavedLocation(BaseModel):
 
 @app.post("/profile/location")
 def save_location(loc: SavedLocation):
-    global user_profile
     if loc.label not in ("home", "work"):
         return {"status": "error", "reason": "label must be 'home' or 'work'"}
-    if "locations" not in user_profile:
-        user_profile["locations"] = {
-            "home": {"lat": None, "lon": None, "name": ""},
-            "work": {"lat": None, "lon": None, "name": ""}
-        }
-    user_profile["locations"][loc.label]["lat"] = loc.lat
-    user_profile["locations"][loc.label]["lon"] = loc.lon
-    user_profile["locations"][loc.label]["name"] = loc.name
-    save_profile(user_profile)
-    return {"status": "success", "locations": user_profile["locations"]}
+    record = {"type": "location", "label": loc.label, "lat": loc.lat, "lon": loc.lon, "name": loc.name}
+    profile = update_profile(loc.user_id, [record])
+    return {"status": "success", "locations": profile["locations"]}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "results": result_cache.stats(),
+        "eta": distance_utils.eta_cache.stats(),
+        "profiles": profiles.stats(),
+    }
+
+@metrics.collector
+def service_metrics():
+    """Counters the caches, profile store and interaction log keep themselves."""
+    caches = {
+        "results": result_cache.stats(),
+        "eta": distance_utils.eta_cache.stats(),
+        "profiles": profiles.stats(),
+        "pages": page_store.stats(),
+    }
+    log = interaction_log.stats()
+    catalog = catalogs.status()
+    return [
+        ("quickbites_cache_hits_total", "counter", "Cache hits.",
+         [({"cache": name}, c["hits"]) for name, c in caches.items()]),
+        ("quickbites_cache_misses_total", "counter", "Cache misses.",
+         [({"cache": name}, c["misses"]) for name, c in caches.items()]),
+        ("quickbites_cache_entries", "gauge", "Entries held.",
+         [({"cache": name}, c.get("size", c.get("cached", 0))) for name, c in caches.items()]),
+        ("quickbites_result_cache_invalidations_total", "counter", "Result cache entries dropped on profile changes.",
+         [({}, caches["results"]["invalidations"])]),
+        ("quickbites_interaction_log_records_total", "counter", "Interaction log records written.",
+         [({}, log["records_written"])]),
+        ("quickbites_interaction_log_batches_total", "counter", "Interaction log group commits.",
+         [({}, log["batches"])]),
+        ("quickbites_interaction_log_queued", "gauge", "Interaction log records waiting to be written.",
+         [({}, log["queued"])]),
+        ("quickbites_checkpoint_errors_total", "counter", "Failed profile store checkpoints.",
+         [({}, log["checkpoint_errors"])]),
+        ("quickbites_catalog_businesses", "gauge", "Businesses in the live catalog.",
+         [({}, catalog["businesses"])]),
+        ("quickbites_catalog_reloads_total", "counter", "Catalog hot reloads.",
+         [({}, catalog["reloads"])]),
+    ]
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text format."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/admin/catalog")
+def catalog_status():
+    return catalogs.status()
+
+def error_response(status_code, reason):
+    return JSONResponse({"status": "error", "reason": reason}, status_code=status_code)
+
+def admin_denied(x_admin_token):
+    """
+    A 403 response unless X-Admin-Token matches ADMIN_TOKEN, else None.
+    Without an ADMIN_TOKEN the admin endpoints are off.
+    """
+    if not ADMIN_TOKEN:
+        return error_response(403, "admin endpoints are disabled (no ADMIN_TOKEN set)")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        return error_response(403, "bad admin token")
+    return None
+
+@app.post("/admin/catalog/reload")
+def reload_catalog(version: str | None = None, x_admin_token: str | None = Header(default=None)):
+    """Load a catalog version (default: the snapshot's CURRENT), warm it and swap it in."""
+    denied = admin_denied(x_admin_token)
+    if denied is not None:
+        return denied
+    try:
+        catalogs.reload(version)
+    except (ValueError, FileNotFoundError) as e:
+        return error_response(400, str(e))
+    except Exception as e:
+        return error_response(500, repr(e))
+    return {"status": "success", **catalogs.status()}
+
+@app.get("/admin/profiling")
+def profiling_status(x_admin_token: str | None = Header(default=None)):
+    """Profiling settings and the saved profiles, newest first."""
+    denied = admin_denied(x_admin_token)
+    if denied is not None:
+        return denied
+    return {**profiler.status(), "profiles": profiler.ring.list()}
+
+@app.post("/admin/profiling")
+def set_profiling(sample_rate: float | None = None, slow_ms: float | None = None,
+                  x_admin_token: str | None = Header(default=None)):
+    """Change the sampled share of /recommend and /search calls, or the slow threshold."""
+    denied = admin_denied(x_admin_token)
+    if denied is not None:
+        return denied
+    if sample_rate is not None:
+        if not 0.0 <= sample_rate <= 1.0:
+            return {"status": "error", "reason": "sample_rate must be between 0 and 1"}
+        profiler.sample_rate = sample_rate
+    if slow_ms is not None:
+        profiler.slow_ms = slow_ms
+    return {"status": "success", **profiler.status()}
+
+@app.get("/admin/profiles/{profile_id}")
+def get_saved_profile(profile_id: str, x_admin_token: str | None = Header(default=None)):
+    denied = admin_denied(x_admin_token)
+    if denied is not None:
+        return denied
+    report = profiler.ring.load(profile_id)
+    if report is None:
+        return {"status": "error", "reason": "no such profile"}
+    return report
 
 @app.get("/profile/locations")
-def get_locations():
-    return user_profile.get("locations", {})
\ No newline at end of file
+def get_locations(user_id: str = DEFAULT_USER_ID):
+    return profiles.get(user_id).get("locations", {})
\ No newline at end of file
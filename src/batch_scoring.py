@@ -0,0 +1,430 @@
+"""
+QuickBites: vectorized ContentScore over a whole Catalog.
+
+batch_content_scores() returns the same numbers as calling
+compute_content_score.content_score once per row, but with NumPy array
+operations instead of a Python loop. Explanations are still produced by
+content_score, and only for the rows that are actually returned.
+
+Only the cuisine and price terms depend on the query. The rest of the
+baseline (quality, sentiment, mealtime fit, open bonus) is precomputed per
+business by Catalog.static_scores, together with the businesses sorted by
+it, and rank_top_k() walks that order and stops as soon as nothing further
+down can still make the top k.
+
+Scans that do have to score every candidate (a location-weighted
+/recommend) go through sharded_best_k(). On catalogs of at least
+PARALLEL_MIN_ROWS candidates it splits them into SCORE_SHARDS slices and
+ranks those on a thread pool (NumPy releases the GIL in the array work),
+then merges the partial top-k lists.
+"""
+
+import contextvars
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from compute_content_score import event_categories, personal_explanation
+
+
+def price_match_batch(price_level, user_max_price):
+    """Array version of price_match (price_level 0 means unknown -> neutral)."""
+    if user_max_price is None:
+        return np.full(len(price_level), 0.5)
+
+    p = price_level
+    return np.select(
+        [p == 0, p <= user_max_price, p == user_max_price + 1],
+        [0.5, 1.0, 0.5],
+        default=0.0,
+    )
+
+
+def quality_score_batch(catalog, max_review_count):
+    """Array version of quality_score."""
+    stars = np.nan_to_num(catalog.stars, nan=0.0)
+    review_count = np.trunc(np.nan_to_num(catalog.review_count, nan=0.0))
+
+    stars_norm = np.clip(stars / 5.0, 0.0, 1.0)
+
+    denom = math.log1p(max(1, int(max_review_count)))
+    review_norm = np.log1p(np.maximum(0.0, review_count)) / denom
+
+    return np.clip(0.6 * stars_norm + 0.4 * review_norm, 0.0, 1.0)
+
+
+def sentiment_score_batch(catalog):
+    """Array version of sentiment_score."""
+    pos = np.nan_to_num(catalog.sent_pos_mean, nan=0.0)
+    neg = np.nan_to_num(catalog.sent_neg_mean, nan=0.0)
+    return np.clip((pos - neg + 1.0) / 2.0, 0.0, 1.0)
+
+
+def mealtime_fit_batch(catalog, meal):
+    """Array version of mealtime_fit."""
+    m = np.clip(np.nan_to_num(catalog.morning_rate, nan=0.0), 0.0, 1.0)
+    l = np.clip(np.nan_to_num(catalog.lunch_rate, nan=0.0), 0.0, 1.0)
+    d = np.clip(np.nan_to_num(catalog.dinner_rate, nan=0.0), 0.0, 1.0)
+
+    if meal == "morning":
+        return m
+    if meal == "lunch":
+        return l
+    if meal == "dinner":
+        return d
+    return (m + l + d) / 3.0
+
+
+def static_score_batch(catalog, meal, max_review_count):
+    """The part of the baseline score that does not depend on the query."""
+    q = quality_score_batch(catalog, max_review_count)
+    s = sentiment_score_batch(catalog)
+    mt = mealtime_fit_batch(catalog, meal)
+    openbiz = catalog.is_open.astype(np.float64)
+    return 0.20 * q + 0.15 * s + 0.10 * mt + 0.05 * openbiz
+
+
+def _member(rows, sorted_rows):
+    """Boolean mask: which of `rows` are in the sorted array `sorted_rows`."""
+    if len(sorted_rows) == 0:
+        return np.zeros(len(rows), dtype=bool)
+    pos = np.searchsorted(sorted_rows, rows)
+    pos[pos == len(sorted_rows)] = 0
+    return sorted_rows[pos] == rows
+
+
+def _row_entries(catalog, rows):
+    """
+    (segment, entry) pairs for the category entries of `rows`:
+    entry indexes catalog.category_codes, segment is the position in `rows`.
+    """
+    starts = catalog.category_offsets[rows]
+    lens = catalog.category_offsets[rows + 1] - starts
+    seg = np.repeat(np.arange(len(rows)), lens)
+    first = np.repeat(np.cumsum(lens) - lens, lens)
+    entry = np.arange(int(lens.sum())) - first + np.repeat(starts, lens)
+    return seg, entry
+
+
+class ProfileMatcher:
+    """
+    A user profile compiled against a catalog's category vocabulary:
+
+    - long-term cuisine weights per category term and long-term weights per
+      price level, so the long-term match is a sparse dot product over a
+      business's category codes plus a table lookup
+    - the short-term events as a bitset per category term plus a
+      per-price-level table of their price weights, so the session match is
+      an OR over a business's category codes plus table lookups
+
+    and, per meal, the personalized part of the score that does not depend
+    on the query, with the businesses sorted by it, for rank_top_k. Use
+    profile_matcher() to get one; it is compiled once per profile version.
+    """
+
+    def __init__(self, catalog, user_profile):
+        self.catalog = catalog
+        vocab = catalog.category_vocab
+        max_level = max(int(catalog.price_level.max(initial=0)), 0)
+
+        events = user_profile.get("short_term", [])
+        self.event_cats = [event_categories(event) for event in events]
+        self.event_weights = np.array([event.get("weight", 0.0) for event in events], dtype=np.float64)
+        self.has_events = bool(events)
+
+        # term id -> bitset of the events whose categories include it, and
+        # per byte of that bitset a 256-entry table of summed event weights
+        n_words = max(1, (len(events) + 63) // 64)
+        self._term_events = np.zeros((len(catalog.category_terms), n_words), dtype=np.uint64)
+        for e, cats in enumerate(self.event_cats):
+            for c in cats:
+                if c in vocab:
+                    self._term_events[vocab[c], e // 64] |= np.uint64(1 << (e % 64))
+        weights = np.zeros(n_words * 64)
+        weights[:len(events)] = self.event_weights
+        bits = (np.arange(256)[:, None] >> np.arange(8)) & 1
+        self._byte_weights = (weights.reshape(-1, 8) @ bits.T).astype(np.float64)
+
+        # price level -> summed short-term price weight; index 0 is "unknown"
+        self.session_price = np.zeros(max_level + 1)
+        for event in events:
+            ev_price = event.get("price_level")
+            if isinstance(ev_price, (int, float)) and float(ev_price).is_integer() and 1 <= ev_price <= max_level:
+                self.session_price[int(ev_price)] += event.get("weight", 0.0) * 0.5
+
+        lt = user_profile.get("long_term", {})
+        self.lt_cuisine = lt.get("cuisine", {})
+        lt_price = lt.get("price_level", {})
+
+        self.term_weights = np.array([self.lt_cuisine.get(t, 0.0) for t in catalog.category_terms], dtype=np.float64)
+        # price level -> long-term weight; index 0 is "unknown" and stays 0
+        self.price_weights = np.zeros(max_level + 1)
+        for level in range(1, max_level + 1):
+            self.price_weights[level] = lt_price.get(str(level), 0.0)
+
+        self._static = {}
+
+    def match_parts(self, rows):
+        """(session_match, lt_cuisine_norm, lt_price_norm, longterm_match) for the given rows."""
+        catalog = self.catalog
+        price = np.clip(catalog.price_level[rows], 0, len(self.price_weights) - 1)
+        seg, entry = _row_entries(catalog, rows)
+        terms = catalog.category_codes[entry]
+
+        session_match = np.zeros(len(rows))
+        if self.has_events:
+            # an event counts once per business however many of its tags it
+            # shares, so OR the tags' event bitsets before summing weights
+            lens = np.bincount(seg, minlength=len(rows))
+            tagged = lens > 0
+            row_events = np.zeros((len(rows), self._term_events.shape[1]), dtype=np.uint64)
+            if tagged.any():
+                starts = (np.cumsum(lens) - lens)[tagged]
+                row_events[tagged] = np.bitwise_or.reduceat(self._term_events[terms], starts, axis=0)
+            row_bytes = row_events.astype("<u8").view(np.uint8)
+            event_match_score = self._byte_weights[np.arange(row_bytes.shape[1]), row_bytes].sum(axis=1)
+            event_match_score = event_match_score + self.session_price[price]
+            session_match = np.clip(event_match_score / 20.0, 0.0, 1.0)
+
+        cuisine_match_score = np.bincount(seg, weights=self.term_weights[terms], minlength=len(rows))
+        lt_cuisine_norm = np.clip(cuisine_match_score / 50.0, 0.0, 1.0)
+
+        price_match_score = self.price_weights[price]
+        lt_price_norm = np.clip(price_match_score / 20.0, 0.0, 1.0)
+
+        longterm_match = np.clip(0.7 * lt_cuisine_norm + 0.3 * lt_price_norm, 0.0, 1.0)
+        return session_match, lt_cuisine_norm, lt_price_norm, longterm_match
+
+    def match(self, rows):
+        """(session_match, longterm_match) arrays for the given rows."""
+        session_match, _, _, longterm_match = self.match_parts(rows)
+        return session_match, longterm_match
+
+    def static_scores(self, meal, max_review_count):
+        """
+        (scores, order): 0.5 * the catalog's static score plus the profile
+        boost, for every business, and the indices sorted by it (desc).
+        A business's final score is at most its score here plus half of
+        what the query terms can add.
+        """
+        key = (meal, int(max_review_count))
+        cached = self._static.get(key)
+        if cached is None:
+            static, _ = self.catalog.static_scores(meal, max_review_count)
+            session_match, longterm_match = self.match(np.arange(self.catalog.size))
+            scores = 0.5 * static + 0.3 * session_match + 0.2 * longterm_match
+            cached = (scores, np.argsort(-scores, kind="stable"))
+            self._static[key] = cached
+        return cached
+
+
+MAX_CACHED_MATCHERS = 64
+
+
+def profile_matcher(catalog, user_profile):
+    """
+    The compiled ProfileMatcher for a profile. Stored profiles are never
+    mutated in place (a change replaces the dict), so the dict's identity
+    is its version and the matcher is only rebuilt after a change. The
+    cache lives on the catalog, so it goes away with it.
+    """
+    matchers = catalog.matchers
+    cached = matchers.get(id(user_profile))
+    # the entry keeps the profile alive, so its id cannot be reused
+    if cached is not None and cached[0] is user_profile:
+        return cached[1]
+    matcher = ProfileMatcher(catalog, user_profile)
+    if len(matchers) >= MAX_CACHED_MATCHERS:
+        matchers.clear()
+    matchers[id(user_profile)] = (user_profile, matcher)
+    return matcher
+
+
+def _cuisine_match_rows(catalog, rows, user_keywords):
+    if not user_keywords:
+        return 0.5
+    return _member(rows, catalog.category_index.keyword_rows(user_keywords)).astype(np.float64)
+
+
+def score_rows(catalog, rows, cm, static, user_max_price=None, matcher=None):
+    """
+    (baseline_score, final_score) for the given rows, where `cm` is their
+    cuisine match and `static` the full static score array for the meal.
+    """
+    pm = price_match_batch(catalog.price_level[rows], user_max_price)
+    baseline_score = np.clip(0.30 * cm + 0.20 * pm + static[rows], 0.0, 1.0)
+    if matcher is None:
+        return baseline_score, baseline_score
+
+    session_match, longterm_match = matcher.match(rows)
+    final_score = np.clip(0.5 * baseline_score + 0.3 * session_match + 0.2 * longterm_match, 0.0, 1.0)
+    return baseline_score, final_score
+
+
+def batch_content_scores(catalog, user_keywords=None, user_max_price=None, meal=None,
+                         max_review_count=1000, user_profile=None):
+    """
+    Returns (baseline_score, final_score) arrays over the whole catalog.
+    final_score is baseline_score when there is no user_profile.
+    """
+    static, _ = catalog.static_scores(meal, max_review_count)
+    cm = catalog.category_index.cuisine_match(user_keywords)
+    matcher = profile_matcher(catalog, user_profile) if user_profile else None
+    return score_rows(catalog, np.arange(catalog.size), cm, static, user_max_price, matcher)
+
+
+def score_candidates(catalog, rows, user_keywords=None, user_max_price=None, meal=None,
+                     max_review_count=1000, user_profile=None):
+    """Final scores for an explicit candidate set (e.g. a radius prefilter)."""
+    static, _ = catalog.static_scores(meal, max_review_count)
+    cm = _cuisine_match_rows(catalog, rows, user_keywords)
+    matcher = profile_matcher(catalog, user_profile) if user_profile else None
+    return score_rows(catalog, rows, cm, static, user_max_price, matcher)[1]
+
+
+def explain_rows(catalog, rows, user_keywords=None, user_max_price=None, meal=None,
+                 max_review_count=1000, user_profile=None):
+    """The personalization explanations content_score would give the rows (None where it gives none)."""
+    if not user_profile:
+        return [None] * len(rows)
+    static, _ = catalog.static_scores(meal, max_review_count)
+    cm = _cuisine_match_rows(catalog, rows, user_keywords)
+    matcher = profile_matcher(catalog, user_profile)
+    baseline_score, final_score = score_rows(catalog, rows, cm, static, user_max_price, matcher)
+    session_match, lt_cuisine_norm, lt_price_norm, longterm_match = matcher.match_parts(rows)
+
+    out = []
+    for j, i in enumerate(rows):
+        cats_lower = {c.lower() for c in set(catalog.categories[i])}
+        out.append(personal_explanation(
+            cats_lower, catalog.price_level_at(i), matcher.event_cats, matcher.lt_cuisine,
+            baseline_score[j], final_score[j], session_match[j], longterm_match[j],
+            lt_cuisine_norm[j], lt_price_norm[j]
+        ))
+    return out
+
+
+def _keep(rows, scores, masks, min_score, counts=None):
+    ok = np.ones(len(rows), dtype=bool)
+    for j, mask in enumerate(masks):
+        keep = mask[rows]
+        if counts is not None:
+            counts["filtered"][j] += int(np.count_nonzero(ok & ~keep))
+        ok &= keep
+    if min_score is not None:
+        ok &= scores > min_score
+    if counts is not None:
+        counts["scanned"] += len(rows)
+    return rows[ok], scores[ok]
+
+
+def best_k(rows, scores, k):
+    """The k best (rows, scores), ordered by score desc then catalog order."""
+    order = np.lexsort((rows, -scores))[:k]
+    return rows[order], scores[order]
+
+
+SCORE_SHARDS = int(os.environ.get("SCORE_SHARDS", os.cpu_count() or 1))
+PARALLEL_MIN_ROWS = int(os.environ.get("PARALLEL_MIN_ROWS", "200000"))
+_score_pool = None
+
+
+def _pool():
+    global _score_pool
+    if _score_pool is None:
+        _score_pool = ThreadPoolExecutor(max_workers=SCORE_SHARDS, thread_name_prefix="score")
+    return _score_pool
+
+
+def sharded_best_k(rows, k, rank_rows, shards=SCORE_SHARDS, min_rows=PARALLEL_MIN_ROWS):
+    """
+    best_k over sorted candidate rows, ranked by rank_rows(rows) ->
+    (kept rows, ranking, scores). Returns (rows, scores) of the k best by
+    ranking, ties in catalog order. With at least min_rows candidates and
+    more than one shard, contiguous slices are ranked in parallel, each one
+    keeps its own top k, and the merge gives the same answer as one pass.
+    rank_rows must be safe to call from several threads at once.
+    """
+    def part(shard):
+        kept, ranking, scores = rank_rows(shard)
+        best, _ = best_k(np.arange(len(kept)), ranking, k)
+        return kept[best], ranking[best], scores[best]
+
+    if shards <= 1 or len(rows) < min_rows:
+        parts = [part(rows)]
+    else:
+        # each task runs in a copy of the caller's context (e.g. an active profile)
+        futures = [
+            _pool().submit(contextvars.copy_context().run, part, shard)
+            for shard in np.array_split(rows, shards)
+        ]
+        parts = [f.result() for f in futures]
+
+    kept, ranking, scores = (np.concatenate(column) for column in zip(*parts))
+    best = np.lexsort((kept, -ranking))[:k]
+    return kept[best], scores[best]
+
+
+def rank_top_k(catalog, k, user_keywords=None, user_max_price=None, meal=None,
+               max_review_count=1000, user_profile=None, masks=(), min_score=None, counts=None):
+    """
+    The k best businesses by final score, as (indices, scores), best first,
+    with ties in catalog order. Gives the same answer as sorting
+    batch_content_scores, without scoring the whole catalog:
+
+    - keyword matches (the only rows with cuisine match 1.0) come from the
+      category index and are scored directly
+    - every other row has the same cuisine match, so they are walked in
+      static-score order (with the profile boost, when personalizing) until
+      the k-th best score beats the best score any remaining row could
+      still reach
+
+    `masks` are boolean arrays over the catalog (hard filters) and
+    `min_score` drops rows whose score is not above it. If `counts` is
+    given, counts["scanned"] is increased by the rows scored and
+    counts["filtered"][j] by the rows masks[j] removed.
+    """
+    static, order = catalog.static_scores(meal, max_review_count)
+    matcher = profile_matcher(catalog, user_profile) if user_profile else None
+    if matcher is not None:
+        walk_static, order = matcher.static_scores(meal, max_review_count)
+
+    if user_keywords:
+        matched = catalog.category_index.keyword_rows(user_keywords)
+        rest_cm = 0.0
+    else:
+        matched = np.empty(0, dtype=np.int64)
+        rest_cm = 0.5
+
+    _, scores = score_rows(catalog, matched, 1.0, static, user_max_price, matcher)
+    best_rows, best_scores = best_k(*_keep(matched, scores, masks, min_score, counts), k)
+
+    # upper bound on what the query-dependent terms can add to a non-matching row
+    max_pm = 0.5 if user_max_price is None else 1.0
+    bonus = 0.30 * rest_cm + 0.20 * max_pm
+
+    pos = 0
+    chunk = max(4 * k, 256)
+    while pos < len(order):
+        if len(best_rows) >= k:
+            if matcher is None:
+                bound = min(1.0, static[order[pos]] + bonus)
+            else:
+                bound = walk_static[order[pos]] + 0.5 * bonus
+            # the epsilon covers rounding differences between bound and score
+            if best_scores[-1] > bound + 1e-12:
+                break
+
+        rows = order[pos:pos + chunk]
+        pos += chunk
+        chunk *= 2
+        rows = rows[~_member(rows, matched)]
+        _, scores = score_rows(catalog, rows, rest_cm, static, user_max_price, matcher)
+        rows, scores = _keep(rows, scores, masks, min_score, counts)
+        best_rows, best_scores = best_k(
+            np.concatenate([best_rows, rows]), np.concatenate([best_scores, scores]), k
+        )
+
+    return best_rows, best_scores
@@ -0,0 +1,351 @@
+"""
+QuickBites: benchmarks for the scoring and ranking hot paths.
+
+Catalogs are synthetic, resampled from the enriched CSV so categories, the
+attributes dict shape, sentiment and meal rates keep their real
+distributions, at any size from 1k to 1M rows. Each size is compiled once
+into a catalog snapshot under --cache-dir and memory-mapped from there.
+
+Cases: the scalar content_score / cuisine_match / only_relevant_categories
+over a sample of rows, and the /search and /recommend handlers called
+in-process (cold and warm result cache) with the offline ETA provider.
+
+Results are written as JSON. With a baseline, every case is compared with
+it and the exit status is 1 if any regressed:
+    python benchmark.py --save                  # record bench_baseline.json
+    python benchmark.py                         # compare with it
+    python benchmark.py --sizes 1000,1000000 --out results.json
+
+Timings only compare on the machine they were recorded on. The committed
+bench_baseline.json is recorded on the reference machine: a 1-CPU Linux
+x86_64 box (Intel Xeon, 5 GB) with Python 3.11.7, NumPy 2.4.6 and pandas
+3.0.6, idle apart from the benchmark. Its details are saved under
+"machine", and a comparison on a different one prints a warning.
+Re-record the baseline in a commit of its own, never inside a change it is
+meant to check.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from catalog_snapshot import current_version, load_catalog, write_snapshot
+from compute_content_score import content_score, cuisine_match, only_relevant_categories
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(base_dir, "data/ca_business_enriched.csv")
+BASELINE_PATH = os.path.join(base_dir, "bench_baseline.json")
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+SAMPLE_ROWS = 1000     # rows per scalar-case op
+MIN_TIME_S = 1.0       # per case
+MIN_RUNS, MAX_RUNS = 5, 5000
+QUERIES = [["pizza"], ["ramen", "japanese"], ["mexican"], ["coffee", "bakery"], []]
+MEALS = [None, "dinner", "lunch", None, "morning"]
+BENCH_USER = "bench_user"
+
+# Regression thresholds, relative to the baseline
+MAX_LATENCY_RATIO = 1.5
+MIN_THROUGHPUT_RATIO = 0.67
+MAX_MEMORY_RATIO = 1.25
+MEMORY_SLACK_MB = 1.0  # peaks this small are noise
+
+# Columns resampled together keep their joint distribution (a bakery keeps
+# its morning rate), while the groups vary independently of each other.
+COLUMN_GROUPS = [
+    ["address", "city", "state", "postal_code", "latitude", "longitude"],
+    ["name", "is_open", "attributes", "categories", "hours"],
+    ["stars", "review_count", "n_reviews", "sent_pos_mean", "sent_neu_mean", "sent_neg_mean",
+     "pos_rate", "neu_rate", "neg_rate", "n_dinner_reviews", "n_lunch_reviews", "n_morning_reviews",
+     "morning_rate", "lunch_rate", "dinner_rate"],
+]
+LOCATION_JITTER_DEG = 0.01  # ~1 km, so copies of a place do not stack up
+
+
+def synthetic_catalog(source, n, seed=0):
+    """DataFrame of n synthetic businesses drawn from the source DataFrame."""
+    rng = np.random.default_rng(seed)
+    out = {"business_id": [f"syn{seed}-{i:07d}" for i in range(n)]}
+    for group in COLUMN_GROUPS:
+        picks = rng.integers(0, len(source), n)
+        for col in group:
+            if col in source.columns:
+                out[col] = source[col].to_numpy()[picks]
+    for col in ("latitude", "longitude"):
+        out[col] = out[col].astype(float) + rng.normal(0.0, LOCATION_JITTER_DEG, n)
+    return pd.DataFrame(out, columns=[c for c in source.columns if c in out])
+
+
+def synthetic_snapshot(source, n, cache_dir, source_digest, seed=0):
+    """Snapshot root of the size-n synthetic catalog, building it on first use."""
+    root = os.path.join(cache_dir, f"{source_digest}-{n}-{seed}")
+    if current_version(root) is None:
+        write_snapshot(synthetic_catalog(source, n, seed), root)
+    return root
+
+
+def timed_runs(fn):
+    """Wall times (s) of repeated fn() calls: at least MIN_RUNS and MIN_TIME_S."""
+    times = []
+    start = time.perf_counter()
+    while len(times) < MAX_RUNS and (len(times) < MIN_RUNS or time.perf_counter() - start < MIN_TIME_S):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return times
+
+
+def peak_memory_mb(fn, calls=len(QUERIES)):
+    """
+    Largest peak Python/NumPy heap allocated during one fn() call, over
+    `calls` calls (one full cycle of the queries, so it does not depend on
+    where the timed runs left off).
+    """
+    tracemalloc.start()
+    try:
+        peak = 0
+        for _ in range(calls):
+            retained = tracemalloc.get_traced_memory()[0]  # kept by earlier calls (caches)
+            tracemalloc.reset_peak()
+            fn()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - retained)
+        return peak / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def measure(name, rows, fn, items_per_op, unit, setup=None):
+    """Time fn (after setup, if given, before every call) and record its peak memory."""
+    def op():
+        if setup is not None:
+            setup()
+        fn()
+    op()  # warm-up
+    times = np.array(timed_runs(op))
+    return {
+        "case": name,
+        "rows": rows,
+        "runs": len(times),
+        "p50_ms": float(np.percentile(times, 50) * 1000),
+        "p95_ms": float(np.percentile(times, 95) * 1000),
+        "throughput": float(items_per_op / times.mean()),
+        "unit": unit,
+        "peak_mb": peak_memory_mb(op),
+    }
+
+
+def cycle(items):
+    state = {"i": 0}
+
+    def next_item():
+        state["i"] += 1
+        return items[state["i"] % len(items)]
+    return next_item
+
+
+def scalar_cases(df, n, seed=0):
+    sample = df.sample(min(SAMPLE_ROWS, len(df)), random_state=seed)
+    rows = sample.to_dict("records")
+    categories = sample["categories"].tolist()
+    max_reviews = int(df["review_count"].fillna(0).max())
+    query = cycle(QUERIES)
+
+    def score():
+        keywords = query()
+        for row in rows:
+            content_score(row, keywords, 2, "dinner", max_reviews)
+
+    def match():
+        keywords = query()
+        for cats in categories:
+            cuisine_match(keywords, cats)
+
+    def relevant():
+        keywords = query()
+        for cats in categories:
+            only_relevant_categories(cats, keywords)
+
+    return [
+        measure("content_score", n, score, len(rows), "rows/s"),
+        measure("cuisine_match", n, match, len(rows), "rows/s"),
+        measure("only_relevant_categories", n, relevant, len(rows), "rows/s"),
+    ]
+
+
+def handler_cases(api, n, loop):
+    from fastapi import Response
+
+    catalog = api.catalogs.current
+    lat, lon = float(np.median(catalog.latitude)), float(np.median(catalog.longitude))
+    query = cycle(list(zip(QUERIES, MEALS)))
+
+    def search(personalize=False):
+        keywords, meal = query()
+        prefs = api.Preferences(max_price=2, meal=meal, personalize=personalize)
+        api.search(api.SearchRequest(query=",".join(keywords), preferences=prefs, user_id=BENCH_USER), Response())
+
+    def recommend(personalize=False):
+        keywords, meal = query()
+        loop.run_until_complete(api.recommend(
+            Response(), keywords=",".join(keywords), max_price=None, meal=meal, personalize=personalize,
+            lat=lat, lon=lon, vegan=False, origin="current", distance_weight=0.5, radius_km=None,
+            min_lat=None, min_lon=None, max_lat=None, max_lon=None, user_id=BENCH_USER,
+            page_size=api.DEFAULT_PAGE_SIZE, page_token=None, stream=False,
+        ))
+
+    def cold():
+        api.result_cache.clear()
+        api.distance_utils.eta_cache.clear()
+
+    return [
+        measure("search_cold", n, search, 1, "req/s", setup=cold),
+        measure("search_personalized_cold", n, lambda: search(True), 1, "req/s", setup=cold),
+        measure("search_warm", n, search, 1, "req/s"),
+        measure("recommend_cold", n, recommend, 1, "req/s", setup=cold),
+        measure("recommend_personalized_cold", n, lambda: recommend(True), 1, "req/s", setup=cold),
+        measure("recommend_warm", n, recommend, 1, "req/s"),
+    ]
+
+
+def seed_profile(api, df, events=40, seed=0):
+    """Give BENCH_USER a realistic profile through the /interact/batch handler."""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(df), events)
+    kinds = list(api.EVENT_WEIGHTS)
+    api.log_interactions([
+        api.InteractionEvent(
+            user_id=BENCH_USER,
+            business_id=str(df["business_id"].iat[i]),
+            event_type=kinds[j % len(kinds)],
+            categories=df["categories"].iat[i] if isinstance(df["categories"].iat[i], str) else None,
+            price_level=None,
+        )
+        for j, i in enumerate(picks)
+    ])
+
+
+def import_api(workdir, catalog_dir):
+    """The API module, with its log, profile DB and catalog pointed at workdir."""
+    os.environ["INTERACTION_LOG_DIR"] = os.path.join(workdir, "interactions")
+    os.environ["PROFILE_DB"] = os.path.join(workdir, "profiles.db")
+    os.environ["CATALOG_DIR"] = catalog_dir
+    os.environ["ETA_PROVIDER"] = "local"
+    os.environ.pop("GOOGLE_KEY", None)
+    # the local provider has no quota to protect and one caller has nothing to
+    # coalesce with, so the rate limit and batch window would only add idle time
+    os.environ.setdefault("ETA_MAX_QPS", "0")
+    os.environ.setdefault("ETA_BATCH_WINDOW_S", "0")
+    import api
+    return api
+
+
+def run(sizes, source_path=CSV_PATH, cache_dir=None, seed=0):
+    """Results document for the given catalog sizes."""
+    cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "quickbites-bench")
+    with open(source_path, "rb") as f:
+        source_digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    source = pd.read_csv(source_path)
+
+    roots = {}
+    for n in sizes:
+        start = time.perf_counter()
+        roots[n] = synthetic_snapshot(source, n, cache_dir, source_digest, seed)
+        print(f"catalog {n}: {roots[n]} ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+
+    workdir = tempfile.mkdtemp(prefix="quickbites-bench-")
+    api = import_api(workdir, roots[sizes[0]])
+    loop = asyncio.new_event_loop()
+    results = []
+    try:
+        for n in sizes:
+            df = synthetic_catalog(source, n, seed)
+            api.catalogs.current = load_catalog(roots[n])
+            seed_profile(api, df, seed=seed)
+            for case in scalar_cases(df, n, seed) + handler_cases(api, n, loop):
+                print(f"{case['case']:>28} {n:>9}  p50 {case['p50_ms']:9.3f} ms  p95 {case['p95_ms']:9.3f} ms  "
+                      f"{case['throughput']:12.1f} {case['unit']:<6}  peak {case['peak_mb']:8.2f} MB", file=sys.stderr)
+                results.append(case)
+    finally:
+        loop.run_until_complete(api.distance_utils.aclose())
+        loop.close()
+        api.interaction_log.close()
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "cpus": os.cpu_count(),
+        },
+        "source_sha256": source_digest,
+        "seed": seed,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "results": results,
+    }
+
+
+def compare(results, baseline):
+    """Regressions of results against baseline, as readable strings."""
+    base = {(r["case"], r["rows"]): r for r in baseline["results"]}
+    out = []
+    for r in results["results"]:
+        b = base.get((r["case"], r["rows"]))
+        if b is None:
+            continue
+        name = f"{r['case']} @ {r['rows']}"
+        if r["p50_ms"] > b["p50_ms"] * MAX_LATENCY_RATIO:
+            out.append(f"{name}: p50 {b['p50_ms']:.3f} -> {r['p50_ms']:.3f} ms")
+        if r["throughput"] < b["throughput"] * MIN_THROUGHPUT_RATIO:
+            out.append(f"{name}: throughput {b['throughput']:.1f} -> {r['throughput']:.1f} {r['unit']}")
+        if r["peak_mb"] > b["peak_mb"] * MAX_MEMORY_RATIO + MEMORY_SLACK_MB:
+            out.append(f"{name}: peak memory {b['peak_mb']:.2f} -> {r['peak_mb']:.2f} MB")
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark scoring and ranking on synthetic catalogs.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma-separated row counts")
+    parser.add_argument("--source", default=CSV_PATH, help="CSV whose distributions the catalogs copy")
+    parser.add_argument("--cache-dir", default=None, help="where synthetic snapshots are kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare with")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--out", default=None, help="also write the results here")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = run(sizes, args.source, args.cache_dir, args.seed)
+    for path in filter(None, [args.out, args.baseline if args.save else None]):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Wrote {path}", file=sys.stderr)
+    if args.save or not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    if baseline.get("machine") != results["machine"]:
+        print(f"WARNING baseline recorded on {baseline.get('machine')}, not this machine ({results['machine']}); "
+              f"timings may not compare")
+    regressions = compare(results, baseline)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print(f"{len(regressions)} regressions against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""
+QuickBites: typed, pre-parsed view of the business catalog.
+
+The enriched CSV stores `attributes` as a stringified Python dict, and the
+endpoints used to re-parse it (plus walk df.iterrows()) on every request.
+Catalog does all of that exactly once when the data loads and keeps the
+columns the scorer and the hard filters need as NumPy arrays.
+"""
+
+import ast
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from batch_scoring import static_score_batch
+from category_index import CategoryIndex
+from compute_content_score import safe_parse_attributes, tokenize_categories
+from spatial_index import GridIndex
+
+
+NUMERIC_COLUMNS = [
+    "latitude",
+    "longitude",
+    "stars",
+    "review_count",
+    "sent_pos_mean",
+    "sent_neg_mean",
+    "morning_rate",
+    "lunch_rate",
+    "dinner_rate",
+]
+
+MEAL_KEYS = ("morning", "lunch", "dinner", None)
+
+_versions = itertools.count(1)
+
+
+def parse_price_level(attrs):
+    """
+    Same rules as compute_content_score.extract_price_level_from_attributes,
+    but on an already parsed attributes dict.
+    """
+    v = attrs.get("RestaurantsPriceRange2", None)
+    if v is None:
+        return None
+    try:
+        return int(v)
+    except Exception:
+        try:
+            return int(float(v))
+        except Exception:
+            return None
+
+
+def parse_good_for_meal(raw):
+    """
+    GoodForMeal is itself a stringified dict inside attributes.
+    Returns the parsed dict, or None if it is missing / unparseable.
+    """
+    if isinstance(raw, dict):
+        return raw
+    if not isinstance(raw, str):
+        return None
+    try:
+        obj = ast.literal_eval(raw)
+    except Exception:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+class StringColumn:
+    """
+    A column of optional strings stored as one UTF-8 byte buffer plus
+    offsets, so it can be memory-mapped instead of held as Python objects.
+    """
+
+    def __init__(self, data, offsets, valid):
+        self.data = data
+        self.offsets = offsets
+        self.valid = valid
+
+    @classmethod
+    def from_values(cls, values):
+        encoded = [v.encode("utf-8") if isinstance(v, str) else b"" for v in values]
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        valid = np.array([isinstance(v, str) for v in values], dtype=bool)
+        return cls(data, offsets, valid)
+
+    def __len__(self):
+        return len(self.valid)
+
+    def __getitem__(self, i):
+        if not self.valid[i]:
+            return None
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+class LazyColumn:
+    """Per-row values derived on access (e.g. category tokens from the raw string)."""
+
+    def __init__(self, n, fn):
+        self.n = n
+        self.fn = fn
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        return self.fn(i)
+
+
+STRING_COLUMNS = ["business_id", "name", "address", "city", "state", "hours", "categories", "good_for_meal"]
+
+
+def _string_or_none(v):
+    if v is None:
+        return None
+    if isinstance(v, float) and np.isnan(v):
+        return None
+    return v if isinstance(v, str) else str(v)
+
+
+def build_columns(df):
+    """
+    Everything a Catalog needs from the enriched DataFrame, as flat arrays:
+    this is where the CSV strings get parsed, and what catalog_snapshot
+    writes to disk. Returns (columns, meta).
+    """
+    df = df.reset_index(drop=True)
+    n = len(df)
+    columns = {}
+
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            columns[col] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+        else:
+            columns[col] = np.full(n, np.nan)
+
+    is_open = pd.to_numeric(df.get("is_open", pd.Series(0, index=df.index)), errors="coerce")
+    columns["is_open"] = (is_open.fillna(0).to_numpy() == 1)
+
+    categories_raw = df["categories"].tolist() if "categories" in df.columns else [None] * n
+    categories_raw = [c if isinstance(c, str) else "" for c in categories_raw]
+    columns["is_vegan"] = np.array(["Vegan" in c for c in categories_raw], dtype=bool)
+
+    # Lowercased category tags as a flat (row, term id) list, one entry per
+    # distinct tag per business (the personalization code works on sets)
+    vocab = {}
+    rows, codes = [], []
+    for i, raw in enumerate(categories_raw):
+        for c in {c.lower() for c in tokenize_categories(raw)}:
+            rows.append(i)
+            codes.append(vocab.setdefault(c, len(vocab)))
+    columns["category_rows"] = np.array(rows, dtype=np.int64)
+    columns["category_codes"] = np.array(codes, dtype=np.int64)
+    # entries are grouped by row, so row i owns [offsets[i], offsets[i + 1])
+    counts = np.bincount(columns["category_rows"], minlength=n)
+    columns["category_offsets"] = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    attributes_raw = df["attributes"].tolist() if "attributes" in df.columns else [None] * n
+    # Only the price level and GoodForMeal are kept, so the parsed dicts can
+    # go right away; each distinct attributes string is parsed once
+    parsed = {}
+    price_levels, good_for_meal_raw, good_for_meal = [], [], []
+    for a in attributes_raw:
+        key = a if isinstance(a, str) else None
+        values = parsed.get(key)
+        if values is None:
+            attrs = safe_parse_attributes(a)
+            raw = _string_or_none(attrs.get("GoodForMeal"))
+            values = parsed[key] = (parse_price_level(attrs), raw, parse_good_for_meal(raw))
+        price_levels.append(values[0])
+        good_for_meal_raw.append(values[1])
+        good_for_meal.append(values[2])
+    del parsed
+    columns["price_level"] = np.array([p if p is not None else 0 for p in price_levels], dtype=np.int8)
+
+    # GoodForMeal as one bool column per meal key, plus whether it parsed at all
+    meal_keys = sorted({k for g in good_for_meal if g for k in g if isinstance(k, str)})
+    columns["good_for_meal_known"] = np.array([g is not None for g in good_for_meal], dtype=bool)
+    for key in meal_keys:
+        columns[f"good_for_meal.{key}"] = np.array([bool(g.get(key, False)) if g else False for g in good_for_meal], dtype=bool)
+
+    strings = {
+        "business_id": df["business_id"].tolist() if "business_id" in df.columns else [None] * n,
+        "categories": categories_raw,
+        "good_for_meal": good_for_meal_raw,
+    }
+    for col in ("name", "address", "city", "state", "hours"):
+        strings[col] = df[col].tolist() if col in df.columns else [None] * n
+    for col in STRING_COLUMNS:
+        column = StringColumn.from_values([_string_or_none(v) for v in strings[col]])
+        columns[f"{col}.data"] = column.data
+        columns[f"{col}.offsets"] = column.offsets
+        columns[f"{col}.valid"] = column.valid
+
+    max_reviews = df["review_count"].max() if n and "review_count" in df.columns else 0
+    meta = {
+        "rows": n,
+        # no review counts: 0, which quality_score treats as 1 (as it does for a missing count)
+        "max_reviews": 0.0 if pd.isna(max_reviews) else float(max_reviews),
+        "category_terms": list(vocab),
+        "meal_keys": meal_keys,
+    }
+    return columns, meta
+
+
+class Catalog:
+    """
+    Typed, pre-parsed view of the catalog, built from DataFrame columns
+    (Catalog(df)) or from a memory-mapped snapshot (catalog_snapshot).
+
+    - numeric columns as float64 arrays (NaN where missing), with a grid
+      index over latitude / longitude (spatial_index)
+    - price_level as an int8 array (0 = unknown)
+    - is_vegan / is_open as bool arrays
+    - good_for_meal_raw: raw GoodForMeal attribute value, plus one bool
+      column per meal key for the meal filter
+    - categories: tokenized category tags per business, plus the interned
+      lowercase tag vocabulary and its inverted index (category_index)
+    - string fields for display as StringColumns
+    """
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        columns, meta = build_columns(self.df)
+        self._init(columns, meta)
+        self._derive_indexes()
+
+    @classmethod
+    def from_columns(cls, columns, meta):
+        """
+        Catalog over already built columns (e.g. memory-mapped). Derived
+        indexes are used from `columns` when present, otherwise built.
+        """
+        self = cls.__new__(cls)
+        self.df = None
+        self._init(columns, meta)
+        self._derive_indexes(columns)
+        return self
+
+    def _init(self, columns, meta):
+        n = self.size = int(meta["rows"])
+        # distinguishes catalogs within a process (e.g. in result cache keys)
+        self.version = next(_versions)
+        self.snapshot_version = meta.get("version")
+
+        for col in NUMERIC_COLUMNS:
+            setattr(self, col, columns[col])
+        self.is_open = columns["is_open"]
+        self.is_vegan = columns["is_vegan"]
+        self.price_level = columns["price_level"]
+
+        self.strings = {
+            col: StringColumn(columns[f"{col}.data"], columns[f"{col}.offsets"], columns[f"{col}.valid"])
+            for col in STRING_COLUMNS
+        }
+        self.categories_raw = self.strings["categories"]
+        self.categories = LazyColumn(n, lambda i: tokenize_categories(self.categories_raw[i]))
+        # what cuisine_match runs its keyword regexes against
+        self.category_text = LazyColumn(n, lambda i: " ".join(self.categories[i]).lower())
+        self.category_terms = list(meta["category_terms"])
+        self.category_vocab = {t: tid for tid, t in enumerate(self.category_terms)}
+        self.category_rows = columns["category_rows"]
+        self.category_codes = columns["category_codes"]
+        self.category_offsets = columns["category_offsets"]
+
+        self.good_for_meal_raw = self.strings["good_for_meal"]
+        self._good_for_meal_known = columns["good_for_meal_known"]
+        self._good_for_meal = {key: columns[f"good_for_meal.{key}"] for key in meta["meal_keys"]}
+        self._meal_masks = {}
+
+        max_reviews = meta["max_reviews"]
+        if max_reviews is None or pd.isna(max_reviews):  # snapshots written before it was normalised
+            max_reviews = 0
+        elif float(max_reviews).is_integer():
+            max_reviews = int(max_reviews)
+        self.max_reviews = max_reviews
+        self._static_scores = {}
+        # compiled profiles (batch_scoring.profile_matcher)
+        self.matchers = {}
+
+    def _derive_indexes(self, columns=None):
+        """Grid index, category postings and per-meal static orders."""
+        columns = columns or {}
+        if "grid.rows" in columns:
+            self.spatial_index = GridIndex.from_arrays(
+                self.latitude, self.longitude, columns["grid.rows"], columns["grid.cells"], columns["grid.offsets"]
+            )
+        else:
+            self.spatial_index = GridIndex(self.latitude, self.longitude)
+
+        if "postings" in columns:
+            self.category_index = CategoryIndex(self, columns["postings"], columns["postings.offsets"])
+        else:
+            self.category_index = CategoryIndex(self)
+
+        for meal in MEAL_KEYS:
+            name = meal or "all"
+            if f"static.{name}" in columns:
+                key = (meal, int(self.max_reviews))
+                self._static_scores[key] = (columns[f"static.{name}"], columns[f"order.{name}"])
+            else:
+                self.static_scores(meal, self.max_reviews)
+
+    def index_columns(self):
+        """The derived indexes as arrays, for writing into a snapshot."""
+        columns = {
+            "grid.rows": self.spatial_index._rows,
+            "grid.cells": self.spatial_index._cells,
+            "grid.offsets": self.spatial_index._offsets,
+            "postings": self.category_index._postings,
+            "postings.offsets": self.category_index._offsets,
+        }
+        for meal in MEAL_KEYS:
+            static, order = self.static_scores(meal, self.max_reviews)
+            columns[f"static.{meal or 'all'}"] = static
+            columns[f"order.{meal or 'all'}"] = order
+        return columns
+
+    def __len__(self):
+        return self.size
+
+    def price_level_at(self, i):
+        p = int(self.price_level[i])
+        return p if p > 0 else None
+
+    def meal_mask(self, meal):
+        """
+        Hard filter used by /recommend: a business is dropped only if it has
+        GoodForMeal info and that info says no to `meal`. Cached per meal.
+        """
+        if not meal:
+            return np.ones(self.size, dtype=bool)
+        mask = self._meal_masks.get(meal)
+        if mask is None:
+            says_yes = self._good_for_meal.get(meal)
+            if says_yes is None:
+                mask = ~self._good_for_meal_known
+            else:
+                mask = ~self._good_for_meal_known | says_yes
+            self._meal_masks[meal] = mask
+        return mask
+
+    def static_scores(self, meal, max_review_count):
+        """
+        The query-independent part of the baseline score (quality, sentiment,
+        mealtime fit, open bonus) and the business indices sorted by it, best
+        first. Precomputed for every meal value at load time.
+        """
+        key = (meal if meal in MEAL_KEYS else None, int(max_review_count))
+        cached = self._static_scores.get(key)
+        if cached is None:
+            static = static_score_batch(self, key[0], key[1])
+            order = np.argsort(-static, kind="stable")
+            cached = self._static_scores[key] = (static, order)
+        return cached
+
+    def display_fields(self, i):
+        """Fields both endpoints return for a business, already NaN-cleaned."""
+        strings = self.strings
+        review_count = _float_or_none(self.review_count[i])
+        if review_count is not None and review_count.is_integer():
+            review_count = int(review_count)
+        return {
+            "business_id": strings["business_id"][i],
+            "name": strings["name"][i],
+            "stars": _float_or_none(self.stars[i]),
+            "review_count": review_count,
+            "latitude": _float_or_none(self.latitude[i]),
+            "longitude": _float_or_none(self.longitude[i]),
+            "address": strings["address"][i],
+            "city": strings["city"][i],
+            "state": strings["state"][i],
+            "hours": strings["hours"][i],
+        }
+
+
+def _float_or_none(v):
+    v = float(v)
+    return None if np.isnan(v) else v
+
+
+def load_catalog(csv_path):
+    return Catalog(pd.read_csv(csv_path))
@@ -0,0 +1,366 @@
+"""
+QuickBites: binary columnar catalog snapshots.
+
+The enriched CSV keeps `attributes` as stringified Python dicts, so loading
+it means a literal_eval per business. This compiles the CSV once into a
+directory of .npy columns plus a manifest, with attributes already parsed
+and the derived indexes (grid cells, category postings, static-score
+orders) already built. The API memory-maps it: startup does no parsing or
+sorting, and workers share the column pages through the OS page cache.
+
+Layout:
+    <root>/CURRENT             name of the active version
+    <root>/<version>/manifest.json
+    <root>/<version>/<column>.npy
+    <root>/<version>/.pin      locked (shared) by every process mapping it
+
+Writing a version prunes the old ones: the newest KEEP_VERSIONS stay, and
+so do CURRENT and any version still mapped somewhere.
+
+Build:
+    python catalog_snapshot.py data/ca_business_enriched.csv data/catalog
+
+CatalogManager holds the live catalog and swaps in a new version (after
+warming it) without a restart. If there is no snapshot yet, the first
+worker to start builds one from the CSV (under a file lock, so the others
+wait for it) instead of every worker parsing its own copy. The columns are
+then shared by all worker processes: each one maps the same read-only files,
+so the pages sit in the OS page cache once, whatever the worker count.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process build lock
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from catalog import Catalog, build_columns
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+PIN = ".pin"
+KEEP_VERSIONS = int(os.environ.get("CATALOG_KEEP_VERSIONS", "3"))  # newest versions kept; 0 keeps all
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _source_stat(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def write_snapshot(df, root, source=None, max_reviews=None, keep=KEEP_VERSIONS):
+    """
+    Build the columns for `df`, write them as a new version under `root`
+    and point CURRENT at it, then prune all but the newest `keep` versions
+    (see prune_versions). Returns the version directory. `max_reviews`
+    replaces df's own maximum review count in the quality score (shards of
+    one catalog use the whole catalog's, so their scores compare).
+    """
+    columns, meta = build_columns(df)
+    if max_reviews is not None:
+        meta["max_reviews"] = float(max_reviews)
+    catalog = Catalog.from_columns(columns, meta)
+    columns.update(catalog.index_columns())
+
+    digest = _file_sha256(source) if source else hashlib.sha256(pd.util.hash_pandas_object(df).values).hexdigest()
+    version = f"{time.strftime('%Y%m%dT%H%M%S')}-{digest[:12]}"
+    path = os.path.join(root, version)
+    os.makedirs(path, exist_ok=True)
+
+    files = {}
+    for name, arr in columns.items():
+        files[name] = f"{name}.npy"
+        np.save(os.path.join(path, files[name]), np.ascontiguousarray(arr))
+
+    manifest = dict(
+        meta,
+        format=FORMAT,
+        version=version,
+        source=os.path.abspath(source) if source else None,
+        source_sha256=digest if source else None,
+        source_stat=_source_stat(source) if source else None,
+        created=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        columns=files,
+    )
+    _write_atomic(os.path.join(path, MANIFEST), json.dumps(manifest, indent=1))
+    # flip the pointer last, so readers only ever see complete versions
+    _write_atomic(os.path.join(root, CURRENT), version)
+    if keep > 0:
+        prune_versions(root, keep)
+    return path
+
+
+def _versions(root):
+    """Version names under root, oldest first (by when their manifest was written)."""
+    out = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith(".") or not os.path.isdir(path):
+            continue
+        manifest = os.path.join(path, MANIFEST)
+        out.append((os.stat(manifest if os.path.exists(manifest) else path).st_mtime_ns, name))
+    return [name for _, name in sorted(out)]
+
+
+def _pin(path):
+    """
+    A shared lock on a version, held for as long as the returned file stays
+    open. load_catalog keeps it on the Catalog, so it goes when the catalog
+    is freed (or its process exits).
+    """
+    f = open(os.path.join(path, PIN), "a")
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_SH)
+    return f
+
+
+def prune_versions(root, keep=KEEP_VERSIONS):
+    """
+    Delete all but the newest `keep` versions under root; returns the names
+    deleted. CURRENT is always kept, and so is any version a catalog in
+    any process still maps (it holds a pin on it). Without fcntl nothing is
+    pinned, but the files of a mapped version cannot be deleted there anyway.
+    """
+    current = current_version(root)
+    deleted = []
+    for name in _versions(root)[:-keep]:
+        if name == current:
+            continue
+        path = os.path.join(root, name)
+        try:
+            with open(os.path.join(path, PIN), "a") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                shutil.rmtree(path)
+        except OSError:  # pinned (BlockingIOError), or already gone
+            continue
+        deleted.append(name)
+    return deleted
+
+
+def current_version(root):
+    """Name of the active version under root, or None."""
+    try:
+        with open(os.path.join(root, CURRENT), "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def read_snapshot(path, mmap=True):
+    """(columns, meta) of one version directory; columns are memory-mapped."""
+    with open(os.path.join(path, MANIFEST), "r") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT:
+        raise ValueError(f"unsupported catalog snapshot format {meta.get('format')!r} in {path}")
+    mode = "r" if mmap else None
+    # plain ndarray views of the maps: same pages, without np.memmap's
+    # per-access overhead on scalar reads
+    columns = {
+        name: np.asarray(np.load(os.path.join(path, file), mmap_mode=mode, allow_pickle=False))
+        for name, file in meta["columns"].items()
+    }
+    return columns, meta
+
+
+@contextlib.contextmanager
+def _build_lock(root):
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _stale(root, version, csv_path):
+    """Whether version was built from csv_path and the file changed since."""
+    with open(os.path.join(root, version, MANIFEST), "r") as f:
+        manifest = json.load(f)
+    if manifest.get("source") != os.path.abspath(csv_path):
+        return False
+    return manifest.get("source_stat") != _source_stat(csv_path)
+
+
+def ensure_snapshot(root, csv_path):
+    """
+    The current version under root, building it from csv_path first if
+    there is none (or the CSV changed since it was built). Workers starting
+    together build it once: the rest wait on the lock, then just load it.
+    """
+    version = current_version(root)
+    if version is not None and not _stale(root, version, csv_path):
+        return version
+    with _build_lock(root):
+        version = current_version(root)
+        if version is None or _stale(root, version, csv_path):
+            write_snapshot(pd.read_csv(csv_path), root, source=csv_path)
+            version = current_version(root)
+    return version
+
+
+def version_dir(root, version):
+    """
+    The directory of a version under root. Only the name of a directory
+    directly under root is accepted (no paths), so a caller-supplied version
+    cannot point the loader anywhere else.
+    """
+    if not version or version in (".", "..") or os.path.basename(version) != version or os.sep in version:
+        raise ValueError(f"bad catalog version {version!r}")
+    path = os.path.join(root, version)
+    if not os.path.isfile(os.path.join(path, MANIFEST)):
+        raise FileNotFoundError(f"no catalog version {version!r} in {root}")
+    return path
+
+
+def load_catalog(root, version=None):
+    """Catalog for the given (default: current) version under root."""
+    version = version or current_version(root)
+    if version is None:
+        raise FileNotFoundError(f"no catalog snapshot in {root}")
+    path = version_dir(root, version)
+    pin = _pin(path)  # before mapping, so prune_versions cannot delete it under us
+    catalog = Catalog.from_columns(*read_snapshot(path))
+    catalog.snapshot_pin = pin
+    return catalog
+
+
+class CatalogManager:
+    """
+    Holds the live Catalog and swaps in new versions without a restart.
+
+    reload() loads the new version next to the old one, warms it (derived
+    indexes, meal masks, warm_fn), then replaces `current` in a single
+    assignment. Requests read `current` once when they start, so in-flight
+    ones finish on the version they started with; the old catalog (and its
+    mapped files) is freed when the last of them lets go of it.
+    """
+
+    WARM_MEALS = ("morning", "lunch", "dinner")
+
+    def __init__(self, root, csv_path=None, warm_fn=None):
+        self.root = root
+        self.csv_path = csv_path
+        self.warm_fn = warm_fn
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.reloads = 0
+        self.last_error = None
+        self.loaded_at = None
+        self.current = self._load()
+
+    def _load(self, version=None):
+        if version is None and self.csv_path and os.path.exists(self.csv_path):
+            try:
+                ensure_snapshot(self.root, self.csv_path)
+            except OSError:
+                pass  # e.g. a read-only data dir: this worker parses the CSV itself
+        # Prefer the memory-mapped snapshot; parsing the CSV is the slow path
+        if version or current_version(self.root):
+            catalog = load_catalog(self.root, version)
+        elif self.csv_path:
+            catalog = Catalog(pd.read_csv(self.csv_path))
+        else:
+            raise FileNotFoundError(f"no catalog snapshot in {self.root} and no CSV to fall back to")
+        for meal in self.WARM_MEALS:
+            catalog.meal_mask(meal)
+        return catalog
+
+    def reload(self, version=None):
+        """Load, warm and swap in a version (default: CURRENT). Returns the new catalog."""
+        with self._reload_lock:
+            try:
+                catalog = self._load(version)
+                if self.warm_fn is not None:
+                    self.warm_fn(catalog)
+            except Exception as e:
+                self.last_error = repr(e)
+                raise
+            self.current = catalog
+            self.reloads += 1
+            self.last_error = None
+            self.loaded_at = time.time()
+            return catalog
+
+    def watch(self, interval_s):
+        """
+        Poll CURRENT and reload when it moves. Each check waits a random
+        part of the interval, so a fleet of workers does not swap (and go
+        cold) all at once.
+        """
+        if self._watcher is not None or interval_s <= 0:
+            return
+
+        def run():
+            while not self._stop.wait(interval_s * (0.5 + random.random())):
+                version = current_version(self.root)
+                if version and version != self.current.snapshot_version:
+                    try:
+                        self.reload(version)
+                    except Exception:
+                        pass  # keep serving the old version; last_error says why
+
+        self._watcher = threading.Thread(target=run, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def close(self):
+        self._stop.set()
+
+    def status(self):
+        catalog = self.current
+        return {
+            "version": catalog.snapshot_version,
+            "businesses": catalog.size,
+            "latest": current_version(self.root),
+            "reloads": self.reloads,
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the enriched business CSV into a catalog snapshot.")
+    parser.add_argument("csv", help="enriched business CSV")
+    parser.add_argument("out", help="snapshot root directory")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    print(f"Reading from {args.csv}...")
+    df = pd.read_csv(args.csv)
+    print(f"Building snapshot of {len(df)} businesses...")
+    path = write_snapshot(df, args.out, source=args.csv)
+    size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    print(f"Wrote {path} ({size / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+QuickBites: inverted index over the catalog's category tags.
+
+Keyword matching used to run a fresh whole-word regex over every business's
+joined categories on every request. Here the (lowercased) tags are interned
+once, each keyword is resolved against the tag vocabulary instead of the
+catalog, and the matching businesses come from the tags' posting lists.
+
+Matching is exactly cuisine_match / only_relevant_categories:
+    - a tag matches a keyword if `\\bkeyword\\b` is found in the lowercased tag
+    - a business matches if the keyword is found in its tags joined by " ",
+      which is the tag matches plus the (rare) keywords that span two tags
+"""
+
+import re
+
+import numpy as np
+
+from compute_content_score import keyword_pattern
+
+WORD_RE = re.compile(r"\w+")
+MAX_CACHED_KEYWORDS = 4096
+
+
+class CategoryIndex:
+    def __init__(self, catalog, postings=None, offsets=None):
+        self.catalog = catalog
+        self.size = catalog.size
+        self.terms = catalog.category_terms
+
+        # term id -> businesses, as one CSR-style array (prebuilt when the
+        # catalog comes from a snapshot)
+        if postings is None:
+            order = np.argsort(catalog.category_codes, kind="stable")
+            postings = catalog.category_rows[order]
+            counts = np.bincount(catalog.category_codes, minlength=len(self.terms))
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._postings = postings
+        self._offsets = offsets
+
+        # word token -> term ids containing it
+        self._word_terms = {}
+        for tid, term in enumerate(self.terms):
+            for w in set(WORD_RE.findall(term)):
+                self._word_terms.setdefault(w, []).append(tid)
+
+        self._keyword_terms = {}
+
+    def postings(self, term_id):
+        return self._postings[self._offsets[term_id]:self._offsets[term_id + 1]]
+
+    def matching_terms(self, keyword):
+        """Term ids whose tag text matches the (already lowercased) keyword."""
+        cached = self._keyword_terms.get(keyword)
+        if cached is not None:
+            return cached
+
+        pattern = keyword_pattern(keyword)
+        words = WORD_RE.findall(keyword)
+        if words:
+            # every word of a whole-word match is a whole word of the tag
+            candidates = set(self._word_terms.get(words[0], ()))
+            for w in words[1:]:
+                candidates.intersection_update(self._word_terms.get(w, ()))
+        else:
+            candidates = range(len(self.terms))
+        terms = frozenset(tid for tid in candidates if pattern.search(self.terms[tid]))
+
+        if len(self._keyword_terms) >= MAX_CACHED_KEYWORDS:
+            self._keyword_terms.clear()
+        self._keyword_terms[keyword] = terms
+        return terms
+
+    def _rows_for_words(self, words):
+        """Businesses that have every one of `words` somewhere in their tags."""
+        rows = None
+        for w in words:
+            tids = self._word_terms.get(w, ())
+            if not tids:
+                return np.empty(0, dtype=np.int64)
+            hit = np.unique(np.concatenate([self.postings(t) for t in tids]))
+            rows = hit if rows is None else np.intersect1d(rows, hit, assume_unique=True)
+        return rows
+
+    def keyword_rows(self, user_keywords):
+        """Sorted indices of businesses that cuisine_match any keyword."""
+        parts = []
+        for k in user_keywords:
+            k = (k or "").strip().lower()
+            if not k:
+                continue
+            parts.extend(self.postings(t) for t in self.matching_terms(k))
+            if " " in k:
+                # a keyword with a space can also match across two joined tags
+                words = WORD_RE.findall(k)
+                candidates = self._rows_for_words(words) if words else np.arange(self.size)
+                pattern = keyword_pattern(k)
+                text = self.catalog.category_text
+                parts.append(np.array([i for i in candidates if pattern.search(text[i])], dtype=np.int64))
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+    def cuisine_match(self, user_keywords):
+        """Array version of cuisine_match (1.0 / 0.0, or 0.5 for no keywords)."""
+        if not user_keywords:
+            return np.full(self.size, 0.5)
+        out = np.zeros(self.size)
+        out[self.keyword_rows(user_keywords)] = 1.0
+        return out
+
+    def relevant_categories(self, i, keywords):
+        """Same output as only_relevant_categories for business i."""
+        if not keywords:
+            return self.catalog.categories_raw[i]
+
+        matched = set()
+        for k in keywords:
+            if k:
+                matched |= self.matching_terms((k or "").strip().lower())
+        vocab = self.catalog.category_vocab
+        out = [c for c in self.catalog.categories[i] if vocab[c.lower()] in matched]
+        return ", ".join(out)
@@ -12,6 +12,7 @@ import math
 import re
 import json
 import ast
+from functools import lru_cache
 import pandas as pd
 
 
@@ -84,6 +85,12 @@ def get_price_level(attr_str):
             return None
 
 
+@lru_cache(maxsize=4096)
+def keyword_pattern(keyword):
+    """Compiled whole-word pattern for a (lowercased) keyword."""
+    return re.compile(rf"\b{re.escape(keyword)}\b")
+
+
 def tokenize_categories(categories_str):
     if not isinstance(categories_str, str) or not categories_str.strip():
         return []
@@ -105,7 +112,7 @@ def cuisine_match(user_keywords, categories_str):
         k = (k or "").strip().lower()
         if not k:
             continue
-        if re.search(rf"\b{re.escape(k)}\b", cats):
+        if keyword_pattern(k).search(cats):
             return 1.0
     return 0.0
 
@@ -228,10 +235,10 @@ def content_score(row_dict, user_keywords=None, user_max_price=None, meal=None,
         
         # Calculate session match (short term)
         short_term_events = user_profile.get("short_term", [])
+        event_cat_sets = [event_categories(event) for event in short_term_events]
         if short_term_events:
             event_match_score = 0.0
-            for event in short_term_events:
-                event_cats = set(c.lower() for c in tokenize_categories(event.get("categories", "")))
+            for event, event_cats in zip(short_term_events, event_cat_sets):
                 if cats_lower.intersection(event_cats):
                     event_match_score += event.get("weight", 0.0)
                 if event.get("price_level") == rest_price_level and rest_price_level is not None:
@@ -255,37 +262,53 @@ def content_score(row_dict, user_keywords=None, user_max_price=None, meal=None,
         
         final_score = clamp01(0.5 * baseline_score + 0.3 * session_match + 0.2 * longterm_match)
         
-        # Generate Explanation
-        if final_score > baseline_score + 0.05:
-            reasons = []
-            if session_match > 0.3:
-                # Find the most matching short-term category
-                matching_cats = set()
-                for event in short_term_events:
-                    event_cats = set(c.lower() for c in tokenize_categories(event.get("categories", "")))
-                    intersect = cats_lower.intersection(event_cats)
-                    if intersect:
-                        matching_cats.update(intersect)
-                if matching_cats:
-                    reasons.append(f"recently interacted with {list(matching_cats)[0]}")
-                elif rest_price_level is not None:
-                    reasons.append(f"recently viewed similar priced places")
-            
-            if longterm_match > 0.3 and lt_cuisine_norm > lt_price_norm:
-                # Find top long-term matching category
-                best_cat = max(cats_lower, key=lambda c: lt_cuisine.get(c, 0.0), default=None)
-                if best_cat and best_cat not in str(reasons):
-                    reasons.append(f"often prefer {best_cat}")
-            
-            if reasons:
-                explanation = "Boosted because you " + " and ".join(reasons)
-                
+        explanation = personal_explanation(
+            cats_lower, rest_price_level, event_cat_sets, lt_cuisine, baseline_score, final_score,
+            session_match, longterm_match, lt_cuisine_norm, lt_price_norm
+        )
         return final_score, explanation
 
     return baseline_score, None
 
 
 
+def event_categories(event):
+    """Lowercased category set of a short-term profile event."""
+    return set(c.lower() for c in tokenize_categories(event.get("categories", "")))
+
+
+def personal_explanation(cats_lower, rest_price_level, event_cat_sets, lt_cuisine, baseline_score, final_score,
+                         session_match, longterm_match, lt_cuisine_norm, lt_price_norm):
+    """
+    The "Boosted because you ..." text for a personalized score, or None.
+    event_cat_sets are the event_categories of the profile's short_term events.
+    """
+    explanation = None
+    if final_score > baseline_score + 0.05:
+        reasons = []
+        if session_match > 0.3:
+            # Find the most matching short-term category
+            matching_cats = set()
+            for event_cats in event_cat_sets:
+                intersect = cats_lower.intersection(event_cats)
+                if intersect:
+                    matching_cats.update(intersect)
+            if matching_cats:
+                reasons.append(f"recently interacted with {list(matching_cats)[0]}")
+            elif rest_price_level is not None:
+                reasons.append(f"recently viewed similar priced places")
+        
+        if longterm_match > 0.3 and lt_cuisine_norm > lt_price_norm:
+            # Find top long-term matching category
+            best_cat = max(cats_lower, key=lambda c: lt_cuisine.get(c, 0.0), default=None)
+            if best_cat and best_cat not in str(reasons):
+                reasons.append(f"often prefer {best_cat}")
+        
+        if reasons:
+            explanation = "Boosted because you " + " and ".join(reasons)
+    return explanation
+
+
 def only_relevant_categories(categories_str, keywords):
     """
     For readability: only keep category tags that match user's keywords.
@@ -298,7 +321,7 @@ def only_relevant_categories(categories_str, keywords):
     out = []
     for c in cats:
         c_low = c.lower()
-        if any(re.search(rf"\b{re.escape((k or '').strip().lower())}\b", c_low) for k in keywords if k):
+        if any(keyword_pattern((k or '').strip().lower()).search(c_low) for k in keywords if k):
             out.append(c)
     return ", ".join(out)
 
@@ -0,0 +1,44 @@
+"""
+Shared test data: the enriched CSV shipped in data/, a profile and a few
+queries, and the Catalog built from the CSV.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalog import Catalog
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/ca_business_enriched.csv")
+
+PROFILE = {
+    "user_id": "test_user_001",
+    "long_term": {
+        "cuisine": {"ramen": 12.0, "japanese": 30.0, "pizza": 8.0, "bars": 3.0},
+        "price_level": {"1": 4.0, "2": 15.0},
+    },
+    "short_term": [
+        {"business_id": "a", "event_type": "save", "weight": 5.0, "categories": "Ramen, Japanese", "price_level": 2},
+        {"business_id": "b", "event_type": "click", "weight": 1.0, "categories": "Pizza, Italian", "price_level": 1},
+        {"business_id": "c", "event_type": "skip", "weight": -1.0, "categories": None, "price_level": None},
+        {"business_id": "d", "event_type": "route_started", "weight": 10.0, "categories": "Sushi Bars", "price_level": 3},
+    ],
+}
+
+QUERIES = [
+    dict(user_keywords=[], user_max_price=None, meal=None),
+    dict(user_keywords=["ramen", "japanese"], user_max_price=2, meal="dinner"),
+    dict(user_keywords=["pizza"], user_max_price=1, meal="lunch"),
+    dict(user_keywords=["sushi bars", "c++"], user_max_price=4, meal="morning"),
+]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    df = pd.read_csv(CSV_PATH)
+    # a few rows with missing values, so the NaN handling is exercised too
+    df.loc[0, ["stars", "sent_pos_mean", "lunch_rate", "attributes", "categories"]] = np.nan
+    df.loc[1, "attributes"] = "{'RestaurantsPriceRange2': '2.0'}"
+    return Catalog(df)
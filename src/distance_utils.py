@@ -1,101 +1,674 @@
+import abc
+import asyncio
+import json
 import math
-import requests
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+import requests
+
+import metrics
+from spatial_index import geohash, haversine_km
 
-GOOGLE_KEY = os.environ["GOOGLE_KEY"]
 TAU_MIN = 10.0
 
-def distance_matrix_etas(origin_lat, origin_lon, destinations):
-    if origin_lat is None or origin_lon is None:
-        return [None] * len(destinations)
+# Rough straight-line -> driving conversion, used to pre-rank candidates
+# before paying for a Distance Matrix call
+ROAD_CIRCUITY = 1.3
+AVG_SPEED_KMH = 40.0
 
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    dest_str = "|".join(f"{d['latitude']},{d['longitude']}" for d in destinations)
-    params = {
-        "origins": f"{origin_lat},{origin_lon}",
-        "destinations": dest_str,
-        "mode": "driving",
-        "departure_time": "now",
-        "key": GOOGLE_KEY,
-    }
-    resp = requests.get(url, params=params, timeout=10)
-    resp.raise_for_status()
-    data = resp.json()
-
-    rows = data.get("rows", [])
-    if not rows:
-        return [None] * len(destinations)
 
-    etas = []
-    for el in rows[0]["elements"]:
-        if el.get("status") != "OK":
-            etas.append(None)
-            continue
-        dur = el.get("duration_in_traffic") or el.get("duration")
-        etas.append(dur["value"] / 60.0)
+def estimate_eta_minutes(km):
+    """Driving minutes estimated from great-circle km (scalar or array)."""
+    return km * ROAD_CIRCUITY / AVG_SPEED_KMH * 60.0
+
+
+def time_bucket(hour):
+    """Same 3 buckets as update_time_buckets.to_time_bucket_3."""
+    if 5 <= hour <= 10:
+        return "Morning"
+    elif 11 <= hour <= 15:
+        return "Lunch"
+    else:
+        return "Dinner"
+
+
+# ----------------------------
+# ETA providers
+# ----------------------------
+# Every provider answers matrix(origins, destinations) with one row per
+# origin and one column per destination, in minutes (None = no route).
+# Points are {"latitude": ..., "longitude": ...} dicts.
+
+class EtaProvider(abc.ABC):
+    name = "base"
+
+    @abc.abstractmethod
+    def matrix(self, origins, destinations):
+        """Minutes from each origin to each destination, as a list of rows."""
+
+    async def amatrix(self, origins, destinations):
+        """Async matrix(); by default the sync call runs on a worker thread."""
+        return await asyncio.to_thread(self.matrix, origins, destinations)
+
+    async def aclose(self):
+        pass
+
+
+class GoogleEtaProvider(EtaProvider):
+    """
+    Google Distance Matrix API. The key is only needed when a call is made.
+    Both the sync and the async path reuse keep-alive connections.
+    """
+    name = "google"
+    URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+    def __init__(self, key=None, mode="driving", timeout=10, max_connections=20):
+        self.key = key
+        self.mode = mode
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._session = requests.Session()
+        self._client = None
+
+    def _key(self):
+        key = self.key or os.environ.get("GOOGLE_KEY")
+        if not key:
+            raise RuntimeError("GOOGLE_KEY is not set; use ETA_PROVIDER=local or set the key")
+        return key
+
+    def _params(self, origins, destinations):
+        return {
+            "origins": "|".join(f"{o['latitude']},{o['longitude']}" for o in origins),
+            "destinations": "|".join(f"{d['latitude']},{d['longitude']}" for d in destinations),
+            "mode": self.mode,
+            "departure_time": "now",
+            "key": self._key(),
+        }
+
+    def matrix(self, origins, destinations):
+        resp = self._session.get(self.URL, params=self._params(origins, destinations), timeout=self.timeout)
+        resp.raise_for_status()
+        return self.parse(resp.json(), len(origins), len(destinations))
+
+    async def amatrix(self, origins, destinations):
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        resp = await self._client.get(self.URL, params=self._params(origins, destinations))
+        resp.raise_for_status()
+        return self.parse(resp.json(), len(origins), len(destinations))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def parse(data, n_origins, n_destinations):
+        rows = data.get("rows", [])
+        out = []
+        for i in range(n_origins):
+            elements = rows[i]["elements"] if i < len(rows) else []
+            etas = []
+            for j in range(n_destinations):
+                el = elements[j] if j < len(elements) else {}
+                if el.get("status") != "OK":
+                    etas.append(None)
+                    continue
+                dur = el.get("duration_in_traffic") or el.get("duration")
+                etas.append(dur["value"] / 60.0)
+            out.append(etas)
+        return out
+
+
+# Simulated upstream latency for the local provider (load tests), in ms
+LOCAL_ETA_LATENCY_MS = float(os.environ.get("ETA_LOCAL_LATENCY_MS", 0))
+LOCAL_ETA_JITTER_MS = float(os.environ.get("ETA_LOCAL_JITTER_MS", 0))
+
+
+class LocalEtaProvider(EtaProvider):
+    """
+    Offline estimate: haversine km * road circuity / speed, where the speed
+    depends on the time-of-day bucket of the departure. With latency_ms set,
+    every call also waits like a Distance Matrix round trip would
+    (normally distributed around latency_ms, with jitter_ms deviation).
+    """
+    name = "local"
+    DEFAULT_SPEEDS_KMH = {"Morning": 35.0, "Lunch": 40.0, "Dinner": 32.0}
+
+    def __init__(self, circuity=ROAD_CIRCUITY, speeds_kmh=None, clock=time.localtime,
+                 latency_ms=LOCAL_ETA_LATENCY_MS, jitter_ms=LOCAL_ETA_JITTER_MS):
+        self.circuity = circuity
+        self.speeds_kmh = dict(self.DEFAULT_SPEEDS_KMH, **(speeds_kmh or {}))
+        self.clock = clock
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+
+    def speed_kmh(self):
+        return self.speeds_kmh[time_bucket(self.clock().tm_hour)]
+
+    def delay_s(self):
+        if self.latency_ms <= 0:
+            return 0.0
+        return max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000.0
+
+    async def amatrix(self, origins, destinations):
+        delay = self.delay_s()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._estimate(origins, destinations)
+
+    def matrix(self, origins, destinations):
+        delay = self.delay_s()
+        if delay:
+            time.sleep(delay)
+        return self._estimate(origins, destinations)
+
+    def _estimate(self, origins, destinations):
+        minutes_per_km = self.circuity / self.speed_kmh() * 60.0
+        out = []
+        for o in origins:
+            etas = []
+            for d in destinations:
+                if None in (o["latitude"], o["longitude"], d["latitude"], d["longitude"]):
+                    etas.append(None)
+                    continue
+                km = haversine_km(o["latitude"], o["longitude"], d["latitude"], d["longitude"])
+                etas.append(float(km) * minutes_per_km)
+            out.append(etas)
+        return out
+
+
+def _point_key(p):
+    return f"{float(p['latitude'])!r},{float(p['longitude'])!r}"
+
+
+class RecordedEtaProvider(EtaProvider):
+    """
+    Replays ETAs from a fixture {"<origin lat,lon>|<dest lat,lon>": minutes}.
+    With a fallback provider, misses are fetched from it and recorded, so a
+    fixture can be captured once from Google and saved with save(). Without
+    one, a miss raises KeyError (and is counted in `misses`), so a stale
+    fixture fails loudly instead of replaying as "no route".
+    """
+    name = "recorded"
+
+    def __init__(self, recordings=None, fallback=None):
+        self.recordings = dict(recordings or {})
+        self.fallback = fallback
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, path, fallback=None):
+        with open(path, "r") as f:
+            return cls(json.load(f), fallback)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.recordings, f, indent=2, sort_keys=True)
+
+    def _lookup(self, origins, destinations):
+        keys = [[f"{_point_key(o)}|{_point_key(d)}" for d in destinations] for o in origins]
+        out = [[self.recordings.get(k) for k in row] for row in keys]
+        missing = [j for j in range(len(destinations)) if any(row[j] not in self.recordings for row in keys)]
+        if missing and self.fallback is None:
+            unrecorded = [row[j] for row in keys for j in missing if row[j] not in self.recordings]
+            self.misses += len(unrecorded)
+            raise KeyError(f"{len(unrecorded)} ETAs not in the fixture, e.g. {unrecorded[0]!r}")
+        return keys, out, missing
+
+    def _record(self, keys, out, missing, fetched):
+        for i, row in enumerate(keys):
+            for col, j in enumerate(missing):
+                out[i][j] = self.recordings[row[j]] = fetched[i][col]
+        return out
+
+    def matrix(self, origins, destinations):
+        keys, out, missing = self._lookup(origins, destinations)
+        if not missing:
+            return out
+        fetched = self.fallback.matrix(origins, [destinations[j] for j in missing])
+        return self._record(keys, out, missing, fetched)
+
+    async def amatrix(self, origins, destinations):
+        keys, out, missing = self._lookup(origins, destinations)
+        if not missing:
+            return out
+        fetched = await self.fallback.amatrix(origins, [destinations[j] for j in missing])
+        return self._record(keys, out, missing, fetched)
+
+
+PROVIDERS = {
+    "google": GoogleEtaProvider,
+    "local": LocalEtaProvider,
+}
+
+
+def provider_from_env():
+    """
+    ETA_PROVIDER=google|local|recorded (recorded reads ETA_FIXTURE).
+    Defaults to google when GOOGLE_KEY is set, local otherwise. The local
+    provider can stand in for Google under load with ETA_LOCAL_LATENCY_MS
+    (and ETA_LOCAL_JITTER_MS).
+    """
+    name = os.environ.get("ETA_PROVIDER") or ("google" if os.environ.get("GOOGLE_KEY") else "local")
+    if name == "recorded":
+        return RecordedEtaProvider.from_file(os.environ["ETA_FIXTURE"])
+    if name not in PROVIDERS:
+        raise ValueError(f"unknown ETA_PROVIDER {name!r}")
+    return PROVIDERS[name]()
+
+
+_provider = None
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        _provider = provider_from_env()
+    return _provider
+
+
+def set_provider(provider):
+    global _provider
+    _provider = provider
+
+
+# ----------------------------
+# ETA cache
+# ----------------------------
+# Key: (direction, origin geohash cell, business_id, departure bucket).
+# Users refreshing from the same block land in the same cell, so their
+# repeat lookups never leave the process.
+ETA_CACHE_SIZE = int(os.environ.get("ETA_CACHE_SIZE", 50_000))
+ETA_CACHE_TTL_S = float(os.environ.get("ETA_CACHE_TTL_S", 600))
+ORIGIN_CELL_PRECISION = 7  # ~150 m
+DEPARTURE_BUCKET_S = 15 * 60
+
+_MISSING = object()
+
+
+class EtaCache:
+    """Bounded LRU with a per-entry TTL. Thread-safe; counts hits and misses."""
+
+    def __init__(self, maxsize=ETA_CACHE_SIZE, ttl_s=ETA_CACHE_TTL_S, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, minutes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Cached minutes (may be None = no route), or _MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return _MISSING
+
+    def put(self, key, minutes):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl_s, minutes)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+eta_cache = EtaCache()
+
+
+def eta_cache_key(direction, origin, destination, now=None):
+    now = time.time() if now is None else now
+    dest_id = destination.get("business_id") or _point_key(destination)
+    cell = geohash(float(origin["latitude"]), float(origin["longitude"]), ORIGIN_CELL_PRECISION)
+    return (direction, cell, dest_id, int(now // DEPARTURE_BUCKET_S))
+
+
+def _cache_lookup(origin, destinations, direction, cache):
+    now = time.time()
+    keys = [eta_cache_key(direction, origin, d, now) for d in destinations]
+    etas = [cache.get(k) for k in keys]
+    missing = [j for j, eta in enumerate(etas) if eta is _MISSING]
+    return keys, etas, missing
+
+
+def _cache_fill(keys, etas, missing, fetched, direction, cache):
+    if direction == "to":
+        fetched = [row[0] for row in fetched]
+    else:
+        fetched = fetched[0]
+    for j, eta in zip(missing, fetched):
+        etas[j] = eta
+        cache.put(keys[j], eta)
     return etas
 
 
-def commute_etas(home_lat, home_lon, work_lat, work_lon, destinations):
+ETA_UPSTREAM_CALLS = metrics.counter(
+    "quickbites_eta_upstream_calls_total", "ETA provider calls.", ["provider"])
+ETA_UPSTREAM_ERRORS = metrics.counter(
+    "quickbites_eta_upstream_errors_total", "ETA provider calls that failed.", ["provider"])
+ETA_UPSTREAM_SECONDS = metrics.histogram(
+    "quickbites_eta_upstream_seconds", "ETA provider call latency.", ["provider"])
+ETA_BATCH_DESTINATIONS = metrics.histogram(
+    "quickbites_eta_batch_destinations", "Destinations per ETA provider call.",
+    buckets=(1, 2, 5, 10, 15, 20, 25, 50, 100))
+ETA_TIMEOUTS = metrics.counter(
+    "quickbites_eta_timeouts_total", "ETA lookups given up on after the timeout (ETAs came back as None).")
+ETA_LOOKUP_ERRORS = metrics.counter(
+    "quickbites_eta_lookup_errors_total", "ETA lookups whose upstream call failed (ETAs came back as None).")
+
+
+def _count_upstream(provider, destinations):
+    ETA_UPSTREAM_CALLS.labels(provider.name).inc()
+    ETA_BATCH_DESTINATIONS.observe(destinations)
+    return ETA_UPSTREAM_SECONDS.labels(provider.name).time()
+
+
+def _leg_request(origin, batch, direction):
+    """(origins, destinations) for the provider call of one leg."""
+    return ([origin], batch) if direction == "from" else (batch, [origin])
+
+
+def cached_leg(origin, destinations, direction="from", provider=None, cache=None):
     """
-    Call 1: home -> each restaurant
-    Call 2: each restaurant -> work
+    ETAs origin -> each destination ("from") or each destination -> origin
+    ("to"). Only the destinations missing from the cache go to the provider,
+    in a single batch.
+    """
+    provider = provider or get_provider()
+    cache = cache or eta_cache
+    keys, etas, missing = _cache_lookup(origin, destinations, direction, cache)
+    if not missing:
+        return etas
+    batch = [destinations[j] for j in missing]
+    try:
+        with _count_upstream(provider, len(batch)):
+            fetched = provider.matrix(*_leg_request(origin, batch, direction))
+    except Exception:
+        ETA_UPSTREAM_ERRORS.labels(provider.name).inc()
+        raise
+    return _cache_fill(keys, etas, missing, fetched, direction, cache)
+
+
+# ----------------------------
+# Coalescing / micro-batching
+# ----------------------------
+# Concurrent /recommend calls from nearby origins ask for overlapping
+# restaurants. Lookups are keyed like the cache; a key already in flight is
+# awaited instead of requested again, and keys for the same origin cell that
+# arrive within ETA_BATCH_WINDOW_S are packed into shared upstream calls of
+# up to ETA_BATCH_SIZE destinations (the Distance Matrix per-call limit).
+ETA_BATCH_SIZE = int(os.environ.get("ETA_BATCH_SIZE", 25))
+ETA_BATCH_WINDOW_S = float(os.environ.get("ETA_BATCH_WINDOW_S", 0.01))
+ETA_MAX_QPS = float(os.environ.get("ETA_MAX_QPS", 50))      # 0 = no limit
+ETA_BURST = int(os.environ.get("ETA_BURST", 10))
+
+
+class RateLimiter:
+    """Async token bucket: `rate` calls per second with bursts up to `burst`."""
+
+    def __init__(self, rate=ETA_MAX_QPS, burst=ETA_BURST, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock
+        self._tokens = float(self.burst)
+        self._last = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1.0:
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+                self._last = self.clock()
+                self._tokens = 0.0
+            else:
+                self._tokens -= 1.0
+
+
+class EtaBatcher:
+    """Per event loop; see get_batcher()."""
+
+    def __init__(self, batch_size=ETA_BATCH_SIZE, window_s=ETA_BATCH_WINDOW_S, limiter=None):
+        self.batch_size = batch_size
+        self.window_s = window_s
+        self.limiter = limiter or RateLimiter()
+        self._inflight = {}  # cache key -> Future
+        self._pending = {}   # group -> [origin, [(key, destination), ...]]
+        self._timers = {}    # group -> TimerHandle
+        self.upstream_calls = 0
+        self.destinations_sent = 0
+        self.coalesced = 0
+
+    async def lookup(self, origin, destinations, keys, direction, provider, cache):
+        loop = asyncio.get_running_loop()
+        futures = []
+        for key, dest in zip(keys, destinations):
+            fut = self._inflight.get(key)
+            if fut is None:
+                fut = self._inflight[key] = loop.create_future()
+                self._enqueue(loop, (direction, key[1], key[3], id(provider)), origin, key, dest, provider, cache)
+            else:
+                self.coalesced += 1
+            futures.append(fut)
+        # shielded: a caller timing out must not cancel lookups others share.
+        # If it has gone, nobody awaits the gather, so retrieve its error here.
+        gathered = asyncio.gather(*futures)
+        gathered.add_done_callback(_retrieve_exception)
+        return await asyncio.shield(gathered)
+
+    def _enqueue(self, loop, group, origin, key, dest, provider, cache):
+        entry = self._pending.setdefault(group, [origin, provider, cache, []])
+        entry[3].append((key, dest))
+        if len(entry[3]) >= self.batch_size:
+            self._flush(group)
+        elif group not in self._timers:
+            self._timers[group] = loop.call_later(self.window_s, self._flush, group)
+
+    def _flush(self, group):
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        entry = self._pending.pop(group, None)
+        if entry is None:
+            return
+        origin, provider, cache, items = entry
+        direction = group[0]
+        for start in range(0, len(items), self.batch_size):
+            asyncio.ensure_future(self._send(origin, items[start:start + self.batch_size], direction, provider, cache))
+
+    async def _send(self, origin, items, direction, provider, cache):
+        keys = [key for key, _ in items]
+        try:
+            await self.limiter.acquire()
+            self.upstream_calls += 1
+            self.destinations_sent += len(items)
+            with _count_upstream(provider, len(items)):
+                fetched = await provider.amatrix(*_leg_request(origin, [d for _, d in items], direction))
+            etas = [row[0] for row in fetched] if direction == "to" else fetched[0]
+            for key, eta in zip(keys, etas):
+                cache.put(key, eta)
+                self._inflight.pop(key).set_result(eta)
+        except Exception as e:
+            ETA_UPSTREAM_ERRORS.labels(provider.name).inc()
+            for key in keys:
+                fut = self._inflight.pop(key, None)
+                if fut is not None and not fut.done():
+                    fut.set_exception(e)
+
+    def stats(self):
+        return {
+            "upstream_calls": self.upstream_calls,
+            "destinations_sent": self.destinations_sent,
+            "coalesced": self.coalesced,
+            "mean_batch_size": self.destinations_sent / self.upstream_calls if self.upstream_calls else 0.0,
+            "in_flight": len(self._inflight),
+        }
+
+
+def _retrieve_exception(fut):
+    if not fut.cancelled():
+        fut.exception()
+
+
+_batchers = {}
+
+
+def get_batcher():
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        _batchers.clear()  # an old loop's batcher is of no use any more
+        batcher = _batchers[loop] = EtaBatcher()
+    return batcher
+
+
+async def cached_leg_async(origin, destinations, direction="from", provider=None, cache=None, timeout=None):
+    """
+    Async cached_leg, with uncached lookups coalesced and batched across
+    concurrent requests. If they are not answered within `timeout` seconds,
+    or the upstream call fails, the uncached ETAs come back as None instead
+    of failing the request.
+    """
+    provider = provider or get_provider()
+    cache = cache or eta_cache
+    keys, etas, missing = _cache_lookup(origin, destinations, direction, cache)
+    if not missing:
+        return etas
+    batcher = get_batcher()
+    try:
+        fetched = await asyncio.wait_for(
+            batcher.lookup(origin, [destinations[j] for j in missing], [keys[j] for j in missing],
+                           direction, provider, cache),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        ETA_TIMEOUTS.inc()
+        return [None if eta is _MISSING else eta for eta in etas]
+    except Exception:
+        ETA_LOOKUP_ERRORS.inc()  # the upstream error itself is counted by the batcher
+        return [None if eta is _MISSING else eta for eta in etas]
+    for j, eta in zip(missing, fetched):
+        etas[j] = eta
+    return etas
+
+
+# ----------------------------
+# ETA helpers used by the API
+# ----------------------------
+def distance_matrix_etas(origin_lat, origin_lon, destinations, provider=None):
+    if origin_lat is None or origin_lon is None:
+        return [None] * len(destinations)
+    if not destinations:
+        return []
+
+    origin = {"latitude": origin_lat, "longitude": origin_lon}
+    return cached_leg(origin, destinations, "from", provider)
+
+
+def commute_etas(home_lat, home_lon, work_lat, work_lon, destinations, provider=None):
+    """
+    Leg 1: home -> each restaurant
+    Leg 2: each restaurant -> work
     Returns total commute time through each restaurant
     """
     if not all([home_lat, home_lon, work_lat, work_lon]):
         return [None] * len(destinations)
+    if not destinations:
+        return []
 
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    dest_str = "|".join(f"{d['latitude']},{d['longitude']}" for d in destinations)
-    orig_str = "|".join(f"{d['latitude']},{d['longitude']}" for d in destinations)
-
-    # Call 1: home -> all restaurants
-    params1 = {
-        "origins": f"{home_lat},{home_lon}",
-        "destinations": dest_str,
-        "mode": "driving",
-        "departure_time": "now",
-        "key": GOOGLE_KEY,
-    }
-    # Call 2: all restaurants -> work
-    params2 = {
-        "origins": orig_str,
-        "destinations": f"{work_lat},{work_lon}",
-        "mode": "driving",
-        "departure_time": "now",
-        "key": GOOGLE_KEY,
-    }
-
-    resp1 = requests.get(url, params=params1, timeout=10)
-    resp2 = requests.get(url, params=params2, timeout=10)
-    resp1.raise_for_status()
-    resp2.raise_for_status()
-
-    rows1 = resp1.json().get("rows", [])
-    rows2 = resp2.json().get("rows", [])
-
-    if not rows1 or not rows2:
-        return [None] * len(destinations)
+    home = {"latitude": home_lat, "longitude": home_lon}
+    work = {"latitude": work_lat, "longitude": work_lon}
+
+    home_etas = cached_leg(home, destinations, "from", provider)  # home -> each restaurant
+    work_etas = cached_leg(work, destinations, "to", provider)    # each restaurant -> work
+
+    return _sum_legs(home_etas, work_etas)
 
-    home_elements = rows1[0]["elements"]       # home -> each restaurant
-    work_elements = [r["elements"][0] for r in rows2]  # each restaurant -> work
 
+def _sum_legs(home_etas, work_etas):
     totals = []
-    for home_el, work_el in zip(home_elements, work_elements):
-        if home_el.get("status") != "OK" or work_el.get("status") != "OK":
+    for home_eta, work_eta in zip(home_etas, work_etas):
+        if home_eta is None or work_eta is None:
             totals.append(None)
             continue
-        home_dur = home_el.get("duration_in_traffic") or home_el.get("duration")
-        work_dur = work_el.get("duration_in_traffic") or work_el.get("duration")
-        totals.append((home_dur["value"] + work_dur["value"]) / 60.0)
-    print("HOME:", home_lat, home_lon)
-    print("WORK:", work_lat, work_lon)
-    print("rows1 length:", len(rows1))
-    print("rows2 length:", len(rows2))
-    print("sample home element:", rows1[0]["elements"][0])
-    print("sample work element:", rows2[0]["elements"][0])
+        totals.append(home_eta + work_eta)
     return totals
 
 
+# Per upstream call, for the async path
+ETA_TIMEOUT_S = float(os.environ.get("ETA_TIMEOUT_S", 3.0))
+
+
+async def distance_matrix_etas_async(origin_lat, origin_lon, destinations, provider=None, timeout=None):
+    timeout = ETA_TIMEOUT_S if timeout is None else timeout
+    if origin_lat is None or origin_lon is None:
+        return [None] * len(destinations)
+    if not destinations:
+        return []
+
+    origin = {"latitude": origin_lat, "longitude": origin_lon}
+    return await cached_leg_async(origin, destinations, "from", provider, timeout=timeout)
+
+
+async def commute_etas_async(home_lat, home_lon, work_lat, work_lon, destinations, provider=None, timeout=None):
+    """commute_etas with both legs fetched concurrently."""
+    timeout = ETA_TIMEOUT_S if timeout is None else timeout
+    if not all([home_lat, home_lon, work_lat, work_lon]):
+        return [None] * len(destinations)
+    if not destinations:
+        return []
+
+    home = {"latitude": home_lat, "longitude": home_lon}
+    work = {"latitude": work_lat, "longitude": work_lon}
+    home_etas, work_etas = await asyncio.gather(
+        cached_leg_async(home, destinations, "from", provider, timeout=timeout),
+        cached_leg_async(work, destinations, "to", provider, timeout=timeout),
+    )
+    return _sum_legs(home_etas, work_etas)
+
+
+async def aclose():
+    """Close pooled connections of the active provider (app shutdown)."""
+    if _provider is not None:
+        await _provider.aclose()
+
+
 def eta_decay(eta_minutes, tau=TAU_MIN):
-    return math.exp(-eta_minutes / tau)
\ No newline at end of file
+    return math.exp(-eta_minutes / tau)
@@ -0,0 +1,252 @@
+"""
+QuickBites: build ca_business_enriched.csv from review sentiment, locally.
+
+Does what the parsing_data notebooks do after sentiment inference, in one
+command. Inputs:
+
+- the sentiment part files (part_*.csv: review_id, business_id, date, pos,
+  neu, neg, label, ...)
+- the time-bucketed reviews written by update_time_buckets.py
+  (--buckets), or else the buckets of the parts' own dates
+- the business file the features are joined onto
+
+Each input file is reduced to per-business partial sums (read in chunks,
+one group-by per chunk) on a process pool. Each partial is saved as a
+checkpoint under --work, so an interrupted or repeated run only redoes the
+files that are new or changed. The partials are then summed and turned
+into the columns content_score reads (n_reviews, sent_*_mean, *_rate,
+n_*_reviews), merged onto the businesses and written atomically. With
+--snapshot, a catalog snapshot is built from the result as well.
+
+    python enrich.py --business data/oc_business.csv --sentiment data/review_sentiment_parts \\
+        --buckets data/review_buckets --state CA --out data/ca_business_enriched.csv --snapshot data/catalog
+
+n_reviews and the sentiment columns count the sentiment rows; the time
+buckets count the bucketed reviews. The two cover the same reviews when
+the sentiment was run over the whole review file, as in the notebooks.
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from update_time_buckets import CHUNK_ROWS, bucket_codes, read_manifest, read_part
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+WORK_DIR = os.path.join(base_dir, "data", "enrich_work")
+SENTIMENT_STATS = [
+    "rows", "reviews", "pos_sum", "pos_n", "neu_sum", "neu_n", "neg_sum", "neg_n",
+    "n_positive", "n_neutral", "n_negative",
+]
+BUCKET_STATS = ["n_morning", "n_lunch", "n_dinner"]  # in update_time_buckets.BUCKETS order
+FEATURES = [
+    "n_reviews", "sent_pos_mean", "sent_neu_mean", "sent_neg_mean", "pos_rate", "neu_rate", "neg_rate",
+    "n_dinner_reviews", "n_lunch_reviews", "n_morning_reviews", "morning_rate", "lunch_rate", "dinner_rate",
+]
+
+
+def sentiment_sums(path, chunk_rows=CHUNK_ROWS):
+    """
+    Per-business SENTIMENT_STATS and BUCKET_STATS (of the parts' dates) of
+    one part file. The buckets are always counted, so a checkpoint serves
+    runs with and without --buckets.
+    """
+    partials = []
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype={"business_id": str, "review_id": str}):
+        chunk = chunk[chunk["business_id"].notna()]
+        frame = pd.DataFrame({"business_id": chunk["business_id"], "rows": 1, "reviews": chunk["review_id"].notna()})
+        for col in ("pos", "neu", "neg"):
+            frame[f"{col}_sum"] = chunk[col].fillna(0.0)
+            frame[f"{col}_n"] = chunk[col].notna()
+        for label in ("positive", "neutral", "negative"):
+            frame[f"n_{label}"] = chunk["label"] == label.upper()
+        hours = pd.to_datetime(chunk["date"], errors="coerce").dt.hour.to_numpy(dtype=np.float64, na_value=np.nan)
+        codes = bucket_codes(hours)
+        for k, stat in enumerate(BUCKET_STATS):
+            frame[stat] = codes == k
+        partials.append(frame.groupby("business_id", sort=False).sum())
+    return _combine(partials, SENTIMENT_STATS + BUCKET_STATS)
+
+
+def bucket_sums(directory, part):
+    """Per-business BUCKET_STATS of one update_time_buckets part."""
+    columns = read_part(directory, part, ["business_id", "time_bucket"])
+    codes = np.asarray(columns["time_bucket"])
+    frame = pd.DataFrame({"business_id": columns["business_id"].astype(str)})
+    for k, stat in enumerate(BUCKET_STATS):
+        frame[stat] = codes == k
+    return _combine([frame.groupby("business_id", sort=False).sum()], BUCKET_STATS)
+
+
+def _combine(partials, stats):
+    if not partials:
+        return pd.DataFrame(columns=stats, dtype=np.float64)
+    return pd.concat(partials).groupby(level=0, sort=False).sum()[stats].astype(np.float64)
+
+
+def _checkpoint(work, kind, source):
+    digest = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:10]
+    return os.path.join(work, f"{kind}-{os.path.basename(source.rstrip(os.sep))}-{digest}.npz")
+
+
+def _stamp(source):
+    st = os.stat(source)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def load_checkpoint(path, source):
+    """The saved partial for source, or None if missing or stale."""
+    try:
+        saved = np.load(path, allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    if not np.array_equal(saved["stamp"], _stamp(source)):
+        return None
+    return pd.DataFrame(saved["stats"], index=saved["business_id"].astype(str), columns=saved["columns"].astype(str))
+
+
+def save_checkpoint(path, source, sums):
+    tmp = f"{path}.tmp.npz"
+    np.savez(
+        tmp,
+        stamp=_stamp(source),
+        business_id=sums.index.to_numpy().astype("S"),
+        columns=np.array(sums.columns, dtype="S"),
+        stats=sums.to_numpy(np.float64),
+    )
+    os.replace(tmp, path)
+
+
+def run_task(task):
+    """One input file to its partial (a worker function): returns (task, checkpoint path, resumed)."""
+    kind, source, args, work = task
+    path = _checkpoint(work, kind, source)
+    if load_checkpoint(path, source) is not None:
+        return task, path, True
+    if kind == "sentiment":
+        sums = sentiment_sums(source, *args)
+    else:
+        sums = bucket_sums(*args)
+    save_checkpoint(path, source, sums)
+    return task, path, False
+
+
+def business_features(sentiment, buckets):
+    """The FEATURES columns per business, from the summed partials (notebook semantics)."""
+    f = pd.DataFrame(index=sentiment.index)
+    f["n_reviews"] = sentiment["reviews"].astype(np.int64)
+    for col in ("pos", "neu", "neg"):
+        f[f"sent_{col}_mean"] = sentiment[f"{col}_sum"] / sentiment[f"{col}_n"].where(sentiment[f"{col}_n"] > 0)
+    for col, label in (("pos", "positive"), ("neu", "neutral"), ("neg", "negative")):
+        f[f"{col}_rate"] = sentiment[f"n_{label}"] / sentiment["rows"]
+    counts = buckets.reindex(sentiment.index).fillna(0).astype(np.int64)
+    for meal in ("dinner", "lunch", "morning"):
+        f[f"n_{meal}_reviews"] = counts[f"n_{meal}"]
+    for meal in ("morning", "lunch", "dinner"):
+        f[f"{meal}_rate"] = f[f"n_{meal}_reviews"] / f["n_reviews"]
+    f.index.name = "business_id"
+    return f[FEATURES].reset_index()
+
+
+def enrich(business_csv, sentiment_dir, out, buckets_dir=None, state=None, work=WORK_DIR, jobs=None,
+           chunk_rows=CHUNK_ROWS, log=print):
+    """Run the pipeline; returns the enriched DataFrame (also written to out)."""
+    parts = sorted(glob.glob(os.path.join(sentiment_dir, "part_*.csv")))
+    if not parts:
+        raise FileNotFoundError(f"no part_*.csv in {sentiment_dir}")
+    os.makedirs(work, exist_ok=True)
+    tasks = [("sentiment", p, (chunk_rows,), work) for p in parts]
+    if buckets_dir is not None:
+        manifest = read_manifest(buckets_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"no time bucket manifest in {buckets_dir}")
+        tasks += [
+            ("buckets", os.path.join(buckets_dir, p["name"]), (buckets_dir, p["name"]), work)
+            for p in manifest["parts"]
+        ]
+
+    jobs = jobs or os.cpu_count() or 1
+    results, resumed = [], 0
+    if jobs == 1:
+        done = (run_task(t) for t in tasks)
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        done = (f.result() for f in as_completed([pool.submit(run_task, t) for t in tasks]))
+    try:
+        for i, (task, path, was_resumed) in enumerate(done, 1):
+            results.append((task, path))
+            resumed += was_resumed
+            if i % max(1, len(tasks) // 10) == 0 or i == len(tasks):
+                log(f"  {i}/{len(tasks)} files reduced ({resumed} from checkpoints)")
+    finally:
+        if jobs != 1:
+            pool.shutdown()
+
+    # checkpoints of inputs that are gone (e.g. parts of an older time bucket build)
+    current = {os.path.basename(path) for _, path in results}
+    for name in os.listdir(work):
+        if name.endswith(".npz") and name not in current:
+            os.remove(os.path.join(work, name))
+
+    sums = {"sentiment": [], "buckets": []}
+    for task, path in results:
+        partial = load_checkpoint(path, task[1])
+        if partial is None:
+            # the input changed (or its checkpoint went) since it was reduced: redo it
+            log(f"  {task[1]} changed during the run, reducing it again")
+            run_task(task)
+            partial = load_checkpoint(path, task[1])
+            if partial is None:
+                raise RuntimeError(f"{task[1]} keeps changing; rerun when it is complete")
+        sums[task[0]].append(partial)
+    sentiment = _combine(sums["sentiment"], SENTIMENT_STATS + BUCKET_STATS)
+    buckets = sentiment[BUCKET_STATS] if buckets_dir is None else _combine(sums["buckets"], BUCKET_STATS)
+    features = business_features(sentiment, buckets)
+
+    biz = pd.read_csv(business_csv, dtype={"business_id": str})
+    if state:
+        biz = biz[biz["state"] == state]
+    enriched = biz.merge(features, on="business_id", how="left")
+    tmp = f"{out}.tmp"
+    enriched.to_csv(tmp, index=False)
+    os.replace(tmp, out)
+    return enriched
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the enriched business catalog from review sentiment.")
+    parser.add_argument("--business", required=True, help="business CSV (oc_business.csv)")
+    parser.add_argument("--sentiment", required=True, help="directory of sentiment part_*.csv files")
+    parser.add_argument("--buckets", default=None, help="update_time_buckets.py columnar output (default: bucket the parts' dates)")
+    parser.add_argument("--state", default=None, help="keep only businesses in this state, e.g. CA")
+    parser.add_argument("--out", required=True, help="enriched CSV to write")
+    parser.add_argument("--work", default=WORK_DIR, help="checkpoint directory")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--snapshot", default=None, help="also build a catalog snapshot under this directory")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        enriched = enrich(
+            args.business, args.sentiment, args.out, args.buckets, args.state, args.work, args.jobs, args.chunk_rows
+        )
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    matched = int(enriched["n_reviews"].notna().sum())
+    print(f"Wrote {args.out}: {len(enriched)} businesses, {matched} with reviews, in {time.perf_counter() - start:.1f}s")
+    if args.snapshot:
+        from catalog_snapshot import write_snapshot
+        print(f"Built snapshot {write_snapshot(enriched, args.snapshot, source=args.out)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+QuickBites: append-only interaction log with group commit + checkpoints.
+
+Request handlers apply an event to the in-memory profile and append() it
+here, which only puts it on a queue. A single writer thread drains the
+queue, writes every queued record as one JSON line, and flushes + fsyncs
+once per batch (group commit), so a burst of clicks costs one fsync instead
+of one full profile rewrite each.
+
+Every CHECKPOINT_EVERY records (or CHECKPOINT_INTERVAL_S seconds) the
+writer calls checkpoint_fn, which persists the state somewhere else (the
+profile store) and returns the seq it covers. The log records that seq
+atomically (tmp file + os.replace), starts a new log segment, and deletes
+segments the checkpoint fully covers. On startup the state is whatever was
+persisted plus a replay of the log records after the checkpoint.
+
+Files in the log directory:
+    checkpoint.json        {"seq": <last seq covered by the checkpoint>}
+    log.<first seq>.jsonl  one {"seq": n, ...record} per line
+"""
+
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+CHECKPOINT_EVERY = 1000
+CHECKPOINT_INTERVAL_S = 30.0
+MAX_BATCH = 4096
+
+_STOP = object()
+
+
+def write_json_atomic(path, obj):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class InteractionLog:
+    """
+    `checkpoint_fn()` must make every record up to some seq durable outside
+    the log and return that seq. It is called from the writer thread.
+    """
+
+    def __init__(self, directory, checkpoint_fn=None, checkpoint_every=CHECKPOINT_EVERY,
+                 checkpoint_interval_s=CHECKPOINT_INTERVAL_S):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.checkpoint_path = os.path.join(directory, "checkpoint.json")
+        self.checkpoint_fn = checkpoint_fn
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval_s = checkpoint_interval_s
+
+        self._queue = queue.Queue()
+        self._seq_lock = threading.Lock()
+        self.seq = self._last_seq()
+        self.written_seq = self.seq
+        self._written = threading.Condition()
+        self._file = None
+        self._thread = None
+        self.batches = 0
+        self.records_written = 0
+        self.checkpoint_errors = 0
+        self.last_error = None
+
+    # --- reading ---
+    def _segments(self):
+        """Log segments as (first seq, path), oldest first."""
+        out = []
+        for path in glob.glob(os.path.join(self.directory, "log.*.jsonl")):
+            try:
+                out.append((int(os.path.basename(path).split(".")[1]), path))
+            except ValueError:
+                continue
+        return sorted(out)
+
+    def checkpoint_seq(self):
+        """Seq covered by the latest checkpoint, or 0."""
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                return int(json.load(f)["seq"])
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def replay(self, after_seq=0):
+        """Records with seq > after_seq, in order. A torn last line is skipped."""
+        for _, path in self._segments():
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("seq", 0) > after_seq:
+                        yield record
+
+    def _last_seq(self):
+        last = self.checkpoint_seq()
+        segments = self._segments()
+        if segments:
+            for record in self.replay(after_seq=segments[-1][0] - 1):
+                last = max(last, record["seq"])
+        return last
+
+    # --- writing ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="interaction-log", daemon=True)
+            self._thread.start()
+        return self
+
+    def append(self, record):
+        """Queue a record; returns its seq. Durable once written_seq >= seq."""
+        with self._seq_lock:
+            self.seq += 1
+            seq = self.seq
+            # put under the lock so the queue (and the file) stay in seq order
+            self._queue.put(dict(record, seq=seq))
+        return seq
+
+    def wait_durable(self, seq, timeout=None):
+        with self._written:
+            return self._written.wait_for(lambda: self.written_seq >= seq, timeout)
+
+    def flush(self, timeout=None):
+        return self.wait_durable(self.seq, timeout)
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _open_segment(self, first_seq):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(os.path.join(self.directory, f"log.{first_seq}.jsonl"), "a")
+
+    def _run(self):
+        since_checkpoint = 0
+        last_checkpoint = time.monotonic()
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self._queue.get(timeout=self.checkpoint_interval_s)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [r for r in batch if r is not _STOP]
+
+            if batch:
+                self._write_batch(batch)
+                since_checkpoint += len(batch)
+
+            due = since_checkpoint >= self.checkpoint_every or (
+                since_checkpoint and time.monotonic() - last_checkpoint >= self.checkpoint_interval_s
+            )
+            if self.checkpoint_fn is not None and (due or (stopping and since_checkpoint)):
+                try:
+                    self._checkpoint()
+                    since_checkpoint = 0
+                except Exception as e:
+                    # the log still has everything; try again next time
+                    self.checkpoint_errors += 1
+                    self.last_error = repr(e)
+                last_checkpoint = time.monotonic()
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_batch(self, batch):
+        if self._file is None:
+            self._open_segment(batch[0]["seq"])
+        self._file.write("".join(json.dumps(r) + "\n" for r in batch))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.batches += 1
+        self.records_written += len(batch)
+        with self._written:
+            self.written_seq = max(self.written_seq, max(r["seq"] for r in batch))
+            self._written.notify_all()
+
+    def _checkpoint(self):
+        seq = self.checkpoint_fn()
+        write_json_atomic(self.checkpoint_path, {"seq": seq})
+
+        # new records go to a fresh segment; drop segments the checkpoint covers
+        self._open_segment(self.written_seq + 1)
+        segments = self._segments()
+        for (first, path), (next_first, _) in zip(segments, segments[1:]):
+            if next_first - 1 <= seq:
+                os.remove(path)
+
+    def stats(self):
+        return {
+            "seq": self.seq,
+            "written_seq": self.written_seq,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "records_written": self.records_written,
+            "checkpoint_errors": self.checkpoint_errors,
+        }
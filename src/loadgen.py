@@ -0,0 +1,348 @@
+"""
+QuickBites: HTTP load generator that replays the iOS client's traffic.
+
+Each virtual user does what the app does: a /recommend with the search
+form's parameters (keywords, price, meal, vegan, open_now, personalize,
+location, origin, distance_weight), then a few /interact events on the
+results it got back, with a think time in between.
+
+Closed loop by default: --concurrency users, each sending its next request
+as soon as the last one returns. With --rate, sessions instead arrive at
+that many per second (Poisson), at most --concurrency in flight, so the
+offered load does not drop when the server slows down.
+
+Against a running server:
+    python loadgen.py --url http://127.0.0.1:8000 --concurrency 50 --duration 60
+
+Or let it start the servers, with the local ETA provider standing in for
+the Distance Matrix (--eta-latency-ms of simulated upstream time). --spawn
+takes a list and runs once per entry, e.g. to find how many workers a
+lunchtime peak needs:
+    python loadgen.py --spawn 1,2,4 --rate 40 --meal lunch --duration 30
+
+Spawned workers are separate single-process servers, each with its own
+interaction log and profile DB, with requests spread round-robin.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(base_dir, "data/ca_business_enriched.csv")
+
+KEYWORDS = ["", "pizza", "mexican", "sushi", "ramen,japanese", "burgers", "coffee", "thai", "vegan", "sandwiches",
+            "chinese", "bars", "breakfast & brunch", "italian", "seafood"]
+MEALS = ["", "breakfast", "lunch", "dinner"]
+# (event_type, weight): most result rows get a tap, few get a route
+EVENT_MIX = [("click", 0.6), ("details_view", 0.2), ("save", 0.08), ("route_started", 0.04), ("skip", 0.08)]
+LOCATION_JITTER_DEG = 0.01
+SPAWN_PORT = 8100
+READY_TIMEOUT_S = 120
+HISTOGRAM_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class Stats:
+    """Latencies and errors per endpoint."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed):
+        out = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            ms = np.array(samples) * 1000
+            counts = np.histogram(ms, bins=[0] + HISTOGRAM_MS + [np.inf])[0]
+            out[endpoint] = {
+                "requests": len(ms),
+                "errors": self.errors.get(endpoint, 0),
+                "throughput": len(ms) / elapsed,
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+                # requests with latency <= each bound (the last is +Inf)
+                "histogram": dict(zip([str(b) for b in HISTOGRAM_MS] + ["+Inf"], np.cumsum(counts).tolist())),
+            }
+        return {"elapsed_s": elapsed, "endpoints": out}
+
+
+class Client:
+    """One iOS client session at a time, round-robin over the target servers."""
+
+    def __init__(self, http, urls, stats, args, origins, window):
+        self.http = http
+        self.urls = urls
+        self.stats = stats
+        self.args = args
+        self.origins = origins
+        self.window = window  # (start, end): requests sent outside it are not recorded
+        self._next = 0
+
+    def url(self, path):
+        self._next = (self._next + 1) % len(self.urls)
+        return self.urls[self._next] + path
+
+    async def timed(self, endpoint, send):
+        start = time.perf_counter()
+        try:
+            response = await send()
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        if self.window[0] <= start < self.window[1]:
+            self.stats.record(endpoint, time.perf_counter() - start, ok)
+        return response if ok else None
+
+    def recommend_params(self, rng, user_id):
+        a = self.args
+        lat, lon = self.origins[rng.integers(len(self.origins))]
+        params = {
+            "keywords": rng.choice(KEYWORDS),
+            "max_price": int(rng.integers(1, 5)),
+            "vegan": str(rng.random() < 0.1).lower(),
+            "open_now": str(rng.random() < 0.3).lower(),
+            "personalize": str(rng.random() < a.personalize).lower(),
+            "lat": lat + rng.normal(0, LOCATION_JITTER_DEG),
+            "lon": lon + rng.normal(0, LOCATION_JITTER_DEG),
+            "origin": "commute" if rng.random() < a.commute else "current",
+            "distance_weight": round(float(rng.choice(np.arange(0, 11)) / 10), 1),
+        }
+        meal = a.meal if a.meal is not None else rng.choice(MEALS)
+        if meal:
+            params["meal"] = meal
+        if user_id is not None:
+            params["user_id"] = user_id
+        return params
+
+    async def session(self, rng, user_id):
+        """One search followed by a few interactions on its results."""
+        response = await self.timed(
+            "/recommend", lambda: self.http.get(self.url("/recommend"), params=self.recommend_params(rng, user_id))
+        )
+        results = response.json() if response is not None else []
+        if not isinstance(results, list) or not results:
+            return
+        types, weights = zip(*EVENT_MIX)
+        for _ in range(rng.poisson(self.args.interactions)):
+            await self.think(rng)
+            r = results[rng.integers(len(results))]
+            body = {"business_id": r["business_id"], "event_type": rng.choice(types, p=weights)}
+            if r.get("matched_categories"):
+                body["categories"] = r["matched_categories"]
+            if r.get("price_level") is not None:
+                body["price_level"] = r["price_level"]
+            if user_id is not None:
+                body["user_id"] = user_id
+            await self.timed("/interact", lambda: self.http.post(self.url("/interact"), json=body))
+        await self.think(rng)
+
+    async def think(self, rng):
+        if self.args.think_ms > 0:
+            await asyncio.sleep(rng.exponential(self.args.think_ms / 1000.0))
+
+
+def user_of(rng, users):
+    # no user_id at all is what the app sends today (the default user)
+    return f"load_user_{rng.integers(users):06d}" if users > 0 else None
+
+
+async def closed_loop(client, args, deadline):
+    async def user(i):
+        rng = np.random.default_rng(args.seed + i)
+        while time.perf_counter() < deadline:
+            await client.session(rng, user_of(rng, args.users))
+    await asyncio.gather(*(user(i) for i in range(args.concurrency)))
+
+
+async def open_loop(client, args, deadline):
+    rng = np.random.default_rng(args.seed)
+    slots = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+    dropped = 0
+
+    async def run(seed):
+        try:
+            await client.session(np.random.default_rng(seed), user_of(rng, args.users))
+        finally:
+            slots.release()
+
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(rng.exponential(1.0 / args.rate))
+        if slots.locked():
+            dropped += 1  # all slots busy: the server is not keeping up
+            continue
+        await slots.acquire()
+        task = asyncio.ensure_future(run(int(rng.integers(1 << 31))))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    return dropped
+
+
+async def drive(urls, args, origins):
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as http:
+        measure_from = time.perf_counter() + args.warmup
+        deadline = measure_from + args.duration
+        client = Client(http, urls, stats, args, origins, (measure_from, deadline))
+        dropped = 0
+        if args.rate:
+            dropped = await open_loop(client, args, deadline)
+        else:
+            await closed_loop(client, args, deadline)
+    report = stats.report(args.duration)
+    report["dropped_sessions"] = dropped
+    return report
+
+
+def load_origins(path, city):
+    """Coordinates of the city's businesses, where simulated users stand."""
+    df = pd.read_csv(path, usecols=["city", "latitude", "longitude"]).dropna()
+    city = city or df["city"].mode().iat[0]
+    df = df[df["city"].str.lower() == city.lower()]
+    if df.empty:
+        raise SystemExit(f"no businesses in {city!r}")
+    return city, list(zip(df["latitude"].astype(float), df["longitude"].astype(float)))
+
+
+def start_server(port, **env):
+    """
+    Start one single-process API server on port, with its own interaction
+    log and profile DB and `env` on top of ours; returns (url, process).
+    """
+    state = tempfile.mkdtemp(prefix=f"quickbites-{port}-")
+    env = dict(
+        os.environ,
+        INTERACTION_LOG_DIR=os.path.join(state, "interactions"),
+        PROFILE_DB=os.path.join(state, "profiles.db"),
+        **env,
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=base_dir, env=env,
+    )
+    return f"http://127.0.0.1:{port}", proc
+
+
+def spawn_servers(n, args):
+    """Start n single-process API servers; returns (urls, processes)."""
+    os.environ.pop("GOOGLE_KEY", None)  # the spawned servers must not call Google
+    procs, urls = [], []
+    for i in range(n):
+        url, proc = start_server(
+            args.port + i,
+            ETA_PROVIDER="local",
+            ETA_LOCAL_LATENCY_MS=str(args.eta_latency_ms),
+            ETA_LOCAL_JITTER_MS=str(args.eta_jitter_ms),
+        )
+        urls.append(url)
+        procs.append(proc)
+    wait_until_up(urls, procs)
+    return urls, procs
+
+
+def wait_until_up(urls, procs):
+    """Block until every server answers; stops them all if one does not."""
+    deadline = time.monotonic() + READY_TIMEOUT_S
+    for url, proc in zip(urls, procs):
+        while True:
+            if proc.poll() is not None:
+                stop_servers(procs)
+                raise SystemExit(f"server for {url} exited with {proc.returncode}")
+            try:
+                if httpx.get(url + "/cache/stats", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                stop_servers(procs)
+                raise SystemExit(f"server for {url} did not come up")
+            time.sleep(0.2)
+
+
+def stop_servers(procs):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def print_report(label, report):
+    print(f"\n== {label}: {report['elapsed_s']:.1f}s measured, {report['dropped_sessions']} sessions dropped")
+    print(f"{'endpoint':<12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, s in report["endpoints"].items():
+        print(f"{endpoint:<12} {s['requests']:>9} {s['errors']:>7} {s['throughput']:>9.1f} {s['p50_ms']:>9.1f} "
+              f"{s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay iOS client traffic against the QuickBites API.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", action="append", help="server to load (repeat for several)")
+    target.add_argument("--spawn", help="comma-separated worker counts to start and load in turn")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users (max in flight with --rate)")
+    parser.add_argument("--rate", type=float, default=0, help="session arrivals per second (open loop)")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds run before measuring")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean pause between a user's requests")
+    parser.add_argument("--interactions", type=float, default=3, help="mean /interact events per /recommend")
+    parser.add_argument("--users", type=int, default=0, help="distinct user_ids (0: none, like the app today)")
+    parser.add_argument("--meal", default=None, help="fix the meal (e.g. lunch); default: the app's mix")
+    parser.add_argument("--personalize", type=float, default=0.3, help="share of personalized searches")
+    parser.add_argument("--commute", type=float, default=0.1, help="share of commute-origin searches")
+    parser.add_argument("--city", default=None, help="where users are (default: the biggest city in the CSV)")
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--eta-latency-ms", type=float, default=150, help="simulated Distance Matrix latency")
+    parser.add_argument("--eta-jitter-ms", type=float, default=50)
+    parser.add_argument("--port", type=int, default=SPAWN_PORT, help="first port for spawned servers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write the report(s) as JSON")
+    args = parser.parse_args(argv)
+
+    city, origins = load_origins(args.csv, args.city)
+    print(f"{len(origins)} origins in {city}; "
+          + (f"{args.rate}/s sessions, max {args.concurrency} in flight" if args.rate
+             else f"{args.concurrency} closed-loop users"))
+
+    reports = {}
+    if args.spawn:
+        for n in [int(s) for s in args.spawn.split(",") if s]:
+            urls, procs = spawn_servers(n, args)
+            try:
+                reports[f"{n} workers"] = asyncio.run(drive(urls, args, origins))
+            finally:
+                stop_servers(procs)
+            print_report(f"{n} workers", reports[f"{n} workers"])
+    else:
+        urls = [u.rstrip("/") for u in (args.url or ["http://127.0.0.1:8000"])]
+        reports[", ".join(urls)] = asyncio.run(drive(urls, args, origins))
+        print_report(", ".join(urls), reports[", ".join(urls)])
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "runs": reports}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+QuickBites: in-process counters and latency histograms, rendered in the
+Prometheus text format by the /metrics endpoint.
+
+Cheap enough for the request path: an observation is a bisect and a few
+additions under a per-series lock. Values the services already count
+(cache hits, log batches) are not duplicated here; a collector reads them
+at scrape time instead.
+
+    SCORE = metrics.histogram("quickbites_stage_seconds", "...", ["endpoint", "stage"])
+    with SCORE.labels("recommend", "scan").time():
+        ...
+"""
+
+import asyncio
+import functools
+import math
+import threading
+import time
+from bisect import bisect_left
+
+# seconds; from a cache hit to a slow upstream ETA call
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(v):
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return repr(v)
+
+
+class _Timer:
+    __slots__ = ("series", "start")
+
+    def __init__(self, series):
+        self.series = series
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.series.observe(time.perf_counter() - self.start)
+
+
+class _CounterSeries:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class _HistogramSeries:
+    __slots__ = ("buckets", "counts", "sum", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the wall time of its block."""
+        return _Timer(self)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The series for these label values (in labelnames order)."""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, series in sorted(self._series.items()):
+            lines.extend(self._render_series(values, series))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount=1):
+        """For a counter without labels."""
+        self.labels().inc(amount)
+
+    def _render_series(self, values, series):
+        yield f"{self.name}{_label_text(self.labelnames, values)} {_number(series.value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value):
+        """For a histogram without labels."""
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _render_series(self, values, series):
+        with series.lock:
+            counts, total = list(series.counts), series.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = (("le", _number(float(bound))),)
+            yield f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}"
+        labels = _label_text(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_number(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing  # a module imported twice shares its series
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, fn):
+        """
+        Register fn() -> [(name, kind, help, [(labels dict, value), ...])],
+        called at every scrape for values kept elsewhere (e.g. cache stats).
+        """
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            for name, kind, help, samples in fn():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_label_text(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+collector = REGISTRY.collector
+render = REGISTRY.render
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def timed(series):
+    """Decorator observing each call's wall time (sync or async functions)."""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with series.time():
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with series.time():
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorate
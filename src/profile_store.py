@@ -0,0 +1,196 @@
+"""
+QuickBites: per-user profile store, an in-memory LRU over SQLite.
+
+Profiles are keyed by user_id. Hot profiles live in memory, split over
+SHARDS independent LRU shards (each with its own lock), so writes for
+different users rarely touch the same lock. SQLite is the durable backend.
+It is written in bulk by checkpoint(), which the interaction log calls from
+its writer thread, so the request path never writes to the database.
+
+Profiles are copy-on-write: update() applies a change to a copy and swaps
+it in, so a profile returned by get() is never mutated afterwards and can
+be read without holding a lock.
+
+Every profile carries the seq of the last log record applied to it, which
+doubles as its version. Replay after a crash skips records a profile has
+already seen, so a checkpoint does not need a global pause: it only has to
+cover every record up to the seq it returns.
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", "10000"))
+SHARDS = 16
+
+
+class _Shard:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.profiles = OrderedDict()  # user_id -> (profile, seq)
+        self.dirty = set()
+        self.writing = set()  # swapped out of dirty by a checkpoint that has not committed yet
+
+
+class ProfileStore:
+    """
+    `apply_fn(profile, record)` applies a log record in place (or returns a
+    replacement profile); `default_fn(user_id)` builds a new user's profile.
+    """
+
+    def __init__(self, db_path, apply_fn, default_fn, log=None, capacity=PROFILE_CACHE_SIZE, shards=SHARDS):
+        self.db_path = db_path
+        self.apply_fn = apply_fn
+        self.default_fn = default_fn
+        self.log = log
+        self._shards = [_Shard(max(1, capacity // shards)) for _ in range(shards)]
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.checkpoints = 0
+
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                "user_id TEXT PRIMARY KEY, profile TEXT NOT NULL, seq INTEGER NOT NULL)"
+            )
+
+    def _db(self):
+        """One connection per thread (WAL lets readers run next to the writer)."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30)
+            # FULL: a checkpoint's commit is on disk before the log records
+            # it covers and deletes its segments (NORMAL skips that fsync in
+            # WAL mode). Only checkpoint() writes, so it is one fsync each.
+            db.execute("PRAGMA synchronous=FULL")
+            self._local.db = db
+        return db
+
+    def _shard(self, user_id):
+        return self._shards[zlib.crc32(user_id.encode()) % len(self._shards)]
+
+    def _load(self, user_id):
+        row = self._db().execute(
+            "SELECT profile, seq FROM profiles WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return self.default_fn(user_id), 0
+        return json.loads(row[0]), row[1]
+
+    def _entry(self, shard, user_id):
+        """(profile, seq) for user_id; call with shard.lock held."""
+        entry = shard.profiles.get(user_id)
+        if entry is not None:
+            shard.profiles.move_to_end(user_id)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = self._load(user_id)
+        shard.profiles[user_id] = entry
+        self._evict(shard)
+        return entry
+
+    def _evict(self, shard):
+        # dirty profiles stay until a checkpoint has committed them, or a
+        # reload would read the old row back from SQLite
+        if len(shard.profiles) <= shard.capacity:
+            return
+        for user_id in list(shard.profiles):
+            if len(shard.profiles) <= shard.capacity:
+                break
+            if user_id not in shard.dirty and user_id not in shard.writing:
+                del shard.profiles[user_id]
+
+    def get(self, user_id):
+        """The user's profile. Treat it as read-only."""
+        return self.get_versioned(user_id)[0]
+
+    def get_versioned(self, user_id):
+        """(profile, version); the version changes whenever the profile does."""
+        shard = self._shard(user_id)
+        with shard.lock:
+            return self._entry(shard, user_id)
+
+    def update(self, user_id, records):
+        """Apply records to the user's profile and log them; returns the new profile."""
+        shard = self._shard(user_id)
+        with shard.lock:
+            profile, seq = self._entry(shard, user_id)
+            profile = copy.deepcopy(profile)
+            for record in records:
+                profile = self.apply_fn(profile, record) or profile
+            # dirty before the records get a seq, so a checkpoint covering
+            # that seq is sure to pick this profile up
+            shard.dirty.add(user_id)
+            if self.log is not None:
+                for record in records:
+                    seq = self.log.append(dict(record, user_id=user_id))
+            shard.profiles[user_id] = (profile, seq)
+        return profile
+
+    def replay(self, records):
+        """Re-apply log records after a restart, skipping ones already applied."""
+        for record in records:
+            user_id = record["user_id"]
+            shard = self._shard(user_id)
+            with shard.lock:
+                profile, seq = self._entry(shard, user_id)
+                if record["seq"] <= seq:
+                    continue
+                profile = self.apply_fn(profile, record) or profile
+                shard.profiles[user_id] = (profile, record["seq"])
+                shard.dirty.add(user_id)
+
+    def checkpoint(self):
+        """
+        Write every dirty profile to SQLite; returns the log seq covered.
+        Profiles being written stay pinned in memory until the commit, and
+        go back to dirty if it fails.
+        """
+        covered = self.log.seq if self.log is not None else 0
+        rows = []
+        for shard in self._shards:
+            with shard.lock:
+                shard.writing |= shard.dirty
+                shard.dirty = set()
+                for user_id in shard.writing:
+                    profile, seq = shard.profiles[user_id]
+                    rows.append((user_id, json.dumps(profile), seq))
+        try:
+            if rows:
+                with self._db() as db:
+                    db.executemany(
+                        "INSERT INTO profiles (user_id, profile, seq) VALUES (?, ?, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET profile = excluded.profile, seq = excluded.seq",
+                        rows,
+                    )
+        except sqlite3.Error:
+            for shard in self._shards:
+                with shard.lock:
+                    shard.dirty |= shard.writing
+                    shard.writing = set()
+            raise
+        for shard in self._shards:
+            with shard.lock:
+                shard.writing = set()
+        self.checkpoints += 1
+        return covered
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "cached": sum(len(s.profiles) for s in self._shards),
+            "dirty": sum(len(s.dirty) for s in self._shards),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "checkpoints": self.checkpoints,
+        }
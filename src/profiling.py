@@ -0,0 +1,302 @@
+"""
+QuickBites: opt-in request profiling.
+
+A request is profiled when it asks for it (X-Profile: 1 plus a matching
+X-Admin-Token; never when no ADMIN_TOKEN is set) or when it is picked by
+sampling (a sample_rate share of /recommend and /search calls). Profiled
+requests run their CPU work under cProfile, and the result is a
+per-function breakdown (calls, self and total time).
+
+Asked-for profiles are always saved, and the response carries
+X-Profile-Id. One asked for while another profile is running is not taken;
+its response carries X-Profile-Skipped: busy instead. Sampled ones are
+saved only if the request took at least slow_ms. Saved profiles go to a
+bounded ring on disk (PROFILE_DIR, read when the ring is made; newest
+PROFILE_RING_SIZE kept). Each one is a .json breakdown next to a .prof
+file that pstats or snakeviz can open. The stored query string has the
+user id, coordinates and page token taken out.
+
+cProfile only sees the thread it runs in. Only code wrapped in section()
+or @profiled is measured: the scoring that runs in the thread pool, and
+sync handlers. Time spent awaiting (ETA lookups) shows up only in the wall
+time.
+
+Only one cProfile runs in the process at a time: since Python 3.12 a
+profiler hooks the whole interpreter, and enabling a second one raises. A
+section that starts while another is profiling (another request, or a
+scoring shard thread of the same one) just runs unprofiled, and the report
+counts it in skipped_sections. With PROFILE_MAX_ACTIVE = 1 that is mostly
+the shard threads, whose time then shows up as waiting in the caller.
+"""
+
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pstats
+import random
+import secrets
+import threading
+import time
+import urllib.parse
+
+import anyio
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/profiles")
+PROFILE_RING_SIZE = int(os.environ.get("PROFILE_RING_SIZE", "50"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "500"))
+PROFILE_MAX_ACTIVE = 1  # profiled requests at once; others just run
+PROFILE_TOP = 40        # functions kept in a breakdown
+SAMPLED_PATHS = ("/recommend", "/search")
+PRIVATE_PARAMS = frozenset(("user_id", "lat", "lon", "min_lat", "min_lon", "max_lat", "max_lon", "page_token"))
+
+_current = contextvars.ContextVar("quickbites_profile", default=None)
+_thread = threading.local()  # .active: a section is profiling this thread
+_enabled = threading.Lock()  # held by the one cProfile running in the process
+
+
+def scrub_query(query):
+    """A query string without the parameters that identify or locate a user."""
+    pairs = urllib.parse.parse_qsl(query, keep_blank_values=True)
+    return urllib.parse.urlencode([(k, v) for k, v in pairs if k not in PRIVATE_PARAMS])
+
+
+class RequestProfile:
+    """The profilers of one request's sections (one per section, each on its own thread)."""
+
+    def __init__(self, method, path, query, requested):
+        now = time.time()
+        # sorts by time, which is the order the ring drops them in
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(now))}.{int(now % 1 * 1e6):06d}-{secrets.token_hex(4)}"
+        self.method = method
+        self.path = path
+        self.query = query
+        self.requested = requested
+        self.started = time.perf_counter()
+        self.wall_ms = None
+        self.skipped_sections = 0
+        self._profilers = []
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            profilers = list(self._profilers)
+        if not profilers:
+            return None
+        stats = pstats.Stats(profilers[0])
+        for p in profilers[1:]:
+            stats.add(p)
+        return stats
+
+    def breakdown(self, top=PROFILE_TOP):
+        """The top functions by total time, as dicts."""
+        stats = self.stats()
+        if stats is None:
+            return []
+        rows = []
+        for (file, line, name), (_, calls, self_s, total_s, _) in stats.stats.items():
+            where = f"{os.path.basename(file)}:{line}" if line else file
+            rows.append({
+                "function": f"{where}({name})",
+                "calls": calls,
+                "self_ms": self_s * 1000,
+                "total_ms": total_s * 1000,
+            })
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return rows[:top]
+
+    def report(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "requested": self.requested,
+            "wall_ms": self.wall_ms,
+            "skipped_sections": self.skipped_sections,
+            "functions": self.breakdown(),
+        }
+
+
+class section:
+    """
+    Profile the enclosed block if the current request is being profiled.
+    A section nested in another on the same thread is already covered by it;
+    one that starts while another thread is profiling is skipped (it never
+    waits, so a profiled caller waiting on its shard threads cannot deadlock).
+    """
+
+    __slots__ = ("profiler",)
+
+    def __enter__(self):
+        profile = _current.get()
+        self.profiler = None
+        if profile is None or getattr(_thread, "active", False):
+            return self
+        if not _enabled.acquire(blocking=False):
+            with profile._lock:
+                profile.skipped_sections += 1
+            return self
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # some other tool is profiling the interpreter
+            _enabled.release()
+            with profile._lock:
+                profile.skipped_sections += 1
+            return self
+        self.profiler = profiler
+        with profile._lock:
+            profile._profilers.append(profiler)
+        _thread.active = True
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.disable()
+            _thread.active = False
+            _enabled.release()
+
+
+def profiled(fn):
+    """Run a sync function as a section()."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return fn(*args, **kwargs)
+        with section():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class ProfileRing:
+    """The newest `size` saved profiles in a directory."""
+
+    def __init__(self, directory=None, size=PROFILE_RING_SIZE):
+        # read when the ring is made, not at import: tests and tools set it late
+        self.directory = directory or os.environ.get("PROFILE_DIR", DEFAULT_PROFILE_DIR)
+        self.size = size
+        self._lock = threading.Lock()
+
+    def save(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, profile.id)
+        stats = profile.stats()
+        if stats is not None:
+            stats.dump_stats(path + ".prof")
+        with open(path + ".json.tmp", "w") as f:
+            json.dump(profile.report(), f, indent=1)
+        os.replace(path + ".json.tmp", path + ".json")
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            ids = self.list()
+            for old in ids[self.size:]:
+                for ext in (".json", ".prof"):
+                    try:
+                        os.remove(os.path.join(self.directory, old + ext))
+                    except FileNotFoundError:
+                        pass
+
+    def list(self):
+        """Saved profile ids, newest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((n[:-5] for n in names if n.endswith(".json")), reverse=True)
+
+    def load(self, profile_id):
+        """A saved report, or None (ids are checked, so no path tricks)."""
+        if profile_id not in self.list():
+            return None
+        with open(os.path.join(self.directory, profile_id + ".json"), "r") as f:
+            return json.load(f)
+
+
+class Profiler:
+    """Which requests get profiled, and where their profiles go."""
+
+    def __init__(self, admin_token=None, ring=None, sample_rate=PROFILE_SAMPLE_RATE, slow_ms=PROFILE_SLOW_MS):
+        self.admin_token = admin_token
+        self.ring = ring or ProfileRing()
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.active = 0
+        self.captured = 0
+        self.busy = 0  # asked-for profiles not taken because another one was running
+
+    def requested(self, headers):
+        """Whether the request asked to be profiled (and may: only with the admin token)."""
+        if not self.admin_token or headers.get(b"x-profile") not in (b"1", b"true"):
+            return False
+        token = headers.get(b"x-admin-token", b"")
+        return secrets.compare_digest(token, self.admin_token.encode())
+
+    def sampled(self, path):
+        return self.sample_rate > 0 and path in SAMPLED_PATHS and random.random() < self.sample_rate
+
+    def status(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "active": self.active,
+            "captured": self.captured,
+            "busy": self.busy,
+            "directory": self.ring.directory,
+            "ring_size": self.ring.size,
+        }
+
+
+def _with_header(send, name, value):
+    """An ASGI send that adds a header to the response."""
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            message["headers"] = list(message.get("headers", [])) + [(name, value)]
+        await send(message)
+    return wrapped
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that runs the requests picked by `profiler` under a
+    RequestProfile. The rest only pay for a header scan and a random() call.
+    """
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        requested = profiler.requested(dict(scope.get("headers") or ()))
+        if not (requested or profiler.sampled(scope["path"])):
+            return await self.app(scope, receive, send)
+        if profiler.active >= PROFILE_MAX_ACTIVE:
+            if not requested:
+                return await self.app(scope, receive, send)
+            # tell the caller why there is no X-Profile-Id
+            profiler.busy += 1
+            return await self.app(scope, receive, _with_header(send, b"x-profile-skipped", b"busy"))
+
+        query = scrub_query(scope.get("query_string", b"").decode("latin-1"))
+        profile = RequestProfile(scope["method"], scope["path"], query, requested)
+
+        if requested:
+            send = _with_header(send, b"x-profile-id", profile.id.encode())
+        profiler.active += 1
+        token = _current.set(profile)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            profiler.active -= 1
+            profile.wall_ms = (time.perf_counter() - profile.started) * 1000
+            if requested or profile.wall_ms >= profiler.slow_ms:
+                profiler.captured += 1
+                await anyio.to_thread.run_sync(profiler.ring.save, profile)
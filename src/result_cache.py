@@ -0,0 +1,157 @@
+"""
+QuickBites: versioned cache of ranked results for /recommend and /search.
+
+Keys are built from the normalized request parameters plus the catalog
+version and, for anything that reads the profile, the user's profile
+version. A stale entry can therefore never be served: a new catalog or a
+profile change makes new keys. Invalidating a user after a profile change
+just frees their now-unreachable entries early.
+
+/recommend caches the content ranking only (the candidates before ETA
+lookup); ETAs are fetched and blended per request on top of it.
+
+PageStore holds the server side of cursor pagination: the state needed to
+serve the next page of a ranking, under an opaque random token.
+"""
+
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "4096"))
+PAGE_STORE_SIZE = int(os.environ.get("PAGE_STORE_SIZE", "10000"))
+PAGE_TTL_S = float(os.environ.get("PAGE_TTL_S", "300"))
+LOCATION_DECIMALS = 3  # ~110 m
+
+
+def coarse(value, decimals=LOCATION_DECIMALS):
+    """Coordinate rounded for cache keys (None stays None)."""
+    return None if value is None else round(float(value), decimals)
+
+
+def normalize_keywords(keywords):
+    """Keyword matching ignores case and order, so the key does too."""
+    return tuple(sorted({k.strip().lower() for k in keywords if k and k.strip()}))
+
+
+class ResultCache:
+    """Bounded LRU keyed by request; entries can be tagged with a user_id."""
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (user_id, value)
+        self._by_user = {}  # user_id -> keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Cached value, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, user_id=None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (user_id, value)
+            if user_id is not None:
+                self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[0] is not None:
+            keys = self._by_user.get(entry[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry[0]]
+
+    def invalidate_user(self, user_id):
+        """Drop every entry that depends on user_id's profile."""
+        with self._lock:
+            for key in self._by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+                self.invalidations += 1
+
+    def recent_keys(self, n):
+        """Keys of up to n shared (not per-user) entries, most recently used first."""
+        with self._lock:
+            out = []
+            for key in reversed(self._entries):
+                if self._entries[key][0] is None:
+                    out.append(key)
+                    if len(out) >= n:
+                        break
+            return out
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "users": len(self._by_user),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class PageStore:
+    """Bounded LRU of page states with a TTL, keyed by page token."""
+
+    def __init__(self, maxsize=PAGE_STORE_SIZE, ttl_s=PAGE_TTL_S, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.clock = clock
+        self._entries = OrderedDict()  # token -> (expires_at, state)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, state):
+        """Store a page state; returns its token."""
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            self._entries[token] = (self.clock() + self.ttl_s, state)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return token
+
+    def get(self, token):
+        """The state for a token, or None if it is unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[0] > self.clock():
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[token]
+            self.misses += 1
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
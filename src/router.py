@@ -0,0 +1,459 @@
+"""
+QuickBites: geographic catalog shards behind a scatter-gather router.
+
+The catalog is split by region (a geohash prefix, or the state), each
+region is written as its own snapshot, and each snapshot is served by a
+plain api.py process (CATALOG_DIR=<shards>/<name>). The router sends
+/recommend only to the shards whose area meets the user's viewport, radius
+or location, and /search to all of them. It queries them in parallel and
+merges their pages by score. Shards are written with the whole catalog's
+review count in the quality score, so scores from different shards
+compare.
+
+A bare location (no radius or viewport) is routed to the shards within
+ROUTE_RADIUS_KM only when distance_weight is at least
+ROUTE_MIN_DISTANCE_WEIGHT. A business that far away has a distance decay
+of about zero, so it keeps at most (1 - distance_weight) of its content
+score. It can then only outrank a nearby one whose score is much lower, and
+the router leaves it out on purpose: its answer can differ from one node's
+that way. Below the threshold the content score dominates, and the query
+goes to every shard, so the answer matches one node's.
+
+Split a catalog:
+    python router.py split data/ca_business_enriched.csv data/shards --geohash 4
+
+Route to running shards (one name=url per shard in shards.json):
+    SHARDS_DIR=data/shards SHARD_URLS=9q4g=http://10.0.0.5:8000,... uvicorn router:app
+
+Or start one local process per shard plus the router, e.g. for tests:
+    python router.py serve data/shards --port 8080
+
+Paging: each shard keeps its own page state; the router's page token holds
+every shard's next token and the results fetched but not yet served. Other
+endpoints are proxied: reads go to the first shard that answers, writes
+(interactions, saved locations, admin calls) to every shard, so each one
+personalizes from the same profile. A write that some shard did not take
+is answered with a 502 naming them, since profiles would otherwise drift
+apart silently; retrying it repeats it on the shards that did take it. A
+shard that fails or times out is left out of a /recommend or /search
+answer, and named in X-Shards-Unavailable.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+import metrics
+from catalog_snapshot import write_snapshot
+from result_cache import PageStore
+from spatial_index import geohash, haversine_km, radius_bbox
+
+MANIFEST = "shards.json"
+SHARDS_DIR = os.environ.get("SHARDS_DIR")
+SHARD_URLS = os.environ.get("SHARD_URLS", "")
+SHARD_TIMEOUT_S = float(os.environ.get("SHARD_TIMEOUT_S", "5"))
+ROUTE_RADIUS_KM = float(os.environ.get("ROUTE_RADIUS_KM", "50"))  # shards considered near a bare location
+ROUTE_MIN_DISTANCE_WEIGHT = float(os.environ.get("ROUTE_MIN_DISTANCE_WEIGHT", "0.5"))  # below: every shard
+DEFAULT_DISTANCE_WEIGHT = 0.5  # as in api.py
+DEFAULT_PAGE_SIZE = 10  # as in api.py
+MAX_PAGE_SIZE = 50
+MAX_RESULTS = 100  # api.py's RECOMMEND_DEPTH and SEARCH_DEPTH: no query pages further than one node would
+UNLOCATED = "unlocated"  # shard of the rows without coordinates
+SHARD_PORT = 8200
+
+
+def split_catalog(df, precision=None):
+    """
+    {shard name: rows of df} by geohash prefix of `precision` characters,
+    or by state when precision is None.
+    """
+    lat, lon = df["latitude"].to_numpy(float), df["longitude"].to_numpy(float)
+    located = ~(np.isnan(lat) | np.isnan(lon))
+    if precision is None:
+        keys = df["state"].fillna(UNLOCATED).astype(str).to_numpy(object)
+    else:
+        keys = np.full(len(df), UNLOCATED, dtype=object)
+        cells = {}
+        for i in np.flatnonzero(located):
+            point = (lat[i], lon[i])
+            if point not in cells:
+                cells[point] = geohash(lat[i], lon[i], precision)
+            keys[i] = cells[point]
+    return {key: df[keys == key] for key in sorted(set(keys))}
+
+
+def write_shards(df, out, precision=None):
+    """Write one snapshot per shard under out/<name>, plus the shards.json they are routed by."""
+    max_reviews = df["review_count"].max()
+    shards = []
+    for name, part in split_catalog(df, precision).items():
+        write_snapshot(part, os.path.join(out, name), max_reviews=0 if pd.isna(max_reviews) else max_reviews)
+        lat, lon = part["latitude"], part["longitude"]
+        bbox = None if lat.isna().all() else [float(v) for v in (lat.min(), lon.min(), lat.max(), lon.max())]
+        shards.append({"name": name, "rows": len(part), "bbox": bbox})
+    with open(os.path.join(out, MANIFEST), "w") as f:
+        json.dump({"geohash": precision, "shards": shards}, f, indent=1)
+    return shards
+
+
+def _bbox_distance_km(lat, lon, bbox):
+    min_lat, min_lon, max_lat, max_lon = bbox
+    return haversine_km(lat, lon, min(max(lat, min_lat), max_lat), min(max(lon, min_lon), max_lon))
+
+
+class ShardMap:
+    """Which shards (by index into `shards`) cover an area."""
+
+    def __init__(self, shards, urls):
+        missing = [s["name"] for s in shards if s["name"] not in urls]
+        if missing:
+            raise ValueError(f"no URL for shards {missing}")
+        self.shards = shards
+        self.urls = [urls[s["name"]] for s in shards]
+
+    @classmethod
+    def load(cls, directory, urls):
+        with open(os.path.join(directory, MANIFEST), "r") as f:
+            return cls(json.load(f)["shards"], urls)
+
+    def all(self):
+        return list(range(len(self.shards)))
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        return [
+            i for i, s in enumerate(self.shards)
+            if s["bbox"] and s["bbox"][0] <= max_lat and s["bbox"][2] >= min_lat
+            and s["bbox"][1] <= max_lon and s["bbox"][3] >= min_lon
+        ]
+
+    def near(self, lat, lon, radius_km):
+        """Shards with some area within radius_km, or else the nearest one."""
+        located = [(i, _bbox_distance_km(lat, lon, s["bbox"])) for i, s in enumerate(self.shards) if s["bbox"]]
+        near = [i for i, d in located if d <= radius_km]
+        if not near and located:
+            near = [min(located, key=lambda x: x[1])[0]]
+        return near
+
+    def route(self, lat=None, lon=None, radius_km=None, bbox=(None, None, None, None),
+              distance_weight=DEFAULT_DISTANCE_WEIGHT):
+        """The shards a /recommend has to ask, in manifest order."""
+        chosen = set(self.all())
+        if None not in bbox:
+            chosen &= set(self.within_bbox(*bbox))
+        if lat is not None and lon is not None:
+            if radius_km:
+                chosen &= set(self.within_bbox(*radius_bbox(lat, lon, radius_km)))
+            elif None in bbox and distance_weight >= ROUTE_MIN_DISTANCE_WEIGHT:
+                chosen &= set(self.near(lat, lon, ROUTE_RADIUS_KM))
+        return sorted(chosen)
+
+
+def _score(item):
+    score = item.get("score")
+    return float("-inf") if score is None else score
+
+
+def take_best(buffers, n):
+    """
+    Merge per-shard result lists (each best first) into the n best, ties in
+    shard order. Returns (page, what is left of each buffer).
+    """
+    heads = [0] * len(buffers)
+    page = []
+    while len(page) < n:
+        best = None
+        for i, buf in enumerate(buffers):
+            if heads[i] < len(buf) and (best is None or _score(buf[heads[i]]) > _score(buffers[best][heads[best]])):
+                best = i
+        if best is None:
+            break
+        page.append(buffers[best][heads[best]])
+        heads[best] += 1
+    return page, [buf[h:] for buf, h in zip(buffers, heads)]
+
+
+def parse_urls(text):
+    """'name=url,name=url' as a dict."""
+    pairs = (item.split("=", 1) for item in text.split(",") if item.strip())
+    return {name.strip(): url.strip().rstrip("/") for name, url in pairs}
+
+
+REQUEST_SECONDS = metrics.histogram(
+    "quickbites_router_request_seconds", "Router request latency, scatter-gather included.", ["endpoint"]
+)
+SHARD_SECONDS = metrics.histogram("quickbites_router_shard_seconds", "Latency of calls to one shard.", ["shard"])
+SHARD_ERRORS = metrics.counter(
+    "quickbites_router_shard_errors_total", "Shard calls that failed or timed out.", ["shard"]
+)
+FANOUT = metrics.histogram(
+    "quickbites_router_fanout_shards", "Shards asked per request.", ["endpoint"], buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+shard_map = ShardMap.load(SHARDS_DIR, parse_urls(SHARD_URLS)) if SHARDS_DIR else None
+page_store = PageStore()
+http = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global http
+    http = httpx.AsyncClient(timeout=SHARD_TIMEOUT_S, limits=httpx.Limits(max_keepalive_connections=100))
+    yield
+    await http.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+
+async def call_shard(i, method, path, client_errors=False, **kwargs):
+    """
+    One shard's httpx response, or None if it failed. With client_errors,
+    a 4xx reply is an answer (the request's fault), not a failure.
+    """
+    name = shard_map.shards[i]["name"]
+    try:
+        with SHARD_SECONDS.labels(name).time():
+            r = await http.request(method, shard_map.urls[i] + path, **kwargs)
+        if not (client_errors and r.status_code < 500):
+            r.raise_for_status()
+        return r
+    except httpx.HTTPError:
+        SHARD_ERRORS.labels(name).inc()
+        return None
+
+
+async def gather_pages(calls):
+    """
+    Run {shard index: (method, path, kwargs)} in parallel. Returns
+    {shard index: (items, next token)} for the shards that answered with a
+    page, and the names of the ones that did not.
+    """
+    indices = list(calls)
+    responses = await asyncio.gather(*(call_shard(i, m, p, **kw) for i, (m, p, kw) in calls.items()))
+    pages, failed = {}, []
+    for i, r in zip(indices, responses):
+        body = r.json() if r is not None else None
+        if isinstance(body, list):
+            pages[i] = (body, r.headers.get("x-next-page-token"))
+        else:
+            failed.append(shard_map.shards[i]["name"])
+    return pages, failed
+
+
+async def serve_page(response, state, page_size, stream, failed=()):
+    """Top up the buffers that could run dry, then take the best page_size."""
+    page_size = min(page_size, MAX_RESULTS - state["served"])
+    next_call = NEXT_PAGE[state["kind"]]
+    refill = [
+        i for i, (buf, token) in enumerate(zip(state["buffers"], state["tokens"]))
+        if token and len(buf) < page_size
+    ]
+    buffers, tokens = list(state["buffers"]), list(state["tokens"])
+    pages, more_failed = await gather_pages({state["shards"][i]: next_call(tokens[i], page_size) for i in refill})
+    for i in refill:
+        items, token = pages.get(state["shards"][i], ([], None))
+        buffers[i] = buffers[i] + items
+        tokens[i] = token
+
+    page, buffers = take_best(buffers, page_size)
+    served = state["served"] + len(page)
+    next_token = None
+    if served < MAX_RESULTS and (any(buffers) or any(tokens)):
+        next_token = page_store.put(dict(state, buffers=buffers, tokens=tokens, served=served))
+
+    headers = {"X-Next-Page-Token": next_token} if next_token else {}
+    failed = list(failed) + more_failed
+    if failed:
+        headers["X-Shards-Unavailable"] = ",".join(failed)
+    if stream:
+        return StreamingResponse(
+            (json.dumps(item) + "\n" for item in page), media_type="application/x-ndjson", headers=headers
+        )
+    response.headers.update(headers)
+    return page
+
+
+def _recommend_next(token, page_size):
+    return "GET", "/recommend", {"params": {"page_token": token, "page_size": page_size}}
+
+
+def _search_next(token, page_size):
+    return "POST", "/search", {"json": {"query": "", "preferences": {}, "page_token": token, "page_size": page_size}}
+
+
+NEXT_PAGE = {"recommend": _recommend_next, "search": _search_next}
+
+
+async def scatter(response, kind, shards, method, path, page_size, stream, **kwargs):
+    """First page of a query sent to `shards`."""
+    FANOUT.labels(kind).observe(len(shards))
+    pages, failed = await gather_pages({i: (method, path, kwargs) for i in shards})
+    answered = [i for i in shards if i in pages]
+    state = {
+        "kind": kind,
+        "shards": answered,
+        "buffers": [pages[i][0] for i in answered],
+        "tokens": [pages[i][1] for i in answered],
+        "served": 0,
+    }
+    return await serve_page(response, state, page_size, stream, failed)
+
+
+async def next_page(response, kind, page_token, page_size, stream):
+    state = page_store.get(page_token)
+    if state is None or state["kind"] != kind:
+        return {"status": "error", "reason": "page token expired or unknown"}
+    return await serve_page(response, state, page_size, stream)
+
+
+@app.get("/recommend")
+@metrics.timed(REQUEST_SECONDS.labels("recommend"))
+async def recommend(
+    request: Request,
+    response: Response,
+    lat: float | None = None,
+    lon: float | None = None,
+    origin: str = "current",
+    distance_weight: float = DEFAULT_DISTANCE_WEIGHT,
+    radius_km: float | None = None,
+    min_lat: float | None = None,
+    min_lon: float | None = None,
+    max_lat: float | None = None,
+    max_lon: float | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    page_token: str | None = None,
+    stream: bool = False
+):
+    """api.py's /recommend over the shards near the user (the other parameters are passed through)."""
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    if page_token is not None:
+        return await next_page(response, "recommend", page_token, page_size, stream)
+    # a commute's location is in the profile, which the router does not read
+    if origin == "commute":
+        shards = shard_map.route(radius_km=radius_km, bbox=(min_lat, min_lon, max_lat, max_lon))
+    else:
+        shards = shard_map.route(lat, lon, radius_km, (min_lat, min_lon, max_lat, max_lon), distance_weight)
+    params = dict(request.query_params, page_size=page_size, stream="false")
+    return await scatter(response, "recommend", shards, "GET", "/recommend", page_size, stream, params=params)
+
+
+@app.post("/search")
+@metrics.timed(REQUEST_SECONDS.labels("search"))
+async def search(request: Request, response: Response):
+    """api.py's /search over every shard."""
+    body = await request.json()
+    page_size = max(1, min(int(body.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    stream = bool(body.get("stream", False))
+    if body.get("page_token") is not None:
+        return await next_page(response, "search", body["page_token"], page_size, stream)
+    body = dict(body, page_size=page_size, stream=False)
+    return await scatter(response, "search", shard_map.all(), "POST", "/search", page_size, stream, json=body)
+
+
+@app.get("/shards")
+async def shards_status():
+    """Every shard with its area, row count and whether it answers."""
+    responses = await asyncio.gather(*(call_shard(i, "GET", "/cache/stats") for i in shard_map.all()))
+    return [
+        dict(s, url=url, up=r is not None)
+        for s, url, r in zip(shard_map.shards, shard_map.urls, responses)
+    ]
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _relay(r, failed=()):
+    headers = {"X-Shards-Unavailable": ",".join(failed)} if failed else None
+    return Response(r.content, status_code=r.status_code, media_type=r.headers.get("content-type"), headers=headers)
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+async def proxy(path: str, request: Request):
+    """
+    Reads from the first shard that answers; writes to all of them,
+    answering with the first shard's reply, or a 502 if any shard failed.
+    """
+    kwargs = {"params": request.query_params, "content": await request.body(), "headers": {
+        k: v for k, v in request.headers.items() if k.lower() in ("content-type", "x-admin-token")
+    }}
+    names = [s["name"] for s in shard_map.shards]
+    if request.method == "GET":
+        failed = []
+        for i in shard_map.all():
+            r = await call_shard(i, "GET", "/" + path, client_errors=True, **kwargs)
+            if r is not None:
+                return _relay(r, failed)
+            failed.append(names[i])
+        return JSONResponse({"status": "error", "reason": "no shard answered"}, status_code=502,
+                            headers={"X-Shards-Unavailable": ",".join(failed)})
+
+    responses = await asyncio.gather(
+        *(call_shard(i, request.method, "/" + path, client_errors=True, **kwargs) for i in shard_map.all())
+    )
+    failed = [names[i] for i, r in enumerate(responses) if r is None]
+    if failed:
+        return JSONResponse(
+            {"status": "error", "reason": f"not applied on shards {failed}", "unavailable": failed},
+            status_code=502, headers={"X-Shards-Unavailable": ",".join(failed)},
+        )
+    return _relay(responses[0])
+
+
+def serve(args):
+    """Start one api.py process per shard, then the router in this process."""
+    import uvicorn
+    from loadgen import start_server, stop_servers, wait_until_up
+
+    with open(os.path.join(args.shards, MANIFEST), "r") as f:
+        names = [s["name"] for s in json.load(f)["shards"]]
+    urls, procs = [], []
+    for i, name in enumerate(names):
+        url, proc = start_server(args.shard_port + i, CATALOG_DIR=os.path.abspath(os.path.join(args.shards, name)))
+        urls.append(url)
+        procs.append(proc)
+    try:
+        wait_until_up(urls, procs)
+        os.environ["SHARDS_DIR"] = os.path.abspath(args.shards)
+        os.environ["SHARD_URLS"] = ",".join(f"{n}={u}" for n, u in zip(names, urls))
+        print(f"{len(names)} shards up on ports {args.shard_port}-{args.shard_port + len(names) - 1}", file=sys.stderr)
+        uvicorn.run("router:app", port=args.port, log_level="warning")
+    finally:
+        stop_servers(procs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split a catalog into geographic shards, or serve them.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    split = sub.add_parser("split", help="write one snapshot per region")
+    split.add_argument("csv", help="enriched business CSV")
+    split.add_argument("out", help="shards directory")
+    split.add_argument("--geohash", type=int, default=None, help="geohash prefix length (default: split by state)")
+    run = sub.add_parser("serve", help="run a local process per shard behind the router")
+    run.add_argument("shards", help="shards directory")
+    run.add_argument("--port", type=int, default=8080)
+    run.add_argument("--shard-port", type=int, default=SHARD_PORT)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        return serve(args)
+    start = time.perf_counter()
+    shards = write_shards(pd.read_csv(args.csv), args.out, args.geohash)
+    for s in shards:
+        print(f"{s['name']:>12} {s['rows']:>9} rows  bbox {s['bbox']}")
+    print(f"Wrote {len(shards)} shards to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+QuickBites: grid index over business coordinates + vectorized haversine.
+
+Businesses are bucketed into fixed lat/lon cells. Cell keys are sorted
+lat-major, so all the cells of one latitude band that fall inside a query box
+are a single contiguous slice, found with two binary searches.
+"""
+
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+CELL_DEG = 0.05  # ~5.5 km north-south
+
+_LON_OFFSET = 4000  # keeps (shifted) lon cell ids positive for the combined key
+_LON_SPAN = 8000
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; any argument may be a NumPy array."""
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat, lon, precision=7):
+    """Standard base32 geohash; precision 7 is a ~150 m cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    out = []
+    bits, ch, even = 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch = ch * 2 + 1
+                lon_lo = mid
+            else:
+                ch = ch * 2
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = ch * 2 + 1
+                lat_lo = mid
+            else:
+                ch = ch * 2
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_GEOHASH_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(out)
+
+
+def clamp_bbox(min_lat, min_lon, max_lat, max_lon):
+    """The box cut to valid coordinates (lat in [-90, 90], lon in [-180, 180])."""
+    return max(min_lat, -90.0), max(min_lon, -180.0), min(max_lat, 90.0), min(max_lon, 180.0)
+
+
+def radius_bbox(lat, lon, radius_km):
+    """(min_lat, min_lon, max_lat, max_lon) box containing the circle, cut to valid coordinates."""
+    angular = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angular)
+    s = math.sin(min(angular, math.pi / 2)) / max(math.cos(math.radians(lat)), 1e-12)
+    if s >= 1.0:  # the circle takes in a pole: every longitude
+        return clamp_bbox(lat - dlat, -180.0, lat + dlat, 180.0)
+    dlon = math.degrees(math.asin(s))
+    return clamp_bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+
+class GridIndex:
+    def __init__(self, latitude, longitude, cell_deg=CELL_DEG):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.cell_deg = cell_deg
+
+        rows = np.flatnonzero(~(np.isnan(latitude) | np.isnan(longitude)))
+        keys = self._keys(latitude[rows], longitude[rows])
+        order = np.argsort(keys, kind="stable")
+        self._rows = rows[order]
+        self._cells, starts = np.unique(keys[order], return_index=True)
+        self._offsets = np.append(starts, len(order))
+
+    @classmethod
+    def from_arrays(cls, latitude, longitude, rows, cells, offsets, cell_deg=CELL_DEG):
+        """Index over already bucketed rows (e.g. loaded from a catalog snapshot)."""
+        self = cls.__new__(cls)
+        self.latitude = latitude
+        self.longitude = longitude
+        self.cell_deg = cell_deg
+        self._rows = rows
+        self._cells = cells
+        self._offsets = offsets
+        return self
+
+    def _lat_cell(self, lat):
+        return np.floor(np.asarray(lat) / self.cell_deg).astype(np.int64)
+
+    def _lon_cell(self, lon):
+        return np.floor(np.asarray(lon) / self.cell_deg).astype(np.int64) + _LON_OFFSET
+
+    def _keys(self, lat, lon):
+        return self._lat_cell(lat) * _LON_SPAN + self._lon_cell(lon)
+
+    def _cell_rows(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Businesses in every cell touching the box (a superset of the box).
+        Only the latitude bands between the first and last occupied one are
+        visited, so a huge box costs no more than the catalog's extent.
+        """
+        min_lat, min_lon, max_lat, max_lon = clamp_bbox(min_lat, min_lon, max_lat, max_lon)
+        if not len(self._cells) or not min_lat <= max_lat or not min_lon <= max_lon:  # also NaN
+            return np.empty(0, dtype=np.int64)
+        lon_lo, lon_hi = int(self._lon_cell(min_lon)), int(self._lon_cell(max_lon))
+        lat_lo = max(int(self._lat_cell(min_lat)), int(self._cells[0] // _LON_SPAN))
+        lat_hi = min(int(self._lat_cell(max_lat)), int(self._cells[-1] // _LON_SPAN))
+        parts = []
+        for lat_cell in range(lat_lo, lat_hi + 1):
+            base = lat_cell * _LON_SPAN
+            lo = np.searchsorted(self._cells, base + lon_lo, side="left")
+            hi = np.searchsorted(self._cells, base + lon_hi, side="right")
+            if lo < hi:
+                parts.append(self._rows[self._offsets[lo]:self._offsets[hi]])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(parts)
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Sorted indices of businesses inside the box."""
+        rows = self._cell_rows(min_lat, min_lon, max_lat, max_lon)
+        lat, lon = self.latitude[rows], self.longitude[rows]
+        inside = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        return np.sort(rows[inside])
+
+    def within_radius(self, lat, lon, radius_km):
+        """(sorted indices, distances in km) of businesses within radius_km."""
+        rows = self.within_bbox(*radius_bbox(lat, lon, radius_km))
+        dist = haversine_km(lat, lon, self.latitude[rows], self.longitude[rows])
+        inside = dist <= radius_km
+        return rows[inside], dist[inside]
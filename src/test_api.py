@@ -0,0 +1,293 @@
+"""
+The API end to end, through FastAPI's TestClient. State (catalog snapshot,
+interaction log, profile database, saved profiles) goes to a temporary
+directory; ETAs come from the local provider, or a stub one where a test
+installs it.
+
+Run from src/:  python -m pytest -q test_api.py
+"""
+
+import importlib
+import json
+import math
+import os
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import distance_utils
+import profiling
+from catalog_snapshot import current_version, write_snapshot
+from distance_utils import EtaCache, EtaProvider
+from spatial_index import haversine_km
+
+TOKEN = "test-admin-token"
+ADMIN = {"X-Admin-Token": TOKEN}
+
+
+class FixedEtas(EtaProvider):
+    """`minutes` for the listed businesses, 5 for the rest; or fails with `error`."""
+
+    name = "fixed"
+
+    def __init__(self, minutes=None, error=None):
+        self.minutes = minutes or {}
+        self.error = error
+
+    def matrix(self, origins, destinations):
+        return [[self.minutes.get(d["business_id"], 5.0) for d in destinations]]
+
+    async def amatrix(self, origins, destinations):
+        if self.error is not None:
+            raise self.error
+        return self.matrix(origins, destinations)
+
+
+@pytest.fixture
+def eta_provider(monkeypatch):
+    """Installs an ETA provider (and an empty ETA cache) for the test."""
+    monkeypatch.setattr(distance_utils, "eta_cache", EtaCache())
+
+    def install(provider):
+        monkeypatch.setattr(distance_utils, "_provider", provider)
+    return install
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("api")
+    env = {
+        "CATALOG_DIR": str(tmp / "catalog"),
+        "INTERACTION_LOG_DIR": str(tmp / "interactions"),
+        "PROFILE_DB": str(tmp / "profiles.db"),
+        "PROFILE_DIR": str(tmp / "profiles"),
+        "ETA_PROVIDER": "local",
+        "ADMIN_TOKEN": TOKEN,
+    }
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in env.items():
+            mp.setenv(name, value)
+        yield importlib.import_module("api")
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_reload_needs_a_configured_admin_token(api, client, monkeypatch):
+    assert client.post("/admin/catalog/reload").status_code == 403
+    assert client.post("/admin/catalog/reload", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    monkeypatch.setattr(api, "ADMIN_TOKEN", None)
+    response = client.post("/admin/catalog/reload", headers={"X-Admin-Token": ""})
+    assert response.status_code == 403 and response.json()["status"] == "error"
+
+
+@pytest.mark.parametrize("version", ["..", "../catalog", "/etc", os.path.join("x", ".."), "no-such-version"])
+def test_reload_only_loads_versions_under_the_catalog_root(api, client, version):
+    before = api.catalogs.current
+    response = client.post("/admin/catalog/reload", params={"version": version}, headers=ADMIN)
+    assert response.status_code == 400 and response.json()["status"] == "error"
+    assert api.catalogs.current is before
+
+
+def test_reload_warms_and_swaps(api, client):
+    assert client.post("/search", json={"query": "pizza", "preferences": {}}).status_code == 200
+    old = api.catalogs.current
+    root = api.CATALOG_DIR
+    first = current_version(root)
+    write_snapshot(pd.read_csv(api.csv_path).head(500), root)
+
+    response = client.post("/admin/catalog/reload", headers=ADMIN)
+    assert response.status_code == 200
+    new = api.catalogs.current
+    assert new is not old and new.size == 500 and response.json()["version"] == current_version(root)
+    # the recent /search was re-ranked against the new catalog before the swap
+    assert any(key[0] == "search" and key[1] == new.version for key in api.result_cache.recent_keys(10))
+
+    assert client.post("/admin/catalog/reload", params={"version": first}, headers=ADMIN).status_code == 200
+    assert api.catalogs.current.snapshot_version == first
+
+
+def test_profiling_needs_the_admin_token(api, client):
+    params = {"keywords": "pizza", "lat": 33.68, "lon": -117.83, "user_id": "someone"}
+    assert "x-profile-id" not in client.get("/recommend", params=params, headers={"X-Profile": "1"}).headers
+    assert client.get("/admin/profiling").status_code == 403
+
+    params["keywords"] = "sushi"  # not cached yet, so the scoring runs (and is profiled)
+    response = client.get("/recommend", params=params, headers={"X-Profile": "1", **ADMIN})
+    profile_id = response.headers["x-profile-id"]
+    assert client.get(f"/admin/profiles/{profile_id}").status_code == 403
+    report = client.get(f"/admin/profiles/{profile_id}", headers=ADMIN).json()
+    assert report["query"] == "keywords=sushi" and report["functions"]
+    assert client.get("/admin/profiling", headers=ADMIN).json()["profiles"][0] == profile_id
+    assert api.profiler.ring.directory == os.environ["PROFILE_DIR"]  # not src/data/profiles
+
+
+def test_a_profile_asked_for_while_another_runs_says_it_was_skipped(api, client, monkeypatch):
+    monkeypatch.setattr(api.profiler, "active", profiling.PROFILE_MAX_ACTIVE)
+    busy = api.profiler.busy
+    response = client.get("/recommend", params={"keywords": "pizza"}, headers={"X-Profile": "1", **ADMIN})
+    assert response.status_code == 200 and "x-profile-id" not in response.headers
+    assert response.headers["x-profile-skipped"] == "busy" and api.profiler.busy == busy + 1
+
+
+def test_recommend_blends_etas_and_falls_back_to_content_scores(api, client, eta_provider):
+    params = {"keywords": "coffee", "lat": 33.68, "lon": -117.83, "distance_weight": 0.5, "page_size": 5}
+    eta_provider(FixedEtas(error=RuntimeError("OVER_QUERY_LIMIT")))
+    before = distance_utils.ETA_LOOKUP_ERRORS.labels().value
+    content = client.get("/recommend", params=params).json()
+    assert len(content) == 5 and all(r["eta_min"] is None for r in content)
+    assert distance_utils.ETA_LOOKUP_ERRORS.labels().value == before + 1
+
+    top = content[0]
+    eta_provider(FixedEtas({top["business_id"]: 120.0}))
+    blended = client.get("/recommend", params=params).json()
+    by_id = {r["business_id"]: r for r in blended}
+    assert top["business_id"] not in by_id  # two hours away: pushed off the first page
+    for r in content[1:]:
+        assert by_id[r["business_id"]]["eta_min"] == 5.0
+        expected = r["score"] * (0.5 + 0.5 * math.exp(-5.0 / 10.0))
+        assert by_id[r["business_id"]]["score"] == pytest.approx(expected)
+
+
+def test_a_profile_change_drops_the_users_cached_results(api, client):
+    body = {"query": "tacos", "preferences": {"personalize": True}, "user_id": "cache-user"}
+    first = client.post("/search", json=body).json()
+    assert client.post("/search", json=body).json() == first
+    hits, invalidations = api.result_cache.hits, api.result_cache.invalidations
+
+    event = {"user_id": "cache-user", "business_id": first[0]["business_id"], "event_type": "save",
+             "categories": "Mexican"}
+    assert client.post("/interact", json=event).json()["status"] == "success"
+    assert api.result_cache.invalidations == invalidations + 1
+    client.post("/search", json=body)
+    assert api.result_cache.hits == hits  # ranked again against the new profile
+
+
+def test_search_pages_follow_their_token_and_match_one_big_page(api, client):
+    body = {"query": "burgers", "preferences": {}, "page_size": 4}
+    seen = []
+    response = client.post("/search", json=body)
+    for _ in range(3):
+        seen += [r["business_id"] for r in response.json()]
+        token = response.headers["x-next-page-token"]
+        response = client.post("/search", json={**body, "query": "ignored: the token has it", "page_token": token})
+    whole = client.post("/search", json={**body, "page_size": 12}).json()
+    assert seen == [r["business_id"] for r in whole]
+
+
+def test_pages_stream_as_ndjson(api, client):
+    body = {"query": "burgers", "preferences": {}, "page_size": 3}
+    listed = client.post("/search", json=body).json()
+    response = client.post("/search", json={**body, "stream": True})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in response.text.splitlines()] == listed
+    assert "x-next-page-token" in response.headers
+
+    params = {"keywords": "burgers", "lat": 33.68, "lon": -117.83, "page_size": 3}
+    streamed = client.get("/recommend", params={**params, "stream": True}).text.splitlines()
+    assert [json.loads(line)["business_id"] for line in streamed] == [
+        r["business_id"] for r in client.get("/recommend", params=params).json()]
+
+
+def test_recommend_pages_do_not_repeat_and_tokens_are_per_endpoint(api, client):
+    params = {"keywords": "pizza", "lat": 33.68, "lon": -117.83, "page_size": 10}
+    response = client.get("/recommend", params=params)
+    seen = [r["business_id"] for r in response.json()]
+    for _ in range(3):  # past the first ETA window
+        token = response.headers["x-next-page-token"]
+        response = client.get("/recommend", params={"page_token": token, "page_size": 10})
+        seen += [r["business_id"] for r in response.json()]
+    assert len(seen) == 40 and len(set(seen)) == 40
+
+    search_token = client.post("/search", json={"query": "pizza", "preferences": {}, "page_size": 1}).headers[
+        "x-next-page-token"]
+    assert client.get("/recommend", params={"page_token": search_token}).json()["status"] == "error"
+    assert client.post("/search", json={"query": "", "preferences": {}, "page_token": token}).json()["status"] == "error"
+
+
+def test_expired_page_tokens_are_refused(api, client, monkeypatch):
+    body = {"query": "burgers", "preferences": {}, "page_size": 2}
+    token = client.post("/search", json=body).headers["x-next-page-token"]
+    monkeypatch.setattr(api.page_store, "clock", lambda: float("inf"))
+    response = client.post("/search", json={**body, "page_token": token})
+    assert response.json() == {"status": "error", "reason": "page token expired or unknown"}
+
+
+def test_metrics_are_served_in_the_prometheus_text_format(api, client):
+    client.post("/search", json={"query": "pizza", "preferences": {}})
+    response = client.get("/metrics")
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    lines = response.text.splitlines()
+    assert "# TYPE quickbites_request_seconds histogram" in lines
+    assert any(line.startswith('quickbites_request_seconds_count{endpoint="search"} ') for line in lines)
+    assert any(line.startswith("quickbites_interaction_log_records_total ") for line in lines)
+    for line in lines:  # every sample is `name{labels} number`
+        if not line.startswith("#"):
+            float(line.rsplit(" ", 1)[1].replace("+Inf", "inf"))
+
+
+def test_recommend_within_a_radius_or_a_viewport(api, client):
+    # the sample catalog is Santa Barbara
+    near = client.get("/recommend", params={"keywords": "pizza", "lat": 34.42, "lon": -119.70, "radius_km": 1,
+                                            "page_size": 50}).json()
+    assert near and all(haversine_km(34.42, -119.70, r["latitude"], r["longitude"]) <= 1 for r in near)
+
+    box = {"min_lat": 34.41, "min_lon": -119.72, "max_lat": 34.43, "max_lon": -119.69}
+    inside = client.get("/recommend", params={"keywords": "pizza", **box, "page_size": 50}).json()
+    assert inside
+    for r in inside:
+        assert box["min_lat"] <= r["latitude"] <= box["max_lat"] and box["min_lon"] <= r["longitude"] <= box["max_lon"]
+
+
+@pytest.mark.parametrize("params", [
+    {"lat": 91, "lon": 0}, {"lat": 0, "lon": -181}, {"lat": "nan", "lon": 0}, {"lat": 0, "lon": 0, "radius_km": -1},
+    {"min_lat": -1e9, "min_lon": -1e9, "max_lat": 1e9, "max_lon": 1e9},
+])
+def test_recommend_rejects_out_of_range_coordinates(api, client, params):
+    assert client.get("/recommend", params={"keywords": "pizza", **params}).status_code == 422
+
+
+def test_an_interaction_batch_reaches_the_profile_and_the_log(api, client):
+    user = "batch-user"
+    events = [
+        {"user_id": user, "business_id": "b1", "event_type": "click", "categories": "Pizza, Italian"},
+        {"user_id": user, "business_id": "b2", "event_type": "save", "categories": "Pizza", "price_level": 2},
+        {"user_id": user, "business_id": "b3", "event_type": "route_started"},
+        {"user_id": user, "business_id": "b4", "event_type": "teleported"},  # unknown: ignored
+    ]
+    seq = api.interaction_log.seq
+    result = client.post("/interact/batch", json=events).json()
+    assert result["status"] == "success" and (result["accepted"], result["ignored"]) == (3, 1)
+
+    profile = client.get("/profile", params={"user_id": user}).json()
+    assert profile == result["profile"]
+    assert [e["business_id"] for e in profile["short_term"]] == ["b3", "b2", "b1"]
+    assert profile["long_term"]["cuisine"]["pizza"] == 6.0 and profile["long_term"]["price_level"]["2"] == 5.0
+
+    assert api.interaction_log.seq == seq + 3 and api.interaction_log.flush(timeout=5)
+    logged = [r for r in api.interaction_log.replay(seq) if r["user_id"] == user]
+    assert [(r["business_id"], r["event_type"]) for r in logged] == [("b1", "click"), ("b2", "save"),
+                                                                      ("b3", "route_started")]
+
+
+def test_a_batch_with_a_malformed_event_is_rejected_whole(api, client):
+    seq = api.interaction_log.seq
+    events = [{"user_id": "batch-user-2", "business_id": "b1", "event_type": "click"},
+              {"user_id": "batch-user-2", "event_type": "click"}]  # no business_id
+    response = client.post("/interact/batch", json=events)
+    assert response.status_code == 422 and api.interaction_log.seq == seq
+    assert client.get("/profile", params={"user_id": "batch-user-2"}).json()["short_term"] == []
+
+
+def test_the_legacy_profile_file_gets_locations(api, tmp_path, monkeypatch):
+    path = tmp_path / "test_user_profile.json"
+    monkeypatch.setattr(api, "PROFILE_FILE", str(path))
+    assert api.load_profile() == api.default_profile()
+    path.write_text(json.dumps({"user_id": api.DEFAULT_USER_ID, "long_term": {"cuisine": {"thai": 2.0}}}))
+    profile = api.load_profile()
+    assert profile["long_term"]["cuisine"] == {"thai": 2.0}
+    assert profile["locations"] == api.default_profile()["locations"] == json.loads(path.read_text())["locations"]
@@ -0,0 +1,87 @@
+"""
+batch_content_scores must agree with the scalar content_score.
+
+Run from src/:  python -m pytest -q test_batch_scoring.py
+"""
+
+import numpy as np
+import pytest
+
+from batch_scoring import batch_content_scores, best_k, explain_rows, rank_top_k, sharded_best_k
+from compute_content_score import content_score, cuisine_match, only_relevant_categories
+from conftest import PROFILE, QUERIES
+
+
+@pytest.mark.parametrize("profile", [None, PROFILE])
+@pytest.mark.parametrize("query", QUERIES)
+def test_batch_matches_content_score(catalog, query, profile):
+    max_reviews = catalog.max_reviews
+    _, batch = batch_content_scores(catalog, max_review_count=max_reviews, user_profile=profile, **query)
+
+    scalar = np.array([
+        content_score(row, max_review_count=max_reviews, user_profile=profile, **query)[0]
+        for row in catalog.df.to_dict("records")
+    ])
+    np.testing.assert_allclose(batch, scalar, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize("keywords", [
+    [],
+    ["ramen"],
+    ["bars", "sushi bars"],
+    ["restaurants japanese"],  # only matches across two joined tags
+    ["&", " "],
+])
+def test_category_index_matches_regex(catalog, keywords):
+    index = catalog.category_index
+    cm = index.cuisine_match(keywords)
+    for i, cats in enumerate(catalog.categories_raw):
+        assert cm[i] == cuisine_match(keywords, cats)
+        assert index.relevant_categories(i, keywords) == only_relevant_categories(cats, keywords)
+
+
+@pytest.mark.parametrize("profile", [None, PROFILE])
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("k", [1, 10, 25, 5000])
+def test_rank_top_k_matches_full_sort(catalog, query, profile, k):
+    masks = [catalog.meal_mask(query["meal"]), catalog.is_open]
+    _, scores = batch_content_scores(catalog, max_review_count=catalog.max_reviews, user_profile=profile, **query)
+
+    keep = np.flatnonzero(masks[0] & masks[1] & (scores > 0))
+    expected = keep[np.argsort(-scores[keep], kind="stable")][:k]
+
+    rows, top_scores = rank_top_k(
+        catalog, k, max_review_count=catalog.max_reviews, user_profile=profile,
+        masks=masks, min_score=0.0, **query
+    )
+    np.testing.assert_array_equal(rows, expected)
+    np.testing.assert_allclose(top_scores, scores[expected], rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_explain_rows_matches_content_score(catalog, query):
+    max_reviews = catalog.max_reviews
+    rows = np.arange(catalog.size)
+    explanations = explain_rows(catalog, rows, max_review_count=max_reviews, user_profile=PROFILE, **query)
+
+    records = catalog.df.to_dict("records")
+    for i in rows:
+        expected = content_score(records[i], max_review_count=max_reviews, user_profile=PROFILE, **query)[1]
+        assert explanations[i] == expected
+
+
+@pytest.mark.parametrize("shards", [1, 3, 8])
+def test_sharded_best_k_matches_one_pass(shards):
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(5000, 1200, replace=False))
+    scores = rng.random(5000).round(2)  # plenty of ties
+    keep = rng.random(5000) < 0.7
+
+    def rank_rows(rows):
+        rows = rows[keep[rows]]
+        return rows, scores[rows] * 2, scores[rows]
+
+    got = sharded_best_k(rows, 50, rank_rows, shards=shards, min_rows=0)
+    expected = best_k(rows[keep[rows]], scores[rows[keep[rows]]], 50)
+    np.testing.assert_array_equal(got[0], expected[0])
+    np.testing.assert_array_equal(got[1], expected[1])
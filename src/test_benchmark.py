@@ -0,0 +1,23 @@
+"""
+The benchmark's synthetic catalogs: scaled-up copies of the shipped CSV.
+
+Run from src/:  python -m pytest -q test_benchmark.py
+"""
+
+import pandas as pd
+
+from benchmark import synthetic_catalog
+from catalog import Catalog
+from conftest import CSV_PATH
+
+
+def test_synthetic_catalog_copies_source_columns():
+    source = pd.read_csv(CSV_PATH)
+    df = synthetic_catalog(source, 2000, seed=1)
+    assert list(df.columns) == list(source.columns) and df["business_id"].is_unique
+    assert set(df["categories"].dropna()) <= set(source["categories"].dropna())
+    assert set(df["attributes"].dropna()) <= set(source["attributes"].dropna())
+    # resampled, so the rates keep their distribution
+    for col in ("dinner_rate", "sent_pos_mean", "stars"):
+        assert abs(df[col].mean() - source[col].mean()) < 0.05 * abs(source[col].mean()) + 0.01
+    assert Catalog(df).size == 2000
@@ -0,0 +1,135 @@
+"""
+Catalog snapshots: a catalog loaded from a snapshot must match the one it
+was built from; ensure_snapshot builds one version for workers starting
+together, and a new one only when the CSV changes; old versions are pruned
+unless something still maps them.
+
+Run from src/:  python -m pytest -q test_catalog_snapshot.py
+"""
+
+import gc
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import catalog_snapshot
+from batch_scoring import rank_top_k
+from catalog import Catalog
+from catalog_snapshot import CatalogManager, current_version, ensure_snapshot, load_catalog, write_snapshot
+from conftest import CSV_PATH, PROFILE, QUERIES
+
+
+def test_snapshot_round_trip(catalog, tmp_path):
+    write_snapshot(catalog.df, str(tmp_path))
+    loaded = load_catalog(str(tmp_path))
+    assert loaded.size == catalog.size and loaded.max_reviews == catalog.max_reviews
+
+    for meal in ("lunch", "dinner", "brunch", "nonsense"):
+        np.testing.assert_array_equal(loaded.meal_mask(meal), catalog.meal_mask(meal))
+    for i in range(catalog.size):
+        assert loaded.display_fields(i) == catalog.display_fields(i)
+        assert loaded.good_for_meal_raw[i] == catalog.good_for_meal_raw[i]
+        assert loaded.category_index.relevant_categories(i, ["bars"]) == catalog.category_index.relevant_categories(i, ["bars"])
+
+    for query in QUERIES:
+        for profile in (None, PROFILE):
+            expected = rank_top_k(catalog, 25, max_review_count=catalog.max_reviews, user_profile=profile, **query)
+            got = rank_top_k(loaded, 25, max_review_count=loaded.max_reviews, user_profile=profile, **query)
+            np.testing.assert_array_equal(got[0], expected[0])
+            np.testing.assert_allclose(got[1], expected[1], rtol=0, atol=1e-12)
+
+
+@pytest.fixture
+def small_csv(tmp_path):
+    path = tmp_path / "businesses.csv"
+    pd.read_csv(CSV_PATH).head(200).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Versions written by write_snapshot during the test."""
+    written = []
+    real = catalog_snapshot.write_snapshot
+
+    def counting(*args, **kwargs):
+        time.sleep(0.05)  # a slow build: the other workers must wait, not build too
+        written.append(os.path.basename(real(*args, **kwargs)))
+        return written[-1]
+    monkeypatch.setattr(catalog_snapshot, "write_snapshot", counting)
+    return written
+
+
+def test_workers_starting_together_build_once(tmp_path, small_csv, builds):
+    root = str(tmp_path / "catalog")
+    got = []
+    workers = [threading.Thread(target=lambda: got.append(ensure_snapshot(root, small_csv))) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert len(builds) == 1 and got == builds * 4
+    assert load_catalog(root).size == 200
+
+
+def test_a_changed_csv_makes_a_new_version(tmp_path, small_csv, builds):
+    root = str(tmp_path / "catalog")
+    first = ensure_snapshot(root, small_csv)
+    assert ensure_snapshot(root, small_csv) == first and len(builds) == 1
+
+    pd.read_csv(small_csv).head(150).to_csv(small_csv, index=False)
+    second = ensure_snapshot(root, small_csv)
+    assert second != first and len(builds) == 2 and load_catalog(root).size == 150
+
+    # a version built from something else (a reload, a shard split) is left alone
+    write_snapshot(pd.read_csv(small_csv).head(100), root)
+    assert ensure_snapshot(root, small_csv) == current_version(root) and len(builds) == 2
+
+
+def test_a_catalog_without_review_counts_scores_like_one_with_zero(tmp_path):
+    df = pd.read_csv(CSV_PATH).head(200)
+    df["review_count"] = np.nan
+    catalog = Catalog(df)
+    assert catalog.max_reviews == 0
+    expected = rank_top_k(catalog, 10, ["pizza"], None, "lunch", 0)
+
+    write_snapshot(df, str(tmp_path))
+    loaded = load_catalog(str(tmp_path))
+    got = rank_top_k(loaded, 10, ["pizza"], None, "lunch", loaded.max_reviews)
+    np.testing.assert_array_equal(got[0], expected[0])
+
+    # snapshots written before the missing case was normalised say null
+    columns, meta = catalog_snapshot.read_snapshot(os.path.join(str(tmp_path), current_version(str(tmp_path))))
+    assert Catalog.from_columns(columns, dict(meta, max_reviews=None)).max_reviews == 0
+
+
+def test_writing_a_version_prunes_all_but_the_newest(tmp_path):
+    root = str(tmp_path)
+    df = pd.read_csv(CSV_PATH)
+    written = [os.path.basename(write_snapshot(df.head(10 + i), root, keep=2)) for i in range(5)]
+    assert sorted(n for n in os.listdir(root) if not n.startswith(".") and n != "CURRENT") == sorted(written[-2:])
+    assert current_version(root) == written[-1]
+    # keep=0 keeps everything
+    write_snapshot(df.head(30), root, keep=0)
+    write_snapshot(df.head(31), root, keep=0)
+    assert len(catalog_snapshot._versions(root)) == 4
+
+
+def test_a_version_still_mapped_is_not_pruned(tmp_path):
+    root = str(tmp_path)
+    df = pd.read_csv(CSV_PATH)
+    write_snapshot(df.head(10), root)
+    manager = CatalogManager(root)
+    mapped = manager.current.snapshot_version
+    for i in range(3):
+        write_snapshot(df.head(20 + i), root, keep=1)
+    assert mapped in os.listdir(root) and manager.current.size == 10
+
+    manager.reload()  # moves on to CURRENT; the old catalog is freed
+    gc.collect()
+    assert catalog_snapshot.prune_versions(root, keep=1) == [mapped]
+    assert catalog_snapshot._versions(root) == [current_version(root)] == [manager.current.snapshot_version]
@@ -0,0 +1,188 @@
+"""
+ETA providers, the ETA cache (TTL and LRU), and lookups against a stub
+provider: coalescing and batching of concurrent lookups, the rate limiter,
+and falling back to None when the upstream fails or is slow.
+
+Run from src/:  python -m pytest -q test_distance_utils.py
+"""
+
+import asyncio
+import gc
+
+import pytest
+
+import distance_utils
+from distance_utils import EtaBatcher, EtaCache, EtaProvider, RateLimiter, RecordedEtaProvider, cached_leg_async
+
+ORIGIN = {"latitude": 33.68, "longitude": -117.83}
+
+
+def places(n):
+    return [{"business_id": f"b{i}", "latitude": 33.6 + i / 100, "longitude": -117.8} for i in range(n)]
+
+
+class StubProvider(EtaProvider):
+    """Answers i + 1 minutes for destination i of each call; records calls."""
+
+    name = "stub"
+
+    def __init__(self, delay_s=0.0, error=None):
+        self.calls = []
+        self.delay_s = delay_s
+        self.error = error
+
+    def matrix(self, origins, destinations):
+        raise AssertionError("the async path should not call matrix()")
+
+    async def amatrix(self, origins, destinations):
+        self.calls.append([d["business_id"] for d in destinations])
+        await asyncio.sleep(self.delay_s)
+        if self.error is not None:
+            raise self.error
+        return [[float(d["business_id"][1:]) + 1 for d in destinations]]
+
+
+def run(coro, batcher=None):
+    """Run coro on a fresh loop, with `batcher` as that loop's batcher."""
+    async def main():
+        if batcher is not None:
+            distance_utils._batchers[asyncio.get_running_loop()] = batcher
+        return await coro
+    return asyncio.run(main())
+
+
+def no_limit():
+    return RateLimiter(rate=0)
+
+
+def test_concurrent_lookups_coalesce():
+    provider, cache = StubProvider(delay_s=0.01), EtaCache()
+    batcher = EtaBatcher(batch_size=25, window_s=0.005, limiter=no_limit())
+
+    async def both():
+        dests = places(6)
+        return await asyncio.gather(
+            cached_leg_async(ORIGIN, dests[:4], provider=provider, cache=cache, timeout=1),
+            cached_leg_async(ORIGIN, dests[2:], provider=provider, cache=cache, timeout=1),
+        )
+
+    first, second = run(both(), batcher)
+    assert first == [1, 2, 3, 4] and second == [3, 4, 5, 6]
+    assert provider.calls == [["b0", "b1", "b2", "b3", "b4", "b5"]]  # one call, each place once
+    assert batcher.coalesced == 2 and batcher.stats()["in_flight"] == 0
+    # now cached: no further upstream call
+    assert run(cached_leg_async(ORIGIN, places(6), provider=provider, cache=cache, timeout=1)) == [1, 2, 3, 4, 5, 6]
+    assert len(provider.calls) == 1
+
+
+def test_batches_split_at_batch_size():
+    provider = StubProvider()
+    batcher = EtaBatcher(batch_size=2, window_s=0.005, limiter=no_limit())
+    etas = run(cached_leg_async(ORIGIN, places(5), provider=provider, cache=EtaCache(), timeout=1), batcher)
+    assert etas == [1, 2, 3, 4, 5]
+    assert sorted(map(len, provider.calls)) == [1, 2, 2] and batcher.stats()["mean_batch_size"] == pytest.approx(5 / 3)
+
+
+def test_rate_limiter_spaces_calls_after_the_burst():
+    now = [0.0]
+    slept = []
+
+    async def fake_sleep(s):
+        slept.append(s)
+        now[0] += s
+
+    limiter = RateLimiter(rate=10, burst=2, clock=lambda: now[0])
+
+    async def calls():
+        real_sleep, asyncio.sleep = asyncio.sleep, fake_sleep
+        try:
+            for _ in range(4):
+                await limiter.acquire()
+        finally:
+            asyncio.sleep = real_sleep
+
+    asyncio.run(calls())
+    assert slept == [pytest.approx(0.1), pytest.approx(0.1)]  # the burst of 2 went through at once
+
+
+def test_upstream_errors_fall_back_to_none():
+    provider, cache = StubProvider(error=RuntimeError("OVER_QUERY_LIMIT")), EtaCache()
+    cache.put(distance_utils.eta_cache_key("from", ORIGIN, places(1)[0]), 9.0)
+    batcher = EtaBatcher(window_s=0.001, limiter=no_limit())
+    before = distance_utils.ETA_LOOKUP_ERRORS.labels().value
+    assert run(cached_leg_async(ORIGIN, places(3), provider=provider, cache=cache, timeout=1), batcher) == [9.0, None, None]
+    assert distance_utils.ETA_LOOKUP_ERRORS.labels().value == before + 1
+    assert batcher.stats()["in_flight"] == 0
+
+
+def test_timed_out_lookup_leaves_no_unretrieved_error():
+    provider = StubProvider(delay_s=0.05, error=RuntimeError("upstream 500"))
+    batcher = EtaBatcher(window_s=0.001, limiter=no_limit())
+    unhandled = []
+
+    async def timed_out():
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda _, context: unhandled.append(context))
+        etas = await cached_leg_async(ORIGIN, places(2), provider=provider, cache=EtaCache(), timeout=0.01)
+        await asyncio.sleep(0.1)  # the upstream call fails after the caller gave up
+        return etas
+
+    assert run(timed_out(), batcher) == [None, None]
+    gc.collect()  # an unretrieved error is reported when its future is freed
+    assert not unhandled
+
+
+def test_providers_must_implement_matrix():
+    class Incomplete(EtaProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_recorded_provider_misses_raise_without_a_fallback():
+    a, b = places(2)
+    fixture = {f"{distance_utils._point_key(ORIGIN)}|{distance_utils._point_key(a)}": 4.0}
+    provider = RecordedEtaProvider(fixture)
+    assert provider.matrix([ORIGIN], [a]) == [[4.0]]
+    with pytest.raises(KeyError):
+        provider.matrix([ORIGIN], [a, b])
+    assert provider.misses == 1
+
+    recording = RecordedEtaProvider(fixture, fallback=StubProvider())
+    assert run(recording.amatrix([ORIGIN], [a, b])) == [[4.0, 2.0]] and len(recording.recordings) == 2
+
+
+def test_eta_cache_expires_entries_after_their_ttl():
+    now = [0.0]
+    cache = EtaCache(maxsize=10, ttl_s=60, clock=lambda: now[0])
+    cache.put("k", 7.0)
+    cache.put("no route", None)
+    now[0] = 59.0
+    assert cache.get("k") == 7.0 and cache.get("no route") is None  # None is a cached answer
+    now[0] = 60.0
+    assert cache.get("k") is distance_utils._MISSING
+    assert cache.stats()["size"] == 1 and (cache.hits, cache.misses) == (2, 1)
+
+
+def test_eta_cache_evicts_the_least_recently_used():
+    cache = EtaCache(maxsize=2, ttl_s=60)
+    cache.put("a", 1.0)
+    cache.put("b", 2.0)
+    cache.get("a")  # now b is the oldest
+    cache.put("c", 3.0)
+    assert cache.get("b") is distance_utils._MISSING
+    assert cache.get("a") == 1.0 and cache.get("c") == 3.0 and cache.evictions == 1
+    EtaCache(maxsize=0).put("a", 1.0)  # disabled: stores nothing
+
+
+def test_cached_leg_only_asks_for_the_misses():
+    class SyncStub(StubProvider):
+        def matrix(self, origins, destinations):
+            self.calls.append([d["business_id"] for d in destinations])
+            return [[float(d["business_id"][1:]) + 1 for d in destinations]]
+
+    provider, cache = SyncStub(), EtaCache()
+    assert distance_utils.cached_leg(ORIGIN, places(2), provider=provider, cache=cache) == [1, 2]
+    assert distance_utils.cached_leg(ORIGIN, places(4), provider=provider, cache=cache) == [1, 2, 3, 4]
+    assert provider.calls == [["b0", "b1"], ["b2", "b3"]]
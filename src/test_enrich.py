@@ -0,0 +1,61 @@
+"""
+The enrichment pipeline: per-business aggregates match the notebooks, and
+a repeated run resumes from its checkpoints.
+
+Run from src/:  python -m pytest -q test_enrich.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from enrich import enrich
+
+
+def test_enrich_aggregates_and_resumes(tmp_path):
+    parts, out, work = tmp_path / "parts", tmp_path / "enriched.csv", tmp_path / "work"
+    parts.mkdir()
+    reviews = pd.DataFrame({
+        "review_id": list("abcdef"),
+        "business_id": ["x", "x", "y", "x", None, "y"],
+        "date": ["2020-01-01 07:00:00", "2020-01-01 12:00:00", "2020-01-01 19:00:00", None, "2020-01-01 07:00:00",
+                 "2020-01-02 08:00:00"],
+        "pos": [0.9, 0.2, np.nan, 0.7, 0.5, 0.4],
+        "neu": [0.05, 0.5, 0.3, 0.2, 0.3, 0.3],
+        "neg": [0.05, 0.3, 0.7, 0.1, 0.2, 0.3],
+        "label": ["POSITIVE", "NEUTRAL", "NEGATIVE", "POSITIVE", "NEUTRAL", "POSITIVE"],
+    })
+    reviews.iloc[:3].to_csv(parts / "part_000000.csv", index=False)
+    reviews.iloc[3:].to_csv(parts / "part_000001.csv", index=False)
+    pd.DataFrame({"business_id": ["x", "y", "z"], "state": ["CA", "CA", "NV"]}).to_csv(tmp_path / "biz.csv", index=False)
+
+    got = enrich(str(tmp_path / "biz.csv"), str(parts), str(out), state="CA", work=str(work), jobs=1, log=lambda _: None)
+    x, y = got.set_index("business_id").loc["x"], got.set_index("business_id").loc["y"]
+    assert x["n_reviews"] == 3 and x["sent_pos_mean"] == pytest.approx(0.6) and x["pos_rate"] == pytest.approx(2 / 3)
+    assert (x["n_morning_reviews"], x["n_lunch_reviews"], x["n_dinner_reviews"]) == (1, 1, 0)
+    assert y["sent_pos_mean"] == pytest.approx(0.4) and y["morning_rate"] == pytest.approx(0.5)
+    assert list(got.columns[-3:]) == ["morning_rate", "lunch_rate", "dinner_rate"]
+
+    logged = []
+    again = enrich(str(tmp_path / "biz.csv"), str(parts), str(out), state="CA", work=str(work), jobs=1, log=logged.append)
+    assert "(2 from checkpoints)" in logged[-1]
+    pd.testing.assert_frame_equal(again, got)
+
+
+def test_enrich_redoes_an_input_that_changes_mid_run(tmp_path):
+    parts = tmp_path / "parts"
+    parts.mkdir()
+    row = {"review_id": "a", "business_id": "x", "date": "2020-01-01 07:00:00", "pos": 0.9, "neu": 0.05,
+           "neg": 0.05, "label": "POSITIVE"}
+    pd.DataFrame([row]).to_csv(parts / "part_000000.csv", index=False)
+    pd.DataFrame({"business_id": ["x"], "state": ["CA"]}).to_csv(tmp_path / "biz.csv", index=False)
+
+    def log(line):
+        # every file is reduced: now one changes before the partials are summed
+        if "1/1 files reduced" in line:
+            pd.DataFrame([dict(row, review_id="b", pos=0.1)]).to_csv(
+                parts / "part_000000.csv", mode="a", header=False, index=False)
+
+    got = enrich(str(tmp_path / "biz.csv"), str(parts), str(tmp_path / "out.csv"), work=str(tmp_path / "work"),
+                 jobs=1, log=log)
+    assert got.loc[0, "n_reviews"] == 2 and got.loc[0, "sent_pos_mean"] == pytest.approx(0.5)
@@ -0,0 +1,76 @@
+"""
+InteractionLog: group commit, replay after a restart, and which segments a
+checkpoint lets go.
+
+Run from src/:  python -m pytest -q test_interaction_log.py
+"""
+
+import json
+import os
+
+from interaction_log import InteractionLog
+
+
+def segments(directory):
+    return sorted(n for n in os.listdir(directory) if n.startswith("log."))
+
+
+def test_queued_records_are_written_as_one_batch(tmp_path):
+    log = InteractionLog(str(tmp_path))
+    seqs = [log.append({"user_id": "u", "event": i}) for i in range(50)]
+    assert seqs == list(range(1, 51)) and log.written_seq == 0
+    log.start()
+    assert log.flush(timeout=5)
+    log.close()
+    assert log.batches == 1 and log.records_written == 50  # one write and one fsync
+    with open(tmp_path / "log.1.jsonl") as f:
+        assert [json.loads(line)["seq"] for line in f] == seqs
+
+
+def test_a_restarted_log_replays_after_the_checkpoint(tmp_path):
+    log = InteractionLog(str(tmp_path)).start()
+    for i in range(5):
+        log.append({"event": i})
+    log.close()
+    with open(tmp_path / "log.1.jsonl", "a") as f:
+        f.write('{"seq": 6, "eve')  # torn by a crash mid-write
+
+    again = InteractionLog(str(tmp_path))
+    assert again.seq == 5 and again.checkpoint_seq() == 0
+    assert [r["event"] for r in again.replay(after_seq=2)] == [2, 3, 4]
+    assert again.append({"event": 5}) == 6
+
+
+def test_checkpoints_delete_only_the_segments_they_cover(tmp_path):
+    covered = [2]
+    calls = []
+
+    def checkpoint():
+        calls.append(covered[0])
+        return covered[0]
+
+    log = InteractionLog(str(tmp_path), checkpoint_fn=checkpoint, checkpoint_every=3)
+    for i in range(3):
+        log.append({"event": i})
+    log.start().close()
+    assert calls == [2]  # due after 3 records; nothing left to checkpoint on close
+    # seq 3 is not covered yet, so log.1 stays; new records go to log.4
+    assert log.checkpoint_seq() == 2 and segments(tmp_path) == ["log.1.jsonl", "log.4.jsonl"]
+
+    covered[0] = 5
+    log.append({"event": 3})
+    log.append({"event": 4})
+    log.start().close()  # checkpoints what is left
+    assert log.checkpoint_seq() == 5 and segments(tmp_path) == ["log.6.jsonl"]
+    assert list(InteractionLog(str(tmp_path)).replay(log.checkpoint_seq())) == []
+
+
+def test_a_failed_checkpoint_keeps_the_log(tmp_path):
+    def checkpoint():
+        raise OSError("disk full")
+
+    log = InteractionLog(str(tmp_path), checkpoint_fn=checkpoint, checkpoint_every=1).start()
+    log.append({"event": 0})
+    log.close()
+    assert log.checkpoint_errors >= 1 and "disk full" in log.last_error
+    assert log.checkpoint_seq() == 0 and [r["event"] for r in log.replay()] == [0]
@@ -0,0 +1,75 @@
+"""
+Metrics: the Prometheus text format that /metrics renders, and the timing
+helpers.
+
+Run from src/:  python -m pytest -q test_metrics.py
+"""
+
+import asyncio
+
+import pytest
+
+import metrics
+from metrics import Registry
+
+
+def test_counters_render_with_escaped_labels():
+    registry = Registry()
+    hits = registry.counter("t_hits_total", "Hits.", ["endpoint"])
+    hits.labels("search").inc()
+    hits.labels('a "b"\\c\nd').inc(2.5)
+    registry.counter("t_plain_total", "No labels.").inc()
+    assert registry.render() == (
+        "# HELP t_hits_total Hits.\n"
+        "# TYPE t_hits_total counter\n"
+        't_hits_total{endpoint="a \\"b\\"\\\\c\\nd"} 2.5\n'
+        't_hits_total{endpoint="search"} 1\n'
+        "# HELP t_plain_total No labels.\n"
+        "# TYPE t_plain_total counter\n"
+        "t_plain_total 1\n"
+    )
+    with pytest.raises(ValueError):
+        hits.labels()
+
+
+def test_histograms_render_cumulative_buckets_sum_and_count():
+    registry = Registry()
+    latency = registry.histogram("t_seconds", "Latency.", ["stage"], buckets=(0.5, 0.1))
+    for value in (0.05, 0.1, 0.3, 7.0):
+        latency.labels("scan").observe(value)
+    assert registry.render().splitlines()[2:] == [
+        't_seconds_bucket{stage="scan",le="0.1"} 2',  # a bucket counts values <= its bound
+        't_seconds_bucket{stage="scan",le="0.5"} 3',
+        't_seconds_bucket{stage="scan",le="+Inf"} 4',
+        't_seconds_sum{stage="scan"} 7.45',
+        't_seconds_count{stage="scan"} 4',
+    ]
+
+
+def test_collectors_and_duplicate_names():
+    registry = Registry()
+    first = registry.counter("t_total", "Once.")
+    assert registry.counter("t_total", "Again.") is first
+    registry.collector(lambda: [("t_cache_size", "gauge", "Entries.", [({"cache": "eta"}, 3), ({}, 0.25)])])
+    assert registry.render().splitlines()[-4:] == [
+        "# HELP t_cache_size Entries.",
+        "# TYPE t_cache_size gauge",
+        't_cache_size{cache="eta"} 3',
+        "t_cache_size 0.25",
+    ]
+
+
+def test_timed_observes_sync_and_async_calls():
+    latency = Registry().histogram("t_seconds", "Latency.", ["endpoint"])
+
+    @metrics.timed(latency.labels("sync"))
+    def handler():
+        return 1
+
+    @metrics.timed(latency.labels("async"))
+    async def ahandler():
+        return 2
+
+    assert handler() == 1 and asyncio.run(ahandler()) == 2
+    assert asyncio.iscoroutinefunction(ahandler)
+    assert sum(latency.labels("sync").counts) == sum(latency.labels("async").counts) == 1
@@ -0,0 +1,123 @@
+"""
+ProfileStore: LRU eviction, checkpoints, and what a checkpoint racing with
+updates and evictions must not lose.
+
+Run from src/:  python -m pytest -q test_profile_store.py
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from profile_store import ProfileStore
+
+
+def apply(profile, record):
+    profile["events"].append(record["n"])
+
+
+def default(user_id):
+    return {"user_id": user_id, "events": []}
+
+
+class _HookedDb:
+    """
+    A connection whose first executemany runs `hook` first (from another
+    thread, as a request would), then fails if `fail` is set.
+    """
+
+    def __init__(self, db, hook, fail):
+        self.db, self.hook, self.fail = db, hook, fail
+
+    def __enter__(self):
+        self.db.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self.db.__exit__(*exc)
+
+    def execute(self, *args):
+        return self.db.execute(*args)
+
+    def executemany(self, *args):
+        if self.hook is not None:
+            hook, self.hook = self.hook, None
+            worker = threading.Thread(target=hook)
+            worker.start()
+            worker.join()
+            if self.fail:
+                raise sqlite3.OperationalError("disk I/O error")
+        return self.db.executemany(*args)
+
+
+def hooked(store, hook, fail=False):
+    connect = store._db
+    wrapper = {}
+
+    def _db():
+        if threading.current_thread() is not threading.main_thread():
+            return connect()
+        wrapper.setdefault("db", _HookedDb(connect(), hook, fail))
+        return wrapper["db"]
+
+    store._db = _db
+
+
+def stored(store, user_id):
+    row = sqlite3.connect(store.db_path).execute("SELECT profile FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+    return None if row is None else row[0]
+
+
+def test_lru_evicts_only_clean_profiles(tmp_path):
+    store = ProfileStore(str(tmp_path / "p.db"), apply, default, capacity=2, shards=1)
+    store.update("a", [{"n": 1}])
+    for user_id in ("b", "c", "d"):
+        store.get(user_id)
+    assert store.stats()["cached"] == 2 and store.get("a")["events"] == [1]  # dirty: kept
+    store.checkpoint()
+    for user_id in ("b", "c", "d"):
+        store.get(user_id)
+    assert store.stats()["dirty"] == 0 and store.get("a")["events"] == [1]  # evicted, reloaded from SQLite
+    assert store.misses >= 5
+
+
+def test_checkpoint_racing_eviction_and_update_loses_nothing(tmp_path):
+    store = ProfileStore(str(tmp_path / "p.db"), apply, default, capacity=1, shards=1)
+    store.update("a", [{"n": 1}])
+
+    def meanwhile():
+        store.get("b")  # would evict "a" before its row is committed
+        store.update("a", [{"n": 2}])
+
+    hooked(store, meanwhile)
+    store.checkpoint()
+    store.checkpoint()
+    assert store.get("a")["events"] == [1, 2]
+    assert '"events": [1, 2]' in stored(store, "a")
+
+
+def test_failed_checkpoint_keeps_profiles_dirty(tmp_path):
+    store = ProfileStore(str(tmp_path / "p.db"), apply, default, capacity=1, shards=1)
+    store.update("a", [{"n": 1}])
+
+    def meanwhile():
+        store.get("b")
+        store.get("c")
+
+    hooked(store, meanwhile, fail=True)
+    with pytest.raises(sqlite3.Error):
+        store.checkpoint()
+    assert store.stats()["dirty"] == 1 and store.get("a")["events"] == [1]
+    store.checkpoint()
+    assert store.stats()["dirty"] == 0 and '"events": [1]' in stored(store, "a")
+
+
+def test_checkpoints_commit_with_a_full_fsync(tmp_path):
+    # the log deletes the segments a checkpoint covers, so its commit must be on disk
+    store = ProfileStore(str(tmp_path / "p.db"), apply, default)
+    levels = []
+    worker = threading.Thread(target=lambda: levels.append(store._db().execute("PRAGMA synchronous").fetchone()[0]))
+    worker.start()  # the log's writer thread gets a connection of its own
+    worker.join()
+    assert levels == [2]  # FULL
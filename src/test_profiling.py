@@ -0,0 +1,57 @@
+"""
+Profiling: who may ask for a profile, what a saved report keeps, and that
+sections on several threads never run two profilers at once.
+
+Run from src/:  python -m pytest -q test_profiling.py
+"""
+
+import contextvars
+import threading
+
+import profiling
+from profiling import Profiler, ProfileRing, RequestProfile, scrub_query, section
+
+
+def test_profiles_are_only_requested_with_the_admin_token(tmp_path):
+    asked = {b"x-profile": b"1"}
+    assert not Profiler(ring=ProfileRing(str(tmp_path))).requested(asked)
+    profiler = Profiler(admin_token="t", ring=ProfileRing(str(tmp_path)))
+    assert not profiler.requested(asked)
+    assert not profiler.requested({**asked, b"x-admin-token": b"nope"})
+    assert profiler.requested({**asked, b"x-admin-token": b"t"})
+    assert not profiler.requested({b"x-admin-token": b"t"})
+
+
+def test_scrub_query_drops_user_and_location():
+    query = "keywords=ramen&user_id=u1&lat=33.6&lon=-117.8&min_lat=1&origin=commute&page_token=abc&page_size=5"
+    assert scrub_query(query) == "keywords=ramen&origin=commute&page_size=5"
+
+
+def test_one_profiler_at_a_time_across_threads():
+    profile = RequestProfile("GET", "/recommend", "", True)
+    token = profiling._current.set(profile)
+    seen = []
+
+    def shard():
+        # as sharded_best_k runs it: on another thread, in the request's context
+        with section() as s:
+            seen.append(s.profiler)
+
+    try:
+        with section() as outer:
+            assert outer.profiler is not None
+            worker = threading.Thread(target=contextvars.copy_context().run, args=(shard,))
+            worker.start()
+            worker.join()
+        with section() as again:  # released on exit
+            assert again.profiler is not None
+    finally:
+        profiling._current.reset(token)
+    assert seen == [None] and profile.skipped_sections == 1
+    assert profile.report()["skipped_sections"] == 1 and profile.breakdown()
+
+
+def test_the_ring_directory_is_read_when_the_ring_is_made(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    assert ProfileRing().directory == str(tmp_path)
+    assert ProfileRing(str(tmp_path / "given")).directory == str(tmp_path / "given")
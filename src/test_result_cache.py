@@ -0,0 +1,67 @@
+"""
+ResultCache: LRU eviction, per-user invalidation, and the keys a catalog
+reload re-ranks. PageStore: page tokens, their TTL and the size bound.
+
+Run from src/:  python -m pytest -q test_result_cache.py
+"""
+
+from result_cache import PageStore, ResultCache, coarse, normalize_keywords
+
+
+def test_lru_eviction_forgets_the_user_index_too():
+    cache = ResultCache(maxsize=2)
+    cache.put("a", 1, user_id="u")
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # now b is the oldest
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    cache.put("d", 4)  # evicts a, u's only entry
+    assert cache.stats()["users"] == 0 and cache.evictions == 2
+
+
+def test_invalidate_user_drops_only_that_users_entries():
+    cache = ResultCache()
+    cache.put(("search", "pizza", ("u1", 1)), "u1's", user_id="u1")
+    cache.put(("search", "pizza", ("u2", 1)), "u2's", user_id="u2")
+    cache.put(("search", "pizza", None), "shared")
+    cache.invalidate_user("u1")
+    cache.invalidate_user("nobody")
+    assert cache.get(("search", "pizza", ("u1", 1))) is None
+    assert cache.get(("search", "pizza", ("u2", 1))) == "u2's" and cache.get(("search", "pizza", None)) == "shared"
+    assert cache.invalidations == 1 and cache.stats()["users"] == 1
+
+    # a re-put under the same key moves it to its new owner
+    cache.put(("search", "pizza", None), "now u2's", user_id="u2")
+    cache.invalidate_user("u2")
+    assert cache.stats()["size"] == 0
+
+
+def test_recent_keys_are_the_shared_entries_newest_first():
+    cache = ResultCache()
+    for key in ("a", "b", "c"):
+        cache.put(key, key)
+    cache.put("mine", 0, user_id="u")
+    cache.get("a")
+    assert cache.recent_keys(2) == ["a", "c"] and cache.recent_keys(10) == ["a", "c", "b"]
+
+
+def test_keys_ignore_keyword_case_order_and_nearby_coordinates():
+    assert normalize_keywords(["Pizza", " beer", "pizza", ""]) == ("beer", "pizza")
+    assert coarse(33.68049) == coarse(33.68012) == 33.68 and coarse(None) is None
+
+
+def test_page_tokens_are_opaque_and_expire():
+    now = [0.0]
+    pages = PageStore(ttl_s=300, clock=lambda: now[0])
+    first, second = pages.put({"offset": 10}), pages.put({"offset": 10})
+    assert first != second and len(first) >= 20  # random, not derived from the state
+    assert pages.get(first) == {"offset": 10} and pages.get("made-up") is None
+    now[0] = 300.0
+    assert pages.get(second) is None
+    assert pages.stats() == {"size": 1, "maxsize": pages.maxsize, "hits": 1, "misses": 2}  # expired ones are dropped
+
+
+def test_page_store_keeps_the_newest_tokens():
+    pages = PageStore(maxsize=2)
+    tokens = [pages.put(i) for i in range(3)]
+    assert pages.get(tokens[0]) is None and [pages.get(t) for t in tokens[1:]] == [1, 2]
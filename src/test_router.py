@@ -0,0 +1,96 @@
+"""
+The geographic shard router: splitting a catalog, routing a query to the
+shards that cover it, and merging their pages. The endpoints run against
+stub shards (an httpx mock transport).
+
+Run from src/:  python -m pytest -q test_router.py
+"""
+
+import httpx
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import router
+from conftest import CSV_PATH
+from router import ShardMap, split_catalog, take_best
+
+
+def test_geo_shards_route_and_merge():
+    df = pd.read_csv(CSV_PATH)
+    parts = split_catalog(df, precision=4)
+    assert sum(len(p) for p in parts.values()) == len(df) and len(parts) > 1
+    shards = [
+        {"name": name, "bbox": [p.latitude.min(), p.longitude.min(), p.latitude.max(), p.longitude.max()]}
+        for name, p in parts.items()
+    ]
+    shard_map = ShardMap(shards, {name: f"http://{name}" for name in parts})
+    lat, lon = parts[shards[0]["name"]][["latitude", "longitude"]].iloc[0]
+    assert 0 in shard_map.route(lat, lon, radius_km=0.1)
+    assert len(shard_map.route(0.0, 0.0)) == 1  # nothing near: the nearest shard
+    # content-dominated: a distant business can win, so every shard is asked
+    assert shard_map.route(0.0, 0.0, distance_weight=0.0) == shard_map.all()
+    assert shard_map.route(bbox=(0.0, 0.0, 1.0, 1.0)) == []
+
+    buffers = [[{"score": 0.9}, {"score": 0.5}], [{"score": 0.9, "b": 1}, {"score": None}], []]
+    page, rest = take_best(buffers, 3)
+    assert page == [{"score": 0.9}, {"score": 0.9, "b": 1}, {"score": 0.5}]
+    assert rest == [[], [{"score": None}], []]
+
+
+# two stub shards 100 km apart: "la" near (34.0, -118.2), "sd" near (32.7, -117.2)
+STUB_SHARDS = [{"name": "la", "bbox": [33.9, -118.3, 34.1, -118.1]}, {"name": "sd", "bbox": [32.6, -117.3, 32.8, -117.1]}]
+
+
+@pytest.fixture
+def stub_shards(monkeypatch):
+    """{"client": the router's TestClient, "down": names of the shards that refuse connections}."""
+    state = {"down": set()}
+
+    def handler(request):
+        shard = request.url.host
+        if shard in state["down"]:
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path.startswith("/admin"):
+            return httpx.Response(403, json={"status": "error", "reason": "bad admin token"})
+        if request.url.path == "/recommend":
+            return httpx.Response(200, json=[{"business_id": shard, "score": 0.5}])
+        return httpx.Response(200, json={"status": "success", "shard": shard})
+
+    monkeypatch.setattr(router, "shard_map", ShardMap(STUB_SHARDS, {"la": "http://la", "sd": "http://sd"}))
+    with TestClient(router.app) as client:
+        monkeypatch.setattr(router, "http", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        state["client"] = client
+        yield state
+
+
+def test_bare_location_fans_out_when_content_dominates(stub_shards):
+    client = stub_shards["client"]
+    near = client.get("/recommend", params={"lat": 34.0, "lon": -118.2, "distance_weight": 0.9}).json()
+    assert [r["business_id"] for r in near] == ["la"]
+    everywhere = client.get("/recommend", params={"lat": 34.0, "lon": -118.2, "distance_weight": 0.0}).json()
+    assert sorted(r["business_id"] for r in everywhere) == ["la", "sd"]
+
+
+def test_writes_report_every_shard_that_missed_them(stub_shards):
+    client = stub_shards["client"]
+    assert client.post("/interact", json={}).json()["shard"] == "la"
+
+    stub_shards["down"].add("sd")  # not the first shard: it used to go unnoticed
+    response = client.post("/interact", json={})
+    assert response.status_code == 502 and response.headers["x-shards-unavailable"] == "sd"
+    assert response.json()["unavailable"] == ["sd"]
+
+    # a client error is the shard's answer, not a failure
+    assert client.post("/admin/catalog/reload").status_code == 502  # sd is still down
+    stub_shards["down"].clear()
+    assert client.post("/admin/catalog/reload").status_code == 403
+
+
+def test_reads_fall_through_to_a_shard_that_answers(stub_shards):
+    client = stub_shards["client"]
+    stub_shards["down"].add("la")
+    response = client.get("/profile")
+    assert response.json()["shard"] == "sd" and response.headers["x-shards-unavailable"] == "la"
+    stub_shards["down"].add("sd")
+    assert client.get("/profile").status_code == 502
@@ -0,0 +1,57 @@
+"""
+GridIndex: box and radius queries must match a brute-force scan, and boxes
+past the poles or the antimeridian are cut to valid coordinates.
+
+Run from src/:  python -m pytest -q test_spatial_index.py
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from spatial_index import GridIndex, haversine_km, radius_bbox
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(32.5, 35.0, 2000)
+    lon = rng.uniform(-119.0, -116.5, 2000)
+    lat[::97] = np.nan  # businesses without coordinates are never returned
+    return lat, lon
+
+
+def test_within_bbox_matches_a_scan(points):
+    lat, lon = points
+    index = GridIndex(lat, lon)
+    for box in [(33.0, -118.0, 33.5, -117.2), (33.61, -117.9, 33.62, -117.89), (40.0, -118.0, 41.0, -117.0)]:
+        min_lat, min_lon, max_lat, max_lon = box
+        expected = np.flatnonzero((lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon))
+        np.testing.assert_array_equal(index.within_bbox(*box), expected)
+
+
+def test_within_radius_matches_a_scan(points):
+    lat, lon = points
+    index = GridIndex(lat, lon)
+    for radius in (0.5, 5.0, 40.0):
+        rows, dist = index.within_radius(33.68, -117.83, radius)
+        all_dist = haversine_km(33.68, -117.83, lat, lon)
+        np.testing.assert_array_equal(rows, np.flatnonzero(all_dist <= radius))
+        np.testing.assert_allclose(dist, all_dist[rows])
+
+
+def test_out_of_range_boxes_are_cut_to_valid_coordinates(points):
+    lat, lon = points
+    index = GridIndex(lat, lon)
+    everything = np.flatnonzero(~np.isnan(lat))
+    started = time.perf_counter()
+    np.testing.assert_array_equal(index.within_bbox(-1e9, -1e9, 1e9, 1e9), everything)
+    np.testing.assert_array_equal(index.within_radius(33.68, -117.83, 1e12)[0], everything)
+    assert time.perf_counter() - started < 0.5  # not a loop over millions of cells
+    assert len(index.within_bbox(float("nan"), -118.0, 34.0, -117.0)) == 0
+    assert len(index.within_bbox(34.0, -118.0, 33.0, -117.0)) == 0  # min above max
+
+    assert radius_bbox(89.9, 10.0, 100.0) == pytest.approx((89.0, -180.0, 90.0, 180.0), abs=0.01)
+    min_lat, min_lon, max_lat, max_lon = radius_bbox(0.0, 179.9, 50.0)
+    assert -90 <= min_lat < max_lat <= 90 and max_lon == 180.0
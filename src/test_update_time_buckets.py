@@ -0,0 +1,32 @@
+"""
+Review time bucketing: the vectorized buckets match to_time_bucket_3, and
+incremental runs only add reviews newer than the watermark.
+
+Run from src/:  python -m pytest -q test_update_time_buckets.py
+"""
+
+import numpy as np
+import pandas as pd
+
+from update_time_buckets import bucket_codes, read_manifest, read_part, to_time_bucket_3, update_time_buckets
+
+
+def test_time_buckets_vectorized_and_incremental(tmp_path):
+    hours = np.array([np.nan, 0, 4, 5, 10, 11, 15, 16, 23])
+    codes = bucket_codes(hours)
+    assert [None if c < 0 else ("Morning", "Lunch", "Dinner")[c] for c in codes] == [to_time_bucket_3(h) for h in hours]
+
+    csv, columnar = tmp_path / "reviews.csv", tmp_path / "buckets"
+    dates = ["2020-01-01 07:00:00", "bad", "2020-01-02 12:30:00", "2020-01-03 20:00:00", "2020-01-01 23:00:00"]
+    pd.DataFrame({"review_id": list("abcde"), "business_id": "x", "date": dates}).to_csv(csv, index=False)
+    update_time_buckets(str(csv), columnar_dir=str(columnar), chunk_rows=2)
+    assert pd.read_csv(csv)["time_bucket"].tolist()[:3] == ["Morning", np.nan, "Lunch"]
+    assert read_manifest(str(columnar))["watermark"] == "2020-01-03T20:00:00"
+
+    new = pd.DataFrame({"review_id": ["f", "g"], "business_id": "y", "date": ["2020-01-03 20:00:00", "2020-02-01 09:00:00"]})
+    new.to_csv(csv, mode="a", header=False, index=False)
+    summary = update_time_buckets(str(csv), columnar_dir=str(columnar), incremental=True, chunk_rows=2)
+    manifest = read_manifest(str(columnar))
+    assert summary["rows_new"] == 1 and manifest["rows"] == 6 and manifest["watermark"] == "2020-02-01T09:00:00"
+    part = read_part(str(columnar), manifest["parts"][-1]["name"])
+    assert part["review_id"].tolist() == [b"g"] and part["time_bucket"].tolist() == [0]
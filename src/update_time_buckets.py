@@ -1,28 +1,44 @@
+"""
+QuickBites: time-of-day bucket (Morning / Lunch / Dinner) of every review.
 
-import pandas as pd
+Streams oc_review.csv in chunks, buckets each chunk's review hours with
+array operations, and writes two outputs:
+
+- the CSV with its time_bucket column filled in (in place by default),
+  written to a temporary file and renamed over the old one at the end
+- a columnar copy for the enrichment step: parts of .npy columns
+  (business_id, review_id, date, time_bucket as a code into BUCKETS) under
+  a manifest that is replaced atomically, so readers only ever see
+  complete parts
+
+With --incremental only reviews newer than the manifest's watermark (the
+latest review date already processed) are read into a new part, and the
+CSV is left alone. A review dated at or before the watermark that shows up
+later is not picked up; run without --incremental to rebuild.
+
+    python update_time_buckets.py                     # data/oc_review.csv, in place
+    python update_time_buckets.py new_reviews.csv --incremental
+"""
+
+import argparse
+import json
 import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
 
-# Define paths
 base_dir = os.path.dirname(os.path.abspath(__file__))
-csv_path = os.path.join(base_dir, 'data', 'oc_review.csv')
-
-print(f"Reading from {csv_path}...")
-try:
-    df = pd.read_csv(csv_path)
-except FileNotFoundError:
-    print(f"Error: File not found at {csv_path}")
-    exit(1)
-
-# Check if 'date' column exists
-if 'date' not in df.columns:
-    print("Error: 'date' column not found in CSV.")
-    print("Available columns:", df.columns.tolist())
-    exit(1)
-
-print("Processing dates...")
-# Convert to datetime, coercing errors
-df["date_dt"] = pd.to_datetime(df["date"], errors="coerce")
-df["hour"] = df["date_dt"].dt.hour
+CSV_PATH = os.path.join(base_dir, "data", "oc_review.csv")
+COLUMNAR_DIR = os.path.join(base_dir, "data", "review_buckets")
+CHUNK_ROWS = 100_000  # ~150 MB peak with review text
+BUCKETS = ("Morning", "Lunch", "Dinner")  # time_bucket codes 0, 1, 2; -1 is no valid date
+ID_COLUMNS = ("business_id", "review_id")
+MANIFEST = "manifest.json"
+FORMAT = 1
+
 
 def to_time_bucket_3(h):
     if pd.isna(h):
@@ -35,16 +51,173 @@ def to_time_bucket_3(h):
     else:
         return "Dinner"
 
-print("Updating time_bucket column...")
-df["time_bucket"] = df["hour"].apply(to_time_bucket_3)
 
-# Drop the temporary helper columns if you don't want them persistent, 
-# but the user didn't explicitly ask to remove them. 
-# Usually it's cleaner to remove helper columns 'date_dt' and 'hour'. 
-# The user asked to "update the oc_review.csv on the time_bucket column".
-# I will keep 'time_bucket' and drop 'date_dt' and 'hour' to avoid clutter.
-df.drop(columns=['date_dt', 'hour'], inplace=True)
+def bucket_codes(hours):
+    """to_time_bucket_3 over an array of hours (NaN for none), as codes into BUCKETS."""
+    hours = np.asarray(hours, dtype=np.float64)
+    codes = np.where((hours >= 5) & (hours <= 10), 0, np.where((hours >= 11) & (hours <= 15), 1, 2))
+    return np.where(np.isnan(hours), -1, codes).astype(np.int8)
+
+
+def bucket_labels(codes):
+    """Codes back to the CSV's labels (None for -1)."""
+    return np.array(BUCKETS + (None,), dtype=object)[codes]
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_manifest(directory):
+    """The columnar output's manifest, or None if there is none yet."""
+    try:
+        with open(os.path.join(directory, MANIFEST), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_part(directory, name, columns):
+    path = os.path.join(directory, name)
+    os.makedirs(path, exist_ok=True)
+    for column, arr in columns.items():
+        np.save(os.path.join(path, f"{column}.npy"), arr)
+
+
+def read_part(directory, name, columns=None, mmap=True):
+    """{column: array} of one part; memory-mapped by default."""
+    path = os.path.join(directory, name)
+    names = columns or [f[:-4] for f in sorted(os.listdir(path)) if f.endswith(".npy")]
+    return {c: np.load(os.path.join(path, f"{c}.npy"), mmap_mode="r" if mmap else None) for c in names}
+
+
+def chunk_columns(chunk, dates):
+    """The columnar part for one chunk (dates already parsed)."""
+    columns = {
+        "date": dates.to_numpy(dtype="datetime64[s]"),
+        "time_bucket": bucket_codes(dates.dt.hour.to_numpy(dtype=np.float64, na_value=np.nan)),
+    }
+    for c in ID_COLUMNS:
+        if c in chunk.columns:
+            columns[c] = chunk[c].astype(str).to_numpy().astype("S")
+    return columns
+
+
+def update_time_buckets(csv_path=CSV_PATH, out_csv=None, columnar_dir=COLUMNAR_DIR, incremental=False,
+                        chunk_rows=CHUNK_ROWS):
+    """
+    Run the pipeline (see the module docstring). out_csv defaults to
+    csv_path; it is not written in incremental mode. Returns a summary dict.
+    """
+    manifest = read_manifest(columnar_dir) if columnar_dir else None
+    watermark = None
+    if incremental and manifest and manifest.get("watermark"):
+        watermark = np.datetime64(manifest["watermark"])
+    write_csv = not incremental
+    out_csv = out_csv or csv_path
+    run = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+
+    parts, rows_read, rows_new = [], 0, 0
+    latest = watermark
+    tmp_csv = f"{out_csv}.tmp"
+    out = open(tmp_csv, "w", newline="") if write_csv else None
+    # without the CSV to rewrite, the review text need not even be parsed
+    usecols = None if write_csv else (lambda c: c == "date" or c in ID_COLUMNS)
+    try:
+        for i, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunk_rows, usecols=usecols)):
+            if "date" not in chunk.columns:
+                raise ValueError(f"'date' column not found in {csv_path}; columns: {chunk.columns.tolist()}")
+            rows_read += len(chunk)
+            dates = pd.to_datetime(chunk["date"], errors="coerce")
+            columns = chunk_columns(chunk, dates)
+
+            if out is not None:
+                chunk["time_bucket"] = bucket_labels(columns["time_bucket"])
+                chunk.to_csv(out, header=(i == 0), index=False)
+
+            if columnar_dir:
+                if watermark is not None:
+                    newer = columns["date"] > watermark  # NaT compares False
+                    columns = {c: arr[newer] for c, arr in columns.items()}
+                if len(columns["date"]):
+                    name = f"part-{run}-{i:06d}"
+                    write_part(columnar_dir, name, columns)
+                    parts.append({"name": name, "rows": len(columns["date"])})
+                    rows_new += len(columns["date"])
+                    valid = columns["date"][~np.isnat(columns["date"])]
+                    if len(valid) and (latest is None or valid.max() > latest):
+                        latest = valid.max()
+        if out is not None:
+            out.flush()
+            os.fsync(out.fileno())
+            out.close()
+            out = None
+            os.replace(tmp_csv, out_csv)
+    finally:
+        if out is not None:
+            out.close()
+            os.remove(tmp_csv)
+
+    if columnar_dir:
+        kept = manifest["parts"] if incremental and manifest else []
+        manifest = {
+            "format": FORMAT,
+            "buckets": list(BUCKETS),
+            "watermark": None if latest is None else str(latest),
+            "rows": sum(p["rows"] for p in kept + parts),
+            "parts": kept + parts,
+        }
+        os.makedirs(columnar_dir, exist_ok=True)
+        _write_atomic(os.path.join(columnar_dir, MANIFEST), json.dumps(manifest, indent=1))
+        # parts no manifest lists: the previous full build, or a run that died
+        listed = {p["name"] for p in manifest["parts"]}
+        for name in os.listdir(columnar_dir):
+            if name.startswith("part-") and name not in listed:
+                shutil.rmtree(os.path.join(columnar_dir, name), ignore_errors=True)
+
+    return {
+        "rows_read": rows_read,
+        "rows_new": rows_new,
+        "parts": len(parts),
+        "watermark": manifest["watermark"] if columnar_dir else None,
+        "csv": out_csv if write_csv else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill in the time_bucket of every review.")
+    parser.add_argument("csv", nargs="?", default=CSV_PATH, help="reviews CSV with a date column")
+    parser.add_argument("--out-csv", default=None, help="where the bucketed CSV goes (default: in place)")
+    parser.add_argument("--columnar", default=COLUMNAR_DIR, help="columnar output directory ('' for none)")
+    parser.add_argument("--incremental", action="store_true", help="only reviews newer than the watermark")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    if args.incremental and not args.columnar:
+        print("Error: --incremental needs the columnar output (its manifest holds the watermark)")
+        sys.exit(1)
+    if not os.path.exists(args.csv):
+        print(f"Error: File not found at {args.csv}")
+        sys.exit(1)
+    print(f"Reading from {args.csv}...")
+    start = time.perf_counter()
+    try:
+        summary = update_time_buckets(args.csv, args.out_csv, args.columnar or None, args.incremental, args.chunk_rows)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    print(f"{summary['rows_read']} reviews read, {summary['rows_new']} bucketed into {summary['parts']} new parts "
+          f"in {elapsed:.1f}s; watermark {summary['watermark']}")
+    if summary["csv"]:
+        print(f"Saved updated data to {summary['csv']}")
+    print("Done!")
+
 
-print(f"Saving updated data to {csv_path}...")
-df.to_csv(csv_path, index=False)
-print("Done!")
+if __name__ == "__main__":
+    main()